@@ -39,6 +39,25 @@ from flask_apscheduler import APScheduler
 from openai import OpenAI
 from wtforms.validators import Optional
 from smartwatch import smartwatch_bp, garmin_clients, auto_sync_all_garmin_users
+import db
+from db import transactional
+import food_search
+from food_catalog import food_catalog, init_food_catalog
+from user_cache import user_cache, init_user_cache
+import food_log
+import tdee_service
+import workout_week
+import exercise_bests
+import exercise_stats
+import workout_rollup
+import workout_totals
+import leaderboard
+import landing_page
+import profile_stats
+import jobs
+import levels
+import muscle_groups
+import workout_saved
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -151,9 +170,11 @@ scheduler.add_job(
     replace_existing=True
 )
 
-# Start the scheduler
-scheduler.start()
-print("SCHEDULER: Automatic Garmin sync started - running every 15 minutes")
+# Start the scheduler, SCHEDULER_ENABLED=0 for processes that import app
+# without serving it (scripts, extra workers) so the sync runs only once
+if os.getenv("SCHEDULER_ENABLED", "1") != "0":
+    scheduler.start()
+    print("SCHEDULER: Automatic Garmin sync started - running every 15 minutes")
 garmin_clients = {}
 _nutrition_scanner = OpenAINutritionScanner()
 def get_scanner():
@@ -184,29 +205,18 @@ def safe_float(value, default=0.0, min_val=0.001, max_val=10000.0):
         return default
 
 # Database connection using Neon.tech URL
-def get_db_connection():
-    """
-    Returns a psycopg2 connection to the database.
-    Chooses local or Neon DB based on DB_ENV environment variable.
-    """
-    db_env = os.getenv("DB_ENV", "local").lower()  # default to local
-    if db_env == "neon":
-        DATABASE_URL = os.getenv("NEON_DB_URL")
-    else:
-        DATABASE_URL = os.getenv("LOCAL_DB_URL")
+# Connections come from a per-process pool (see db.py); inside a request every
+# get_db_connection() call returns the same checked-out connection.
+db.init_app(app)
+get_db_connection = db.get_db_connection
 
-    if not DATABASE_URL:
-        raise ValueError(f"No database URL defined for DB_ENV={db_env}")
 
-    print(f"Connecting to database ({db_env}): {DATABASE_URL.split('@')[-1]}")
+@app.before_request
+def start_job_workers():
+    # Once per process; threads started before a fork would not survive it
+    jobs.start_workers()
+
 
-    try:
-        conn = psycopg2.connect(DATABASE_URL)
-        conn.autocommit = True
-        return conn
-    except Exception as e:
-        print(f"Database connection failed: {e}")
-        raise
 def add_garmin_sync_preferences():
     """Add user preferences for Garmin sync intervals"""
     conn = get_db_connection()
@@ -359,6 +369,11 @@ def init_db():
         )
     ''')
 
+    # 2.5. Indexes for /search_foods (pg_trgm, Finnish full-text)
+    food_search.init_food_search(cursor)
+    # Change log that keeps the per-worker food catalogs fresh
+    init_food_catalog(cursor)
+
     # 3. Food usage
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS food_usage (
@@ -369,7 +384,7 @@ def init_db():
         )
     ''')
 
-    # 4. User sessions
+    # 4. User sessions (legacy JSON blob per day, migrated into food_log_items)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS user_sessions (
             user_id INTEGER NOT NULL,
@@ -379,6 +394,36 @@ def init_db():
             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
         )
     ''')
+    # Blobs are kept after migrating, these mark how each one was handled
+    cursor.execute('ALTER TABLE user_sessions ADD COLUMN IF NOT EXISTS migrated_at TIMESTAMP')
+    cursor.execute('ALTER TABLE user_sessions ADD COLUMN IF NOT EXISTS migration_error TEXT')
+
+    # 4.5. Food diary, one row per eaten item
+    food_log.init_food_log(cursor)
+
+    # 4.6. Per-exercise bests used by save_workout PR detection
+    exercise_bests.init_exercise_bests(cursor)
+
+    # 4.7. Background job queue (workout post-processing)
+    jobs.init_jobs(cursor)
+
+    # 4.8. Per-user monthly exercise stats for the exercise list
+    exercise_stats.init_exercise_stats(cursor)
+
+    # 4.9. Daily workout rollup (and weekly / monthly views) for history
+    workout_rollup.init_workout_rollup(cursor)
+
+    # 4.10. Canonical muscle groups and workout range-scan indexes
+    muscle_groups.init_muscle_groups(cursor)
+
+    # 4.11. Powerlifting leaderboard (profile rank)
+    leaderboard.init_leaderboard(cursor)
+
+    # 4.12. Landing page date index
+    landing_page.init_landing_page(cursor)
+
+    # 4.13. User change log for the per-worker load_user cache
+    init_user_cache(cursor)
 
     # 5. Food templates
     cursor.execute('''
@@ -536,6 +581,7 @@ def init_db():
     conn.commit()
     cursor.close()
     conn.close()
+    food_log.migrate_user_sessions()
 
      
 def init_workout_db():
@@ -743,6 +789,7 @@ def admin_news_create():
         """, (title, content, icon_class, icon_color, current_user.id))
         
         conn.commit()
+        landing_page.invalidate()
         cur.close()
         conn.close()
         
@@ -772,6 +819,7 @@ def admin_news_edit(post_id):
         """, (title, content, icon_class, icon_color, post_id))
         
         conn.commit()
+        landing_page.invalidate()
         cur.close()
         conn.close()
         
@@ -809,6 +857,7 @@ def admin_news_delete(post_id):
     try:
         cur.execute('DELETE FROM news_post WHERE id = %s', (post_id,))
         conn.commit()
+        landing_page.invalidate()
         cur.close()
         conn.close()
         
@@ -838,6 +887,7 @@ def admin_news_toggle(post_id):
         
         result = cur.fetchone()
         conn.commit()
+        landing_page.invalidate()
         cur.close()
         conn.close()
         
@@ -1014,11 +1064,8 @@ class User(UserMixin):
 # User loader
 @login_manager.user_loader
 def load_user(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=DictCursor)
-    cursor.execute('SELECT * FROM users WHERE id = %s', (user_id,))
-    user = cursor.fetchone()
-    conn.close()
+    # Cached per worker, see user_cache.py
+    user = user_cache.get(int(user_id))
 
     if user:
         return User(
@@ -1026,8 +1073,8 @@ def load_user(user_id):
             username=user['username'],
             email=user['email'],
             role=user['role'],
-            tdee=user.get('tdee'),        # Add TDEE
-            weight=user.get('weight')     # Add weight
+            tdee=user['tdee'],
+            weight=user['weight']
         )
     return None
 
@@ -1069,6 +1116,12 @@ def get_food_by_key(key):
     normalized_key = normalize_key(key)
     print(f"🔍 Looking up food key: '{key}' → normalized: '{normalized_key}'")
     
+    # Hot path: in-memory catalog, the queries below only run for foods this
+    # worker hasn't seen yet (e.g. created moments ago in another worker)
+    food = food_catalog.lookup(normalized_key)
+    if food:
+        return food
+    
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=DictCursor)
     try:
@@ -1077,6 +1130,7 @@ def get_food_by_key(key):
         
         if food:
             print(f"✔️ Found food by exact match: {food['name']}, fiber={food['fiber']}")
+            food_catalog.put(dict(food))
             return dict(food)
         
         # Fallback to case-insensitive search if exact match fails
@@ -1086,6 +1140,7 @@ def get_food_by_key(key):
         
         if food:
             print(f"⚠️ Found by case-insensitive fallback: {food['name']}")
+            food_catalog.put(dict(food))
             return dict(food)
         
         # Try searching by name as a last resort
@@ -1095,6 +1150,7 @@ def get_food_by_key(key):
         
         if food:
             print(f"⚠️ Found by name match: {food['name']}")
+            food_catalog.put(dict(food))
             return dict(food)
         
         print(f"❌ Food not found for key: '{normalized_key}'")
@@ -1145,6 +1201,7 @@ def save_food(food_data):
             food_data.get('ean')
         ))
         conn.commit()
+        food_catalog.invalidate()
     finally:
         conn.close()
 
@@ -1170,17 +1227,6 @@ def increment_food_usage(user_id, food_key):
     finally:
         conn.close()
 
-def get_session_history(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=DictCursor)
-    cursor.execute(
-        'SELECT date, data FROM user_sessions WHERE user_id = %s',
-        (user_id,)
-    )
-    sessions = cursor.fetchall()
-    conn.close()
-    return {row['date']: json.loads(row['data']) for row in sessions}
-
 def save_session_history(user_id, session_history):
     # This function is kept for compatibility but not used in PostgreSQL version
     pass
@@ -1189,37 +1235,13 @@ def get_current_session(user_id, date=None):
     if date is None:
         date = datetime.now().strftime("%Y-%m-%d")
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute('''
-            SELECT data FROM user_sessions 
-            WHERE user_id = %s AND date = %s
-        ''', (user_id, date))
-        
-        result = cursor.fetchone()
-        
-        if result:
-            return json.loads(result[0]), date
-        else:
-            return [], date
-    finally:
-        conn.close()
+    # One row per item in food_log_items (see food_log.py)
+    return food_log.load_day_items(user_id, date), date
 
 def save_current_session(user_id, eaten_items, date):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    data_str = json.dumps(eaten_items)
-    try:
-        cursor.execute('''
-            INSERT INTO user_sessions (user_id, date, data)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (user_id, date) DO UPDATE SET data = EXCLUDED.data
-        ''', (user_id, date, data_str))
-        conn.commit()
-    finally:
-        conn.close()
+    # Full rewrite of the day; routes that change single items use the
+    # food_log delta writes (add_items / update_item / delete_items / move_items)
+    food_log.replace_day(user_id, date, eaten_items)
 
 def calculate_group_breakdown(eaten_items):
     groups = {}
@@ -1267,31 +1289,6 @@ def calculate_totals(eaten_items):
         "salt": total_salt
     }
 
-def get_daily_totals(day_data):
-    # Handle case where day_data might be None or empty
-    if not day_data:
-        return 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
-        
-    total_calories = sum(item['calories'] for item in day_data)
-    total_proteins = sum(item['proteins'] for item in day_data)
-    total_fats = sum(item['fats'] for item in day_data)
-    total_carbs = sum(item['carbs'] for item in day_data)
-    total_sugars = sum(item['sugars'] for item in day_data)
-    total_salt = sum(item.get('salt', 0.0) for item in day_data)
-    total_saturated = sum(item.get('saturated', 0.0) for item in day_data)
-    total_fiber = sum(item.get('fiber', 0.0) for item in day_data)
-    
-    return (
-        total_calories,
-        total_proteins,
-        total_fats,
-        total_carbs,
-        total_sugars,
-        total_salt,
-        total_saturated,
-        total_fiber
-    )
-
 def format_date(date_str):
     date_obj = datetime.strptime(date_str, "%Y-%m-%d")
     return date_obj.strftime("%A (%d.%m.%Y)")
@@ -1498,6 +1495,7 @@ def update_daily_tdee_with_steps(user_id, target_date, steps):
             print(f"Created TDEE adjustment: Base={base_tdee}, Steps={steps_calories}, Total={adjusted_tdee}")
         
         conn.commit()
+        tdee_service.invalidate(user_id)
         
         return {
             'success': True,
@@ -1579,79 +1577,6 @@ def generate_date_range(center_date_str, range_days=3):
         dates.append((date_str, formatted_date))
     
     return dates
-def get_user_tdee_for_date(user_id, target_date):
-    """
-    Get user's TDEE for a specific date with support for 3 modes.
-    Always returns a float number, never a tuple.
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        # Get user settings
-        cursor.execute("""
-            SELECT tdee, calories_total_enabled, weight, 
-                   auto_add_workout_calories, auto_garmin_steps
-            FROM users
-            WHERE id = %s
-        """, (user_id,))
-
-        user_data = cursor.fetchone()
-
-        if not user_data:
-            return None
-
-        base_tdee, calories_total_enabled, weight, auto_workout, auto_steps = user_data
-
-        # PRIORITY 1: If Garmin total calories is enabled
-        if calories_total_enabled:
-            cursor.execute("""
-                SELECT calories_total
-                FROM garmin_daily_data
-                WHERE user_id = %s AND date = %s
-            """, (user_id, target_date))
-
-            garmin_data = cursor.fetchone()
-
-            if garmin_data and garmin_data[0]:
-                tdee = float(garmin_data[0])  # ✅ Convert to float
-                print(f"Using Garmin calories_total for user {user_id}: {tdee} kcal")
-                return tdee
-            else:
-                print(f"No Garmin data found, using base TDEE: {base_tdee} kcal")
-                return float(base_tdee) if base_tdee else 0
-        
-        # PRIORITY 2: If advanced mode features enabled
-        if auto_workout or auto_steps:
-            cursor.execute("""
-                SELECT adjusted_tdee
-                FROM daily_tdee_adjustments
-                WHERE user_id = %s AND date = %s
-            """, (user_id, target_date))
-
-            adjustment_data = cursor.fetchone()
-
-            if adjustment_data and adjustment_data:
-                tdee = float(adjustment_data[0])
-                print(f"Using adjusted TDEE for user {user_id}: {tdee} kcal (from daily_tdee_adjustments)")
-                return tdee
-            else:
-                print(f"No adjustment data found, using base TDEE: {base_tdee} kcal")
-                return float(base_tdee) if base_tdee else 0
-        
-        # PRIORITY 3: Static TDEE mode
-        print(f"Using static TDEE for user {user_id}: {base_tdee} kcal")
-        return float(base_tdee) if base_tdee else 0
-
-    except Exception as e:
-        print(f"Error in get_user_tdee_for_date: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
-        
-    finally:
-        cursor.close()
-        conn.close()
 @app.route('/load_more_dates', methods=['POST'])
 @login_required
 def load_more_dates():
@@ -1883,7 +1808,6 @@ def allowed_file(filename):
 
 import json
 
-LEVEL_CAP = 999
 def get_available_borders_for_level(user_level):
     """Get all borders available at a given level"""
     available = []
@@ -1891,14 +1815,6 @@ def get_available_borders_for_level(user_level):
         if user_level >= required_level:
             available.append(border)
     return available
-def xp_to_next_level(level: int, base_xp: int = 120, exp: float = 1.72) -> int:
-    """
-    XP required to advance from `level` to `level + 1`.
-    """
-    if level >= LEVEL_CAP:
-        return 10**12  # effectively unreachable
-    return max(50, int(round(base_xp * (level ** exp))))
-
 def unlock_avatar_for_user(user_id, avatar_name, reason='manual', borders=None):
     """Manually unlock an avatar for a user with optional borders"""
     conn = get_db_connection()
@@ -2208,11 +2124,11 @@ def profile():
         if user_data:
             current_weight = user_data.get('weight')
             current_avatar = user_data.get('avatar') or 'default.png'
-            user_level = user_data.get('level', 1) or 1
-            user_xp = user_data.get('xp_points', 0) or 0
+            user_level, user_xp, xp_to_next = levels.progress(
+                user_data.get('level', 1) or 1, user_data.get('xp_points', 0) or 0
+            )
             workout_streak = user_data.get('workout_streak', 0) or 0
             longest_streak = user_data.get('longest_streak', 0) or 0
-            xp_to_next = xp_to_next_level(user_level) if callable(globals().get('xp_to_next_level')) else 100
             
             user_socials = user_data.get('socials') or "[]"
             if isinstance(user_socials, (list, dict)):
@@ -2323,6 +2239,8 @@ def profile():
 
             cursor.execute(update_query, tuple(update_params))
             conn.commit()
+            profile_stats.invalidate(current_user.id)
+            user_cache.invalidate(current_user.id)
             
             # Refresh user data
             cursor.execute(f"SELECT {', '.join(select_cols)} FROM users WHERE id = %s", (current_user.id,))
@@ -2443,9 +2361,9 @@ def view_profile(user_id):
         current_avatar = user_data.get('avatar') or 'default.png'
         
         # Level/xp logic
-        user_level = user_data.get('level', 1) or 1
-        user_xp = user_data.get('xp_points', 0) or 0
-        xp_to_next = xp_to_next_level(user_level) if callable(globals().get('xp_to_next_level')) else 100
+        user_level, user_xp, xp_to_next = levels.progress(
+            user_data.get('level', 1) or 1, user_data.get('xp_points', 0) or 0
+        )
         workout_streak = user_data.get('workout_streak', 0) or 0
         longest_streak = user_data.get('longest_streak', 0) or 0
         
@@ -2633,57 +2551,8 @@ def search_foods():
     user_id = current_user.id
     is_admin = current_user.role == 'admin'
 
-    # Visibility clause & parameters
-    if is_admin:
-        visibility_clause = "TRUE"
-        params = [user_id]  # for user usage join
-    else:
-        visibility_clause = "(f.owner_id IS NULL OR f.owner_id = %s)"
-        params = [user_id, user_id]  # one for user usage JOIN, one for visibility
-
-    if not query:
-        sql = f"""
-            SELECT f.*, 
-                   COALESCE(u.count, 0) AS usage,
-                   COALESCE(g.count, 0) AS global_usage
-            FROM foods f
-            LEFT JOIN food_usage u ON f.key = u.food_key AND u.user_id = %s
-            LEFT JOIN food_usage_global g ON f.key = g.food_key
-            WHERE {visibility_clause}
-            ORDER BY usage DESC, global_usage DESC, name ASC
-            LIMIT %s OFFSET %s
-        """
-        cursor.execute(sql, params + [limit, offset])
-    else:
-        # Split query into separate keywords
-        words = query.split()
-
-        # Build AND conditions like:
-        # LOWER(f.name) LIKE %word1% AND LOWER(f.name) LIKE %word2% ...
-        word_conditions = " AND ".join([f"LOWER(f.name) LIKE %s" for _ in words])
-        word_params = [f"%{w}%" for w in words]
-
-        sql = f"""
-            SELECT f.*, 
-                   COALESCE(u.count, 0) AS usage,
-                   COALESCE(g.count, 0) AS global_usage
-            FROM foods f
-            LEFT JOIN food_usage u ON f.key = u.food_key AND u.user_id = %s
-            LEFT JOIN food_usage_global g ON f.key = g.food_key
-            WHERE {visibility_clause}
-              AND (
-                    {word_conditions}
-                    OR f.ean = %s
-                  )
-            ORDER BY 
-                usage DESC,
-                global_usage DESC,
-                name ASC
-            LIMIT %s OFFSET %s
-        """
-        cursor.execute(sql, params + word_params + [query, limit, offset])
-
-    foods = cursor.fetchall()
+    # EAN fast path + trigram / full-text ranked search (see food_search.py)
+    foods = food_search.search_foods(cursor, user_id, is_admin, query, limit, offset)
     conn.close()
 
     result = []
@@ -2720,20 +2589,25 @@ def get_food_details():
         print(f"Raw food_id: '{food_id}'")
         print(f"Normalized key: '{normalized_key}'")
 
-        # Fetch food from DB with visibility check
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=DictCursor)
-
-        if current_user.role == 'admin':
-            cursor.execute('SELECT * FROM foods WHERE key = %s', (normalized_key,))
+        # Fetch food with visibility check, catalog first then DB
+        food = food_catalog.get(normalized_key)
+        if food:
+            if current_user.role != 'admin' and food['owner_id'] not in (None, current_user.id):
+                food = None
         else:
-            cursor.execute('''
-                SELECT * FROM foods
-                WHERE key = %s AND (owner_id IS NULL OR owner_id = %s)
-            ''', (normalized_key, current_user.id))
+            conn = get_db_connection()
+            cursor = conn.cursor(cursor_factory=DictCursor)
 
-        food = cursor.fetchone()
-        conn.close()
+            if current_user.role == 'admin':
+                cursor.execute('SELECT * FROM foods WHERE key = %s', (normalized_key,))
+            else:
+                cursor.execute('''
+                    SELECT * FROM foods
+                    WHERE key = %s AND (owner_id IS NULL OR owner_id = %s)
+                ''', (normalized_key, current_user.id))
+
+            food = cursor.fetchone()
+            conn.close()
 
         if not food:
             print(f"❌ Food not found or not visible: '{normalized_key}'")
@@ -2797,6 +2671,7 @@ def get_food_details():
 
 @app.route('/log_food', methods=['POST'])
 @login_required
+@transactional
 def log_food():
     try:
         user_id = current_user.id
@@ -2869,10 +2744,9 @@ def log_food():
             "group": meal_group
         }
 
-        # Update session
+        # Update session (single-row insert)
+        food_log.add_items(user_id, date, [item])
         eaten_items, current_date = get_current_session(user_id, date)
-        eaten_items.append(item)
-        save_current_session(user_id, eaten_items, date)
 
         # Update food usage
         increment_food_usage(user_id, food['key'])
@@ -2962,6 +2836,7 @@ def delete_food():
         # Then delete food
         cursor.execute('DELETE FROM foods WHERE key = %s', (food_id,))
         conn.commit()
+        food_catalog.invalidate()
         return jsonify(success=True)
     except Exception as e:
         return jsonify(success=False, error=str(e)), 500
@@ -2970,15 +2845,14 @@ def delete_food():
 
 @app.route('/delete_item', methods=['POST'])
 @login_required
+@transactional
 def delete_item():
     user_id = current_user.id
     item_id = request.form.get('item_id')
     date = request.form.get('date', datetime.now().strftime("%Y-%m-%d"))
     
+    food_log.delete_items(user_id, date, [item_id])
     eaten_items, current_date = get_current_session(user_id, date)
-    eaten_items = [item for item in eaten_items if item.get('id') != item_id]
-        
-    save_current_session(user_id, eaten_items, date)
     
     totals = calculate_totals(eaten_items)
     group_breakdown = calculate_group_breakdown(eaten_items)
@@ -2995,7 +2869,7 @@ def delete_item():
 def clear_session():
     user_id = current_user.id
     date = request.form.get('date', datetime.now().strftime("%Y-%m-%d"))
-    save_current_session(user_id, [], date)
+    food_log.clear_day(user_id, date)
     group_breakdown = calculate_group_breakdown([])
     current_date_formatted = format_date(date)
     return jsonify({
@@ -3017,6 +2891,7 @@ def move_items():
 def copy_items():
     return move_or_copy_items_optimized(remove_original=False)
 
+@transactional
 def move_or_copy_items_optimized(remove_original=True):
     try:
         user_id = current_user.id
@@ -3028,37 +2903,22 @@ def move_or_copy_items_optimized(remove_original=True):
         if not item_ids or not new_group:
             return jsonify({'error': 'Missing required parameters'}), 400
 
-        # --- Load source session ---
-        eaten_items, _ = get_current_session(user_id, date)
-
-        # --- Prepare items to transfer ---
-        items_to_transfer = []
-        for item in eaten_items:
-            if item['id'] in item_ids:
-                new_item = item.copy()
-                new_item['group'] = new_group
-                if not remove_original:  # copy → new ID
-                    new_item['id'] = str(uuid.uuid4())
-                items_to_transfer.append(new_item)
-
-        # --- Case 1: same date move/copy ---
-        if target_date == date:
-            if remove_original:
-                eaten_items = [i for i in eaten_items if i['id'] not in item_ids]
-            eaten_items.extend(items_to_transfer)
-            save_current_session(user_id, eaten_items, date)
-
-            target_items = eaten_items  # alias since same date
-
-        # --- Case 2: cross-date move/copy ---
+        if remove_original:
+            # --- Move: rewrite group/date of the rows in place ---
+            food_log.move_items(user_id, date, item_ids, target_date, new_group)
         else:
-            if remove_original:
-                eaten_items = [i for i in eaten_items if i['id'] not in item_ids]
-                save_current_session(user_id, eaten_items, date)
+            # --- Copy: insert new rows with new IDs ---
+            eaten_items, _ = get_current_session(user_id, date)
+            items_to_transfer = []
+            for item in eaten_items:
+                if item['id'] in item_ids:
+                    new_item = item.copy()
+                    new_item['group'] = new_group
+                    new_item['id'] = str(uuid.uuid4())
+                    items_to_transfer.append(new_item)
+            food_log.add_items(user_id, target_date, items_to_transfer)
 
-            target_items, _ = get_current_session(user_id, target_date)
-            target_items.extend(items_to_transfer)
-            save_current_session(user_id, target_items, target_date)
+        target_items, _ = get_current_session(user_id, target_date)
 
         # --- Recalculate totals/breakdown for target session ---
         recalculated_totals = calculate_totals(target_items)
@@ -3160,6 +3020,7 @@ def calculate_group_breakdown(eaten_items):
 
 @app.route('/update_grams', methods=['POST'])
 @login_required
+@transactional
 def update_grams():
     try:
         print("Received update_grams request")
@@ -3174,18 +3035,11 @@ def update_grams():
             print("⚠️ Empty item_id received!")
             return jsonify({'error': 'Empty item ID'}), 400
         
-        eaten_items, current_date = get_current_session(user_id, date)
-        print(f"Current session has {len(eaten_items)} items")
-        
         # Find item by ID
-        item_found = None
-        for item in eaten_items:
-            if item.get('id') == item_id:
-                item_found = item
-                break
+        item_found = food_log.load_item(user_id, date, item_id)
 
         if not item_found:
-            print(f"❌ Item not found with id: '{item_id}'. Available IDs: {[item.get('id') for item in eaten_items]}")
+            print(f"❌ Item not found with id: '{item_id}' on {date}")
             return jsonify({'error': 'Item not found'}), 404
 
         print(f"Food name from session: {item_found['name']}")
@@ -3216,8 +3070,9 @@ def update_grams():
         item_found['salt']       = food.get('salt', 0.0) * factor
         item_found['saturated']  = food.get('saturated', 0.0) * factor
         
-        # Save session
-        save_current_session(user_id, eaten_items, date)
+        # Save the single item, then reload the day for the response
+        food_log.update_item(user_id, date, item_found)
+        eaten_items, current_date = get_current_session(user_id, date)
         
         # Recalculate totals
         totals = calculate_totals(eaten_items)
@@ -3354,6 +3209,7 @@ def save_food_route():
         ''', (current_user.id, key))
 
         conn.commit()
+        food_catalog.invalidate()
         return jsonify({'success': True})
 
     except Exception as e:
@@ -3374,66 +3230,11 @@ def calculate_calories(carbs, proteins, fats):
     """
     return carbs * 4 + proteins * 4 + fats * 9
 
-def calculate_weekly_averages(session_history):
-    weekly_data = {}
-
-    for date_str, items in session_history.items():
-        try:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-            year, week_num, _ = date_obj.isocalendar()
-            week_key = f"{year}-W{week_num:02d}"
-
-            if week_key not in weekly_data:
-                weekly_data[week_key] = {
-                    "days": [],
-                    "calories": 0,
-                    "proteins": 0,
-                    "fats": 0,
-                    "carbs": 0,
-                    "sugars": 0,
-
-                    "salt": 0,
-                    "saturated": 0,
-                    "fiber": 0,
-                    "count": 0
-                }
-
-            calories, proteins, fats, carbs, sugars, salt, saturated, fiber = get_daily_totals(items)
-            weekly_data[week_key]["days"].append(date_str)
-            weekly_data[week_key]["calories"] += calories
-            weekly_data[week_key]["proteins"] += proteins
-            weekly_data[week_key]["fats"] += fats
-            weekly_data[week_key]["carbs"] += carbs
-            weekly_data[week_key]["sugars"] += sugars
-            weekly_data[week_key]["salt"] += salt
-            weekly_data[week_key]["saturated"] += saturated
-            weekly_data[week_key]["fiber"] += fiber
-            weekly_data[week_key]["count"] += 1
-
-        except Exception as e:
-            app.logger.error(f"Error processing date {date_str}: {e}")
-            continue
-
-    result = []
-    for week_key, data in weekly_data.items():
-        count = data["count"]
-        if count > 0:
-            result.append({
-                "week": week_key,
-                "start_date": min(data["days"]),
-                "end_date": max(data["days"]),
-                "avg_calories": data["calories"] / count,
-                "avg_proteins": data["proteins"] / count,
-                "avg_fats": data["fats"] / count,
-                "avg_carbs": data["carbs"] / count,
-                "avg_sugars": data["sugars"] / count,
-                "avg_salt": data["salt"] / count,
-                "avg_saturated": data["saturated"] / count,
-                "avg_fiber": data["fiber"] / count
-            })
+HISTORY_WEEKS_PER_PAGE = 8
 
-    result.sort(key=lambda x: x["end_date"], reverse=True)
-    return result
+def history_weeks_start(last_day, weeks):
+    """Monday of the oldest of `weeks` ISO weeks ending with the week of last_day"""
+    return last_day - timedelta(days=last_day.weekday()) - timedelta(weeks=weeks - 1)
 
 def calculate_weekly_projection(weekly_avg_tdee, weekly_avg_calories):
     """
@@ -3455,86 +3256,18 @@ def calculate_weekly_projection(weekly_avg_tdee, weekly_avg_calories):
 def history():
     user_id = current_user.id
     
-    # ✅ Fetch user settings including calories_total_enabled
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=DictCursor)
-    cursor.execute("""
-        SELECT tdee, auto_garmin_steps, auto_add_workout_calories, calories_total_enabled
-        FROM users 
-        WHERE id = %s
-    """, (user_id,))
-    user_row = cursor.fetchone()
-    
-    # Determine which TDEE to use
-    user_tdee = 0
-    weekly_avg_tdee = 0
-    
-    if user_row:
-        auto_garmin_steps = user_row.get("auto_garmin_steps", False)
-        auto_add_workout_calories = user_row.get("auto_add_workout_calories", False)
-        calories_total_enabled = user_row.get("calories_total_enabled", False)
-        default_tdee = user_row["tdee"] if user_row["tdee"] is not None else 0
-        
-        # PRIORITY 1: Garmin calories_total mode
-        if calories_total_enabled:
-            # Get today's Garmin calories_total
-            cursor.execute("""
-                SELECT calories_total
-                FROM garmin_daily_data
-                WHERE user_id = %s AND date = CURRENT_DATE
-            """, (user_id,))
-            today_garmin_row = cursor.fetchone()
-            user_tdee = float(today_garmin_row["calories_total"]) if today_garmin_row and today_garmin_row["calories_total"] else default_tdee
-            
-            # Get weekly average Garmin calories_total (last 7 days)
-            cursor.execute("""
-                SELECT AVG(calories_total) as avg_calories_total
-                FROM garmin_daily_data
-                WHERE user_id = %s
-                AND date >= CURRENT_DATE - INTERVAL '6 days'
-                AND date <= CURRENT_DATE
-                AND calories_total IS NOT NULL
-            """, (user_id,))
-            avg_garmin_row = cursor.fetchone()
-            weekly_avg_tdee = float(avg_garmin_row["avg_calories_total"]) if avg_garmin_row and avg_garmin_row["avg_calories_total"] else default_tdee
-        
-        # PRIORITY 2: Dynamic TDEE (workout + steps adjustments)
-        elif auto_garmin_steps or auto_add_workout_calories:
-            # Get today's adjusted TDEE
-            cursor.execute("""
-                SELECT adjusted_tdee 
-                FROM daily_tdee_adjustments 
-                WHERE user_id = %s AND date = CURRENT_DATE
-            """, (user_id,))
-            today_tdee_row = cursor.fetchone()
-            user_tdee = today_tdee_row["adjusted_tdee"] if today_tdee_row and today_tdee_row["adjusted_tdee"] else default_tdee
-            
-            # Get weekly average adjusted TDEE (last 7 days)
-            cursor.execute("""
-                SELECT AVG(adjusted_tdee) as avg_tdee
-                FROM (
-                    SELECT adjusted_tdee, date
-                    FROM daily_tdee_adjustments
-                    WHERE user_id = %s
-                    AND date >= CURRENT_DATE - INTERVAL '6 days'
-                    AND date <= CURRENT_DATE
-                    AND adjusted_tdee IS NOT NULL
-                    ORDER BY date DESC
-                    LIMIT 7
-                ) subquery
-            """, (user_id,))
-            avg_tdee_row = cursor.fetchone()
-            weekly_avg_tdee = avg_tdee_row["avg_tdee"] if avg_tdee_row and avg_tdee_row["avg_tdee"] else default_tdee
-        
-        # PRIORITY 3: Static TDEE mode
-        else:
-            user_tdee = default_tdee
-            weekly_avg_tdee = default_tdee
-    
-    conn.close()
+    # Today's TDEE and the 7-day average (Garmin / adjusted days only) in the
+    # user's TDEE mode, one query for the whole week
+    tdee_week = tdee_service.resolve_week(user_id)
+    user_tdee = tdee_week[-1][1]["daily_tdee"]
+    weekly_avg_tdee = tdee_service.average_tdee(tdee_week)
 
-    session_history = get_session_history(user_id)
+    # Pre-aggregated per-day rows, only for the weeks shown on the page;
+    # older weeks are fetched page by page from /history/weeks
     today = datetime.today()
+    weeks_start = history_weeks_start(today.date(), HISTORY_WEEKS_PER_PAGE)
+    daily_totals = food_log.load_daily_totals(user_id, start=today.date() - timedelta(days=3), end=today.date() + timedelta(days=3))
+    weekly_next_before = weeks_start.strftime("%Y-%m-%d") if food_log.has_days_before(user_id, weeks_start) else None
     daily_dates = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(-3, 4)]
 
     history_data = []
@@ -3542,8 +3275,7 @@ def history():
 
     # Fill history_data
     for date in daily_dates:
-        day_data = session_history.get(date, [])
-        calories, proteins, fats, carbs, sugars, salt, saturated, fiber = get_daily_totals(day_data)
+        calories, proteins, fats, carbs, sugars, salt, saturated, fiber = daily_totals.get(date, food_log.EMPTY_DAY_TOTALS)
         history_data.append({
             'date': format_date(date),
             'date_raw': date,
@@ -3558,11 +3290,10 @@ def history():
         })
 
     # Today's totals
-    today_data = session_history.get(today_str, [])
-    today_calories, today_proteins, today_fats, today_carbs, today_salt, today_saturated, today_fiber, today_sugars = get_daily_totals(today_data)
+    today_calories, today_proteins, today_fats, today_carbs, today_salt, today_saturated, today_fiber, today_sugars = daily_totals.get(today_str, food_log.EMPTY_DAY_TOTALS)
 
-    # Weekly averages
-    weekly_data = calculate_weekly_averages(session_history)
+    # Weekly averages, aggregated in SQL over daily_nutrition_totals
+    weekly_data = food_log.load_period_averages(user_id, 'week', start=weeks_start)
     
     # ✅ Calculate weekly projection using weekly average TDEE
     weekly_projection = None
@@ -3588,9 +3319,34 @@ def history():
         today_fiber=today_fiber,
         user_tdee=user_tdee,
         daily_balance=daily_balance,
-        projected_change_kg=projected_change_kg
+        projected_change_kg=projected_change_kg,
+        weekly_next_before=weekly_next_before
     )
 
+@app.route('/history/weeks', methods=['GET'])
+@login_required
+def history_weeks():
+    """
+    Paginated weekly nutrition averages, newest first.
+    ?before=YYYY-MM-DD returns the weeks that end before that date,
+    ?weeks=N sets the page size. next_before is null on the last page.
+    """
+    user_id = current_user.id
+    try:
+        before = datetime.strptime(request.args['before'], "%Y-%m-%d").date()
+    except (KeyError, ValueError):
+        before = datetime.today().date() + timedelta(days=1)
+    weeks = max(1, min(request.args.get('weeks', HISTORY_WEEKS_PER_PAGE, type=int), 52))
+
+    end = before - timedelta(days=1)
+    start = history_weeks_start(end, weeks)
+    has_more = food_log.has_days_before(user_id, start)
+
+    return jsonify({
+        'weeks': food_log.load_period_averages(user_id, 'week', start=start, end=end),
+        'next_before': start.strftime("%Y-%m-%d") if has_more else None
+    })
+
 @app.route('/save_template_food', methods=['POST'])
 @login_required
 def save_template_food():
@@ -3706,6 +3462,7 @@ def get_templates_food():
     
 @app.route('/apply_template_food', methods=['POST'])
 @login_required
+@transactional
 def apply_template_food():
     try:
         template_id = request.form.get('template_id')
@@ -3730,10 +3487,8 @@ def apply_template_food():
         if not template_items:
             return jsonify({'success': False, 'error': 'Pohjaa ei löydy'})
         
-        # Get current session data
-        session_data, _ = get_current_session(current_user.id, date_str)
-        
         # Add each template item to the session
+        new_items = []
         for item in template_items:
             food_key = item[0]
             name = item[1]
@@ -3751,7 +3506,7 @@ def apply_template_food():
             # Calculate actual values based on grams
             factor = grams / 100.0
             
-            session_data.append({
+            new_items.append({
                 'id': str(uuid.uuid4()),
                 'key': food_key,
                 'name': name,
@@ -3767,8 +3522,9 @@ def apply_template_food():
                 'group': meal_group
             })
         
-        # Save updated session
-        save_current_session(current_user.id, session_data, date_str)
+        # Insert the template rows, then reload the day
+        food_log.add_items(current_user.id, date_str, new_items)
+        session_data, _ = get_current_session(current_user.id, date_str)
         
         # Get updated breakdown and totals
         totals = calculate_totals(session_data)
@@ -3981,141 +3737,8 @@ def get_current_week():
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=DictCursor)
 
-    week_data = {}
-
     try:
-        for date_str in week_dates:
-            # Fetch all sessions for that day
-            cursor.execute("""
-                SELECT ws.id, ws.focus_type, ws.name
-                FROM workout_sessions ws
-                WHERE ws.user_id = %s AND ws.date = %s
-            """, (current_user.id, date_str))
-            sessions = cursor.fetchall()
-
-            day_sessions = []
-            for session_row in sessions:
-                session_id, focus_type, name = session_row
-
-                # Fetch sets for this session (strength training)
-                cursor.execute("""
-                    SELECT wset.id, wset.exercise_id, wset.reps, wset.weight, ex.name, ex.muscle_group
-                    FROM workout_sets wset
-                    JOIN exercises ex ON ex.id = wset.exercise_id
-                    WHERE wset.session_id = %s
-                """, (session_id,))
-                sets = cursor.fetchall()
-
-                # ✅ UPDATED: Use the same cardio query as get_workout_session for consistency
-                cursor.execute('''
-                    SELECT DISTINCT
-                        cs.id,
-                        cs.duration_minutes,
-                        cs.distance_km,
-                        cs.avg_pace_min_per_km,
-                        cs.avg_heart_rate,
-                        cs.watts,
-                        cs.calories_burned,
-                        cs.notes,
-                        ce.name as exercise_name,
-                        ce.type as exercise_type,
-                        ce.met_value,
-                        cs.created_at
-                    FROM cardio_sessions cs
-                    JOIN workout_sessions ws ON cs.session_id = ws.id
-                    JOIN cardio_exercises ce ON cs.cardio_exercise_id = ce.id
-                    WHERE ws.user_id = %s AND ws.date = %s
-                    ORDER BY cs.created_at DESC, cs.id DESC
-                ''', (current_user.id, date_str))
-                
-                cardio_data = cursor.fetchall()
-
-                exercises_data = {}
-                for s in sets:
-                    ex_id, ex_id_dup, reps, weight, ex_name, muscle_group = s
-                    if ex_id not in exercises_data:
-                        exercises_data[ex_id] = {
-                            "id": ex_id,
-                            "name": ex_name,
-                            "muscle_group": muscle_group,
-                            "sets": []
-                        }
-                    exercises_data[ex_id]["sets"].append({"reps": reps, "weight": weight})
-
-                # ✅ UPDATED: Process cardio data consistently
-                cardio_sessions = []
-                seen_cardio_ids = set()
-                
-                for row in cardio_data:
-                    if row['id'] not in seen_cardio_ids:
-                        seen_cardio_ids.add(row['id'])
-                        cardio_sessions.append({
-                            'id': row['id'],
-                            'exercise_name': row['exercise_name'],
-                            'exercise_type': row['exercise_type'],
-                            'met_value': float(row['met_value']),
-                            'duration_minutes': float(row['duration_minutes']),
-                            'distance_km': float(row['distance_km']) if row['distance_km'] else None,
-                            'avg_pace_min_per_km': float(row['avg_pace_min_per_km']) if row['avg_pace_min_per_km'] else None,
-                            'avg_heart_rate': row['avg_heart_rate'],
-                            'watts': row['watts'],
-                            'calories_burned': float(row['calories_burned']),
-                            'notes': row['notes']
-                        })
-
-                # Build comparison data per exercise (previous session with same focus_type + exercise)
-                comparison_data = []
-                for ex_id, ex_data in exercises_data.items():
-                    cursor.execute("""
-                        SELECT ws.date, wset.reps, wset.weight
-                        FROM workout_sessions ws
-                        JOIN workout_sets wset ON wset.session_id = ws.id
-                        WHERE ws.user_id = %s
-                          AND ws.focus_type = %s
-                          AND wset.exercise_id = %s
-                          AND ws.id != %s
-                        ORDER BY ws.date DESC
-                        LIMIT 1
-                    """, (current_user.id, focus_type, ex_id, session_id))
-                    last = cursor.fetchone()
-
-                    current_sets = ex_data["sets"]
-                    total_reps = sum(s["reps"] for s in current_sets)
-                    total_volume = sum(s["reps"] * s["weight"] for s in current_sets)
-
-                    if last:
-                        last_reps = last[1]
-                        last_weight = last[2]
-                        last_volume = last_reps * last_weight
-                        comparison_data.append({
-                            "name": ex_data["name"],
-                            "lastDate": last[0].isoformat() if isinstance(last[0], datetime) else last[0],
-                            "currentSets": current_sets,
-                            "lastReps": last_reps,
-                            "lastWeight": last_weight,
-                            "lastVolume": last_volume
-                        })
-                    else:
-                        comparison_data.append({
-                            "name": ex_data["name"],
-                            "lastDate": None,
-                            "currentSets": current_sets,
-                            "lastReps": 0,
-                            "lastWeight": 0,
-                            "lastVolume": 0
-                        })
-
-                day_sessions.append({
-                    "sessionId": session_id,
-                    "focus_type": focus_type,
-                    "name": name,
-                    "exercises": list(exercises_data.values()),
-                    "cardio_sessions": cardio_sessions,  # ✅ Already included
-                    "comparisonData": comparison_data
-                })
-
-            week_data[date_str] = day_sessions
-
+        week_data = workout_week.load_week(cursor, current_user.id, week_dates)
         return jsonify(dates=week_dates, current_date=current_date, week_sessions=week_data)
 
     finally:
@@ -4373,6 +3996,7 @@ def save_workout_set():
                 (session_id, exercise_id, reps, weight, rir, comments)
             )
             set_ids.append(cursor.fetchone()[0])
+        exercise_stats.record_sets(cursor, user_id, date, [(exercise_id, reps, weight)] * sets_count)
         
         conn.commit()
         return jsonify(success=True, set_ids=set_ids, session_id=session_id)
@@ -4397,10 +4021,21 @@ def delete_workout_set():
     
     try:
         cursor.execute(
-            "DELETE FROM workout_sets WHERE id = %s",
+            "DELETE FROM workout_sets ws USING workout_sessions s "
+            "WHERE ws.id = %s AND s.id = ws.session_id "
+            "RETURNING s.user_id, s.date, ws.exercise_id, s.focus_type",
             (set_id,)
         )
+        deleted = cursor.fetchone()
+        if deleted:
+            exercise_stats.refresh(cursor, deleted[0], deleted[1], [deleted[2]])
+            exercise_bests.rebuild(cursor, deleted[0], deleted[3], [deleted[2]])
+            workout_rollup.refresh(cursor, deleted[0], [deleted[1]])
+            leaderboard.refresh(cursor, deleted[0])
         conn.commit()
+        landing_page.invalidate()
+        if deleted:
+            profile_stats.invalidate(deleted[0])
         return jsonify(success=True)
     
     except Exception as e:
@@ -4462,307 +4097,31 @@ def delete_exercise():
     finally:
         conn.close()
 
-def format_duration(total_seconds):
-    """Convert seconds to human readable format like '1h 23m' or '45m' or '2h'"""
-    if not total_seconds or total_seconds <= 0:
-        return "0m"
-    
-    hours = int(total_seconds // 3600)
-    minutes = int((total_seconds % 3600) // 60)
-    
-    if hours > 0 and minutes > 0:
-        return f"{hours}h {minutes}m"
-    elif hours > 0:
-        return f"{hours}h"
-    elif minutes > 0:
-        return f"{minutes}m"
-    else:
-        return "< 1m"
-        
 @app.route('/workout/history', methods=['GET'])
 @login_required
 def workout_history():
     user_id = current_user.id
     period = request.args.get('period', 'daily')
+    if period not in workout_totals.PAGE_SIZES:
+        period = 'monthly'
+    before = request.args.get('before')
+    try:
+        if before:
+            datetime.strptime(before, '%Y-%m-%d')
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            limit = min(max(limit, 1), workout_totals.MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify(error="Invalid before"), 400
 
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=DictCursor)
 
     try:
-        if period == 'daily':
-            # Get all workout sessions - filter by saved sessions
-            cursor.execute('''
-                SELECT 
-                    s.date,
-                    s.name as workout_name,
-                    s.id as session_id,
-                    e.muscle_group,
-                    ws.reps,
-                    ws.volume,
-                    ws.is_saved
-                FROM workout_sessions s
-                LEFT JOIN workout_sets ws ON s.id = ws.session_id
-                LEFT JOIN exercises e ON ws.exercise_id = e.id
-                WHERE s.user_id = %s AND s.is_saved = true
-                ORDER BY s.date DESC
-            ''', (user_id,))
-            rows = cursor.fetchall()
-
-            # Group by date and session
-            daily_data = {}
-            for row in rows:
-                date = row['date']
-                session_id = row['session_id']
-                
-                if date not in daily_data:
-                    daily_data[date] = {
-                        'workout_names': set(),
-                        'session_ids': set(),
-                        'total_sets': 0,
-                        'total_reps': 0,
-                        'total_volume': 0.0,
-                    }
-                
-                # Always capture session info
-                if session_id:
-                    daily_data[date]['session_ids'].add(session_id)
-                    if row['workout_name']:
-                        daily_data[date]['workout_names'].add(row['workout_name'])
-                
-                # Aggregate from saved sets (only count if we have actual set data)
-                if row['is_saved'] and row['muscle_group'] and row['reps'] is not None:
-                    daily_data[date]['total_sets'] += 1
-                    daily_data[date]['total_reps'] += row['reps']
-                    daily_data[date]['total_volume'] += float(row['volume'] or 0)
-
-            history = []
-            for date, data in sorted(daily_data.items(), reverse=True):
-                # Skip dates with no sessions
-                if not data['session_ids']:
-                    continue
-
-                # Get cardio duration and calories
-                cursor.execute('''
-                    SELECT 
-                        COALESCE(SUM(cs.duration_minutes), 0) as total_duration_minutes,
-                        COALESCE(SUM(cs.calories_burned), 0) as total_calories
-                    FROM cardio_sessions cs
-                    JOIN workout_sessions ws ON cs.session_id = ws.id
-                    WHERE ws.user_id = %s AND ws.date = %s AND ws.is_saved = true AND cs.is_saved = TRUE
-                ''', (user_id, date))
-                
-                cardio_totals = cursor.fetchone()
-                cardio_duration_minutes = float(cardio_totals['total_duration_minutes'] or 0)
-                cardio_calories = float(cardio_totals['total_calories'] or 0)
-                
-                # Get strength training duration from workout_sessions
-                cursor.execute('''
-                    SELECT COALESCE(SUM(workout_duration_seconds), 0) as strength_duration_seconds,
-                    COALESCE(SUM(weight_calories_burned), 0) as strength_calories
-                    FROM workout_sessions
-                    WHERE user_id = %s AND date = %s AND is_saved = true
-                ''', (user_id, date))
-                
-                strength_totals = cursor.fetchone()
-                strength_duration_seconds = float(strength_totals['strength_duration_seconds'] or 0)
-                strength_calories = float(strength_totals['strength_calories'] or 0)
-                
-                # Convert cardio minutes to seconds and combine
-                cardio_duration_seconds = cardio_duration_minutes * 60
-                total_duration_seconds = int(cardio_duration_seconds + strength_duration_seconds)
-                duration_formatted = format_duration(total_duration_seconds)
-
-                total_calories = cardio_calories + strength_calories
-
-                # Get muscles per day (only saved sets from saved sessions)
-                cursor.execute('''
-                    SELECT e.muscle_group,
-                        COUNT(ws.id) AS sets,
-                        SUM(ws.reps) AS reps,
-                        SUM(ws.volume) AS volume
-                    FROM workout_sessions s
-                    JOIN workout_sets ws ON s.id = ws.session_id
-                    JOIN exercises e ON ws.exercise_id = e.id
-                    WHERE s.user_id = %s AND s.date = %s AND s.is_saved = true AND ws.is_saved = TRUE
-                    GROUP BY e.muscle_group
-                ''', (user_id, date))
-                muscles_data = cursor.fetchall()
-                muscles = {}
-                for m in muscles_data:
-                    if m['muscle_group']:
-                        muscles[m['muscle_group']] = {
-                            'total_sets': m['sets'] or 0,
-                            'total_reps': m['reps'] or 0,
-                            'total_volume': float(m['volume'] or 0)
-                        }
-                
-                # Format workout names
-                workout_names_list = list(data['workout_names'])
-                if len(workout_names_list) > 1:
-                    workout_name_display = ', '.join(workout_names_list[:2])
-                    if len(workout_names_list) > 2:
-                        workout_name_display += f' +{len(workout_names_list)-2} lisää'
-                else:
-                    workout_name_display = workout_names_list[0] if workout_names_list else 'Unnamed Workout'
-                
-                history.append({
-                    'date': date,
-                    'workout_name': workout_name_display,
-                    'duration_seconds': total_duration_seconds,
-                    'duration_formatted': duration_formatted,
-                    'calories_burned': total_calories,
-                    'sessions_count': len(data['session_ids']),
-                    'total_sets': data['total_sets'],
-                    'total_reps': data['total_reps'],
-                    'total_volume': data['total_volume'],
-                    'muscles': muscles
-                })
-
-        else:
-            date_trunc = 'week' if period == 'weekly' else 'month'
-            period_limit = 12 if period == 'weekly' else 6
-
-            # Get all workout sessions without filtering on sets
-            cursor.execute(f'''
-                SELECT 
-                    DATE_TRUNC('{date_trunc}', s.date)::DATE AS period_start,
-                    s.id AS session_id,
-                    s.name as workout_name,
-                    e.muscle_group,
-                    ws.reps,
-                    ws.volume,
-                    ws.is_saved
-                FROM workout_sessions s
-                LEFT JOIN workout_sets ws ON s.id = ws.session_id
-                LEFT JOIN exercises e ON ws.exercise_id = e.id
-                WHERE s.user_id = %s AND s.is_saved = true
-                ORDER BY period_start DESC
-            ''', (user_id,))
-            rows = cursor.fetchall()
-
-            period_map = {}
-            for row in rows:
-                period_start = row['period_start']
-                if period_start not in period_map:
-                    period_map[period_start] = {
-                        'sessions': set(),
-                        'sessions_with_saved_sets': set(),
-                        'workout_names': set(),
-                        'muscles': {},
-                        'total_sets': 0,
-                        'total_reps': 0,
-                        'total_volume': 0.0,
-                        'has_saved_sets': False
-                    }
-
-                # Always capture session name
-                if row['session_id']:
-                    period_map[period_start]['sessions'].add(row['session_id'])
-                    if row['workout_name']:
-                        period_map[period_start]['workout_names'].add(row['workout_name'])
-
-                # Only aggregate muscle data from SAVED sets
-                if row['is_saved'] and row['muscle_group'] and row['reps'] is not None:
-                    period_map[period_start]['has_saved_sets'] = True
-                    period_map[period_start]['sessions_with_saved_sets'].add(row['session_id'])
-                    
-                    muscle = row['muscle_group']
-                    if muscle not in period_map[period_start]['muscles']:
-                        period_map[period_start]['muscles'][muscle] = {
-                            'sets': 0,
-                            'reps': 0,
-                            'volume': 0.0
-                        }
-
-                    period_map[period_start]['muscles'][muscle]['sets'] += 1
-                    period_map[period_start]['muscles'][muscle]['reps'] += row['reps']
-                    period_map[period_start]['muscles'][muscle]['volume'] += float(row['volume'] or 0)
-
-                    # Update totals
-                    period_map[period_start]['total_sets'] += 1
-                    period_map[period_start]['total_reps'] += row['reps']
-                    period_map[period_start]['total_volume'] += float(row['volume'] or 0)
-
-            # Convert to final history list
-            history = []
-            for period_start, data in sorted(period_map.items(), reverse=True):
-                # Skip periods with no saved sets
-                if not data['has_saved_sets']:
-                    continue
-                
-                # Get cardio duration and calories for the period
-                cursor.execute(f'''
-                    SELECT 
-                        COALESCE(SUM(cs.duration_minutes), 0) as total_duration_minutes,
-                        COALESCE(SUM(cs.calories_burned), 0) as total_calories
-                    FROM cardio_sessions cs
-                    JOIN workout_sessions ws ON cs.session_id = ws.id
-                    WHERE ws.user_id = %s 
-                    AND DATE_TRUNC('{date_trunc}', ws.date)::DATE = %s
-                    AND cs.is_saved = TRUE
-                ''', (user_id, period_start))
-                
-                cardio_totals = cursor.fetchone()
-                cardio_duration_minutes = float(cardio_totals['total_duration_minutes'] or 0)
-                cardio_calories = float(cardio_totals['total_calories'] or 0)
-                
-                # Get strength training duration from workout_sessions
-                cursor.execute(f'''
-                    SELECT COALESCE(SUM(workout_duration_seconds), 0) as strength_duration_seconds,
-                    COALESCE(SUM(weight_calories_burned), 0) as strength_calories
-                    FROM workout_sessions
-                    WHERE user_id = %s 
-                    AND DATE_TRUNC('{date_trunc}', date)::DATE = %s
-                    AND is_saved = true
-                ''', (user_id, period_start))
-                
-                strength_totals = cursor.fetchone()
-                strength_duration_seconds = float(strength_totals['strength_duration_seconds'] or 0)
-                strength_calories = float(strength_totals['strength_calories'] or 0)
-                
-                # Convert to seconds and combine
-                cardio_duration_seconds = cardio_duration_minutes * 60
-                total_duration_seconds = int(cardio_duration_seconds + strength_duration_seconds)
-                duration_formatted = format_duration(total_duration_seconds)
-                
-                total_calories = cardio_calories + strength_calories
-                # Create workout names summary
-                workout_names_list = list(data['workout_names'])
-                if len(workout_names_list) > 2:
-                    workout_names_display = f"{', '.join(workout_names_list[:2])} +{len(workout_names_list)-2} lisää"
-                else:
-                    workout_names_display = ', '.join(workout_names_list) if workout_names_list else 'Various Workouts'
-
-                entry = {
-                    'workout_names': workout_names_list,
-                    'workout_names_display': workout_names_display,
-                    'duration_seconds': total_duration_seconds,
-                    'duration_formatted': duration_formatted,
-                    'calories_burned': total_calories,
-                    'sessions_count': len(data['sessions_with_saved_sets']),
-                    'total_sets': data['total_sets'],
-                    'total_reps': data['total_reps'],
-                    'total_volume': data['total_volume'],
-                    'muscles': {}
-                }
-
-                for muscle, stats in data['muscles'].items():
-                    entry['muscles'][muscle] = {
-                        'total_sets': stats['sets'],
-                        'total_reps': stats['reps'],
-                        'total_volume': stats['volume']
-                    }
-
-                if period == 'weekly':
-                    entry['week_start'] = period_start
-                else:
-                    entry['month_start'] = period_start
-
-                history.append(entry)
-
-            history = history[:period_limit]
-
-        return jsonify(history=history, period=period)
+        history, next_before = workout_totals.load_history(
+            cursor, user_id, period, before or None, limit
+        )
+        return jsonify(history=history, period=period, next_before=next_before)
 
     except Exception as e:
         app.logger.error(f"Workout History Error: {str(e)}")
@@ -4786,11 +4145,22 @@ def update_workout_set():
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            UPDATE workout_sets 
+            UPDATE workout_sets ws
             SET reps = %s, weight = %s 
-            WHERE id = %s
+            FROM workout_sessions s
+            WHERE ws.id = %s AND s.id = ws.session_id
+            RETURNING s.user_id, s.date, ws.exercise_id, s.focus_type
         ''', (int(reps), float(weight), set_id))
+        updated = cursor.fetchone()
+        if updated:
+            exercise_stats.refresh(cursor, updated[0], updated[1], [updated[2]])
+            exercise_bests.rebuild(cursor, updated[0], updated[3], [updated[2]])
+            workout_rollup.refresh(cursor, updated[0], [updated[1]])
+            leaderboard.refresh(cursor, updated[0])
         conn.commit()
+        landing_page.invalidate()
+        if updated:
+            profile_stats.invalidate(updated[0])
         return jsonify(success=True)
     except Exception as e:
         return jsonify(success=False, error=str(e)), 500
@@ -4972,6 +4342,7 @@ def apply_workout_template():
                 (session_id, ex[0], ex[1], ex[2], ex[3], ex[4])
             )
             sets_added += 1
+        exercise_stats.record_sets(cursor, user_id, date, [(ex[0], ex[1], ex[2]) for ex in exercises])
         
         conn.commit()
         
@@ -5056,7 +4427,12 @@ def copy_session():
             sets_copied += 1
 
         print(f"Copied {sets_copied} sets")
+        exercise_stats.refresh(cursor, user_id, target_date)
+        workout_rollup.refresh(cursor, user_id, [target_date])
+        leaderboard.refresh(cursor, user_id)
         conn.commit()
+        landing_page.invalidate()
+        profile_stats.invalidate(user_id)
         cursor.close()
         conn.close()
 
@@ -5079,46 +4455,11 @@ def get_exercises_list():
     cursor = conn.cursor(cursor_factory=DictCursor)
     
     try:
-        # Get ALL exercises with optional user stats and trend calculation
-        cursor.execute('''
-            WITH exercise_volumes AS (
-                SELECT 
-                    e.id,
-                    e.name,
-                    e.muscle_group,
-                    COALESCE(MAX(ws.weight), 0) AS personal_best,
-                    MAX(s.date) AS last_performed,
-                    COALESCE(SUM(ws.volume), 0) AS total_volume,
-                    -- Calculate monthly volumes for trend
-                    COALESCE(SUM(CASE 
-                        WHEN s.date >= date_trunc('month', CURRENT_DATE) 
-                        THEN ws.volume 
-                        ELSE 0 
-                    END), 0) AS current_month_volume,
-                    COALESCE(SUM(CASE 
-                        WHEN s.date >= date_trunc('month', CURRENT_DATE) - INTERVAL '1 month'
-                        AND s.date < date_trunc('month', CURRENT_DATE)
-                        THEN ws.volume 
-                        ELSE 0 
-                    END), 0) AS previous_month_volume
-                FROM exercises e
-                LEFT JOIN workout_sets ws ON e.id = ws.exercise_id
-                LEFT JOIN workout_sessions s ON ws.session_id = s.id AND s.user_id = %s
-                GROUP BY e.id, e.name, e.muscle_group
-            )
-            SELECT 
-                *,
-                CASE 
-                    WHEN previous_month_volume > 0 
-                    THEN ((current_month_volume - previous_month_volume) / previous_month_volume::float) * 100
-                    ELSE 0 
-                END AS volume_trend
-            FROM exercise_volumes
-            ORDER BY name
-        ''', (user_id,))
+        # Every exercise with the user's stats, read from user_exercise_monthly_stats
+        rows = exercise_stats.load_exercise_list(cursor, user_id)
         
         exercises = []
-        for row in cursor.fetchall():
+        for row in rows:
             exercises.append({
                 'id': row['id'],
                 'name': row['name'],
@@ -5141,90 +4482,32 @@ def get_exercises_list():
 @app.route('/workout/exercise/<int:exercise_id>')
 @login_required
 def get_exercise_history(exercise_id):
+    """
+    Exercise detail with per-day history, paginated by date: pass the
+    returned next_before as ?before= for older days. Responses carry an ETag
+    so unchanged payloads come back as 304 Not Modified.
+    """
     user_id = current_user.id
+    before = request.args.get('before')
+    try:
+        if before:
+            datetime.strptime(before, '%Y-%m-%d')
+        limit = min(max(int(request.args.get('limit', exercise_stats.HISTORY_PAGE_SIZE)), 1), 500)
+    except ValueError:
+        return jsonify(error="Invalid before or limit"), 400
     
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=DictCursor)
     
     try:
-        # Get exercise name
-        cursor.execute('SELECT name FROM exercises WHERE id = %s', (exercise_id,))
-        exercise = cursor.fetchone()
-        if not exercise:
+        data = exercise_stats.load_exercise_history(cursor, user_id, exercise_id, before or None, limit)
+        if data is None:
             return jsonify(error="Exercise not found"), 404
         
-        # Get exercise history
-        cursor.execute('''
-            SELECT 
-                s.date,
-                COUNT(ws.id) AS sets,
-                MAX(ws.weight) AS best_weight,
-                MAX(ws.weight || 'kg × ' || ws.reps) AS best_set,
-                SUM(ws.volume) AS volume
-            FROM workout_sets ws
-            JOIN workout_sessions s ON ws.session_id = s.id
-            WHERE s.user_id = %s AND ws.exercise_id = %s
-            GROUP BY s.date
-            ORDER BY s.date DESC
-        ''', (user_id, exercise_id))
-        
-        history = []
-        rows = cursor.fetchall()
-        
-        for row in rows:
-            volume = float(row['volume'] or 0)
-            
-            history.append({
-                'date': row['date'].strftime('%Y-%m-%d'),
-                'sets': row['sets'],
-                'best_weight': float(row['best_weight'] or 0),
-                'best_set': row['best_set'] or '-',
-                'volume': volume
-            })
-        
-        # Get personal best
-        cursor.execute('''
-            SELECT MAX(ws.weight) AS personal_best
-            FROM workout_sets ws
-            JOIN workout_sessions s ON ws.session_id = s.id
-            WHERE s.user_id = %s AND ws.exercise_id = %s
-        ''', (user_id, exercise_id))
-        personal_best = float(cursor.fetchone()['personal_best'] or 0)
-        
-        # Get monthly volume (current month)
-        cursor.execute('''
-            SELECT SUM(ws.volume) AS monthly_volume
-            FROM workout_sets ws
-            JOIN workout_sessions s ON ws.session_id = s.id
-            WHERE s.user_id = %s AND ws.exercise_id = %s
-            AND s.date >= date_trunc('month', CURRENT_DATE)
-            AND s.date < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
-        ''', (user_id, exercise_id))
-        monthly_volume = float(cursor.fetchone()['monthly_volume'] or 0)
-        
-        # Get best set (set with highest volume)
-        cursor.execute('''
-            SELECT weight, reps, volume
-            FROM workout_sets ws
-            JOIN workout_sessions s ON ws.session_id = s.id
-            WHERE s.user_id = %s AND ws.exercise_id = %s
-            ORDER BY volume DESC
-            LIMIT 1
-        ''', (user_id, exercise_id))
-        best_set_row = cursor.fetchone()
-        best_set = f"{best_set_row['weight']}kg × {best_set_row['reps']}" if best_set_row else '-'
-        
-        return jsonify({
-            'name': exercise['name'],
-            'personal_best': personal_best,
-            'monthly_volume': monthly_volume,
-            'best_set': {
-                'weight': float(best_set_row['weight']) if best_set_row else 0,
-                'reps': int(best_set_row['reps']) if best_set_row else 0,
-                'formatted': f"{best_set_row['weight']}kg × {best_set_row['reps']}" if best_set_row else '-'
-                },
-            'history': history
-        })
+        response = jsonify(data)
+        response.add_etag()
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
         
     except Exception as e:
         app.logger.error(f"Exercise History Error: {str(e)}")
@@ -5304,8 +4587,12 @@ def save_metrics():
                 calories_total_enabled = %s
             WHERE id = %s
         """, (tdee, weight, gender, auto_add_workout_calories, auto_garmin_steps, calories_total_enabled, current_user.id))
+        leaderboard.refresh(cursor, current_user.id)
         
         conn.commit()
+        tdee_service.invalidate(current_user.id)
+        profile_stats.invalidate(current_user.id)
+        user_cache.invalidate(current_user.id)
         
         # DEBUG: Verify what was saved
         cursor.execute("""
@@ -5474,6 +4761,8 @@ def get_user_current_tdee(user_id, target_date=None, update_previous_days=False)
     2. Dynamic adjustments (workout + steps)
     3. Static base TDEE
     
+    Resolved by tdee_service.resolve() (one joined query, memoized for the request).
+
     IMPORTANT: update_previous_days should only be True when called from sync routes,
     NOT from regular /update_session calls, to avoid overwriting historical TDEE data.
     
@@ -5494,153 +4783,39 @@ def get_user_current_tdee(user_id, target_date=None, update_previous_days=False)
             "calories_total": float or None,
             "calories_total_enabled": bool,
             "mode": str,  # "garmin_total", "dynamic", or "static"
-            "previous_days_updated": int  # Number of previous days updated with Garmin data
+            "previous_days_updated": int,  # Number of previous days updated with Garmin data
+            "updated_dates": list  # Those dates, oldest first
         }
     """
     if target_date is None:
         target_date = datetime.now().date()
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        # Get user settings including calories_total_enabled
-        cursor.execute("""
-            SELECT auto_add_workout_calories, auto_garmin_steps, tdee, calories_total_enabled
-            FROM users 
-            WHERE id = %s
-        """, (user_id,))
-        
-        user_data = cursor.fetchone()
-        
-        if not user_data:
-            return {
-                "base_tdee": 0,
-                "workout_calories": 0,
-                "steps_calories": 0,
-                "daily_tdee": 0,
-                "auto_workout_enabled": False,
-                "auto_steps_enabled": False,
-                "calories_total": None,
-                "calories_total_enabled": False,
-                "mode": "static",
-                "previous_days_updated": 0
-            }
-        
-        auto_workout_enabled = bool(user_data[0]) if user_data[0] is not None else False
-        auto_steps_enabled = bool(user_data[1]) if user_data[1] is not None else False
-        base_tdee = float(user_data[2]) if user_data[2] else 0.0
-        calories_total_enabled = bool(user_data[3]) if user_data[3] is not None else False
-        
-        previous_days_updated = 0
-        
-        # PRIORITY 1: Garmin calories_total mode
-        if calories_total_enabled:
-            # Only update previous days when explicitly requested (e.g., after Garmin sync)
-            if update_previous_days:
-                previous_days_updated = _update_previous_days_garmin_tdee(
-                    user_id, cursor, target_date
-                )
-            
-            cursor.execute("""
-                SELECT calories_total
-                FROM garmin_daily_data
-                WHERE user_id = %s AND date = %s
-            """, (user_id, target_date))
-            
-            garmin_data = cursor.fetchone()
-            
-            if garmin_data and garmin_data[0]:
-                calories_total = float(garmin_data[0])
-                return {
-                    "base_tdee": base_tdee,
-                    "workout_calories": 0,
-                    "steps_calories": 0,
-                    "daily_tdee": calories_total,
-                    "auto_workout_enabled": auto_workout_enabled,
-                    "auto_steps_enabled": auto_steps_enabled,
-                    "calories_total": calories_total,
-                    "calories_total_enabled": True,
-                    "mode": "garmin_total",
-                    "previous_days_updated": previous_days_updated
-                }
-            else:
-                # Garmin mode enabled but no data for this date - fallback to base
-                return {
-                    "base_tdee": base_tdee,
-                    "workout_calories": 0,
-                    "steps_calories": 0,
-                    "daily_tdee": base_tdee,
-                    "auto_workout_enabled": auto_workout_enabled,
-                    "auto_steps_enabled": auto_steps_enabled,
-                    "calories_total": None,
-                    "calories_total_enabled": True,
-                    "mode": "static",
-                    "previous_days_updated": previous_days_updated
-                }
-        
-        # PRIORITY 2: Dynamic adjustment mode (workout + steps)
-        if auto_workout_enabled or auto_steps_enabled:
-            cursor.execute("""
-                SELECT workout_calories, steps_calories, adjusted_tdee
-                FROM daily_tdee_adjustments 
-                WHERE user_id = %s AND date = %s
-            """, (user_id, target_date))
-            
-            adjustment = cursor.fetchone()
-            
-            if adjustment:
-                workout_calories = float(adjustment[0]) if adjustment[0] else 0.0
-                steps_calories = float(adjustment[1]) if adjustment[1] else 0.0
-                adjusted_tdee = float(adjustment[2]) if adjustment[2] else base_tdee
-                
-                return {
-                    "base_tdee": base_tdee,
-                    "workout_calories": workout_calories,
-                    "steps_calories": steps_calories,
-                    "daily_tdee": adjusted_tdee,
-                    "auto_workout_enabled": auto_workout_enabled,
-                    "auto_steps_enabled": auto_steps_enabled,
-                    "calories_total": None,
-                    "calories_total_enabled": False,
-                    "mode": "dynamic",
-                    "previous_days_updated": 0
-                }
-            else:
-                # Dynamic mode enabled but no adjustments for this date
-                return {
-                    "base_tdee": base_tdee,
-                    "workout_calories": 0,
-                    "steps_calories": 0,
-                    "daily_tdee": base_tdee,
-                    "auto_workout_enabled": auto_workout_enabled,
-                    "auto_steps_enabled": auto_steps_enabled,
-                    "calories_total": None,
-                    "calories_total_enabled": False,
-                    "mode": "static",
-                    "previous_days_updated": 0
-                }
-        
-        # PRIORITY 3: Static TDEE mode
-        return {
-            "base_tdee": base_tdee,
-            "workout_calories": 0,
-            "steps_calories": 0,
-            "daily_tdee": base_tdee,
-            "auto_workout_enabled": False,
-            "auto_steps_enabled": False,
-            "calories_total": None,
-            "calories_total_enabled": False,
-            "mode": "static",
-            "previous_days_updated": 0
-        }
-    
-    finally:
-        cursor.close()
-        conn.close()
+
+    updated_dates = []
+    result = tdee_service.resolve(user_id, target_date)
+
+    # Only update previous days when explicitly requested (e.g., after Garmin sync)
+    if update_previous_days and result["calories_total_enabled"]:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            updated_dates = _update_previous_days_garmin_tdee(user_id, cursor, target_date)
+        finally:
+            cursor.close()
+            conn.close()
+        if updated_dates:
+            tdee_service.invalidate(user_id)
+
+    result.pop("measured", None)
+    result["previous_days_updated"] = len(updated_dates)
+    result["updated_dates"] = updated_dates
+    return result
+
+
+# How many days back a Garmin sync may backfill late calories_total values
+GARMIN_TDEE_LOOKBACK_DAYS = int(os.getenv('GARMIN_TDEE_LOOKBACK_DAYS', 7))
 
 
-def _update_previous_days_garmin_tdee(user_id, cursor, current_date, lookback_days=7):
+def _update_previous_days_garmin_tdee(user_id, cursor, current_date, lookback_days=None):
     """
     Update daily_tdee_adjustments for previous days that may have received 
     Garmin data late. This handles delayed Garmin syncs (up to a few hours) 
@@ -5648,80 +4823,43 @@ def _update_previous_days_garmin_tdee(user_id, cursor, current_date, lookback_da
     
     IMPORTANT: This stores the Garmin calories as the "adjusted_tdee" in 
     daily_tdee_adjustments so the TDEE retrieval picks it up correctly.
+
+    One INSERT ... SELECT upsert covers the whole window; rows whose
+    adjusted_tdee already matches are left untouched and not returned.
     
     Args:
         user_id: User ID
         cursor: Database cursor (reused from parent connection)
         current_date: Current date to start lookback from
-        lookback_days: Number of previous days to check (default 7 days)
+        lookback_days: Number of previous days to check
+                       (default GARMIN_TDEE_LOOKBACK_DAYS)
     
     Returns:
-        int: Number of days updated
+        list: Dates (oldest first) whose adjusted_tdee was inserted or changed
     """
-    updated_count = 0
-    
+    if lookback_days is None:
+        lookback_days = GARMIN_TDEE_LOOKBACK_DAYS
+
     try:
-        # Look back up to N days for any Garmin data that might have arrived late
-        for days_ago in range(1, lookback_days + 1):
-            check_date = current_date - timedelta(days=days_ago)
-            
-            # Check if Garmin data exists for this date
-            cursor.execute("""
-                SELECT id, calories_total
-                FROM garmin_daily_data
-                WHERE user_id = %s 
-                  AND date = %s
-                  AND calories_total IS NOT NULL
-            """, (user_id, check_date))
-            
-            garmin_data = cursor.fetchone()
-            
-            if garmin_data:
-                garmin_id, calories_total = garmin_data
-                
-                # Check if daily_tdee_adjustments record exists for this date
-                cursor.execute("""
-                    SELECT id
-                    FROM daily_tdee_adjustments
-                    WHERE user_id = %s AND date = %s
-                """, (user_id, check_date))
-                
-                adjustment_record = cursor.fetchone()
-                
-                if adjustment_record:
-                    adjustment_id = adjustment_record[0]
-                    # Update only if we haven't already set it with Garmin data
-                    # Check the current adjusted_tdee
-                    cursor.execute("""
-                        SELECT adjusted_tdee
-                        FROM daily_tdee_adjustments
-                        WHERE id = %s
-                    """, (adjustment_id,))
-                    
-                    current_adjusted = cursor.fetchone()
-                    
-                    # Only update if it's different (fresh Garmin data)
-                    if current_adjusted and current_adjusted[0] != calories_total:
-                        cursor.execute("""
-                            UPDATE daily_tdee_adjustments
-                            SET adjusted_tdee = %s
-                            WHERE id = %s
-                        """, (calories_total, adjustment_id))
-                        updated_count += 1
-                else:
-                    # Create new adjustment record with Garmin data as the TDEE
-                    cursor.execute("""
-                        INSERT INTO daily_tdee_adjustments 
-                        (user_id, date, workout_calories, steps_calories, adjusted_tdee)
-                        VALUES (%s, %s, 0, 0, %s)
-                    """, (user_id, check_date, calories_total))
-                    updated_count += 1
-        
+        cursor.execute("""
+            INSERT INTO daily_tdee_adjustments
+                (user_id, date, workout_calories, steps_calories, adjusted_tdee)
+            SELECT user_id, date, 0, 0, calories_total
+            FROM garmin_daily_data
+            WHERE user_id = %s
+              AND date >= %s::date - %s
+              AND date < %s::date
+              AND calories_total IS NOT NULL
+            ON CONFLICT (user_id, date) DO UPDATE
+            SET adjusted_tdee = EXCLUDED.adjusted_tdee
+            WHERE daily_tdee_adjustments.adjusted_tdee IS DISTINCT FROM EXCLUDED.adjusted_tdee
+            RETURNING date
+        """, (user_id, current_date, lookback_days, current_date))
+        return sorted(row[0] for row in cursor.fetchall())
     except Exception as e:
         # Log the error but don't raise - we want the main function to continue
         print(f"Error updating previous days TDEE for user {user_id}: {str(e)}")
-    
-    return updated_count
+        return []
 
 
 def sync_garmin_and_update_tdee(user_id):
@@ -5737,6 +4875,9 @@ def sync_garmin_and_update_tdee(user_id):
     Returns:
         dict: Update summary
     """
+    # Freshly synced garmin_daily_data, drop anything resolved before the sync
+    tdee_service.invalidate(user_id)
+
     # Get current TDEE which will trigger retroactive updates
     result = get_user_current_tdee(user_id, update_previous_days=True)
     
@@ -5744,26 +4885,10 @@ def sync_garmin_and_update_tdee(user_id):
         "success": True,
         "current_tdee": result["daily_tdee"],
         "mode": result["mode"],
-        "previous_days_updated": result["previous_days_updated"]
+        "previous_days_updated": result["previous_days_updated"],
+        "updated_dates": [d.isoformat() for d in result["updated_dates"]]
     }
 
-LEVEL_CAP = 999
-
-def xp_to_next_level(level: int, base_xp: int = 120, exp: float = 1.72) -> int:
-    """
-    XP required to advance from `level` to `level + 1`.
-    Tuned for:
-      - Early users: ~2-3 levels/week if very active
-      - After level 10: ~1 level/week if active
-      - Long-tail diminishing returns; practical long-term 50-60 range
-    """
-    if level >= LEVEL_CAP:
-        return 10**12  # effectively unreachable to prevent further leveling
-    # Minimum floor to avoid zero at very low levels
-    return max(50, int(round(base_xp * (level ** exp))))
-
-def clamp_level(level: int) -> int:
-    return min(max(level, 1), LEVEL_CAP)
 def safe_add_user_level_columns(cursor):
     """
     Defensive migration: add level and xp_points to users table if not present.
@@ -5785,30 +4910,6 @@ def safe_add_user_level_columns(cursor):
     except Exception as _migration_err:
         # Non-fatal; if migration fails due to permissions, continue assuming columns exist.
         pass
-def calculate_streak_xp_multiplier(streak_days: int) -> float:
-    """
-    Calculate XP multiplier based on workout streak.
-    
-    Formula:
-    - 0-4 days: 0% bonus (1.0x multiplier)
-    - 5-9 days: 2% bonus (1.02x multiplier)
-    - 10-19 days: 5% bonus (1.05x multiplier)
-    - 20+ days: 10% bonus (1.10x multiplier)
-    
-    Args:
-        streak_days: Current workout streak count
-    
-    Returns:
-        XP multiplier (e.g., 1.02 for 2% increase)
-    """
-    if streak_days >= 20:
-        return 1.10
-    elif streak_days >= 10:
-        return 1.05
-    elif streak_days >= 5:
-        return 1.02
-    else:
-        return 1.0    
 @app.route("/workout/save", methods=["POST"])
 @login_required
 def save_workout():
@@ -5970,247 +5071,6 @@ def save_workout():
             (float(total_calories), int(total_duration_seconds), session_id)
         )
 
-        # ============================================================================
-        # STEP 5: Build comparison data and achievements from saved sets
-        # ============================================================================
-        set_comparisons = []
-        personal_records = []
-        improvements = []
-        new_exercises_count = 0
-        total_sets = 0
-        current_total_volume = 0
-        volume_improvements = 0
-        sets_improvements = 0
-
-        # Organize saved sets by exercise
-        saved_sets_by_exercise = {}
-        for set_id, exercise_id, reps, weight in saved_sets_rows:
-            if exercise_id not in saved_sets_by_exercise:
-                saved_sets_by_exercise[exercise_id] = []
-            saved_sets_by_exercise[exercise_id].append({
-                "reps": int(reps),
-                "weight": float(weight)
-            })
-
-        # Process each exercise that has saved sets
-        for exercise_id, current_sets in saved_sets_by_exercise.items():
-            # Get exercise name from the exercises data or database
-            exercise_name = "Unknown Exercise"
-            for ex in exercises:
-                ex_id = ex.get("id") or ex.get("exercise_id") or ex.get("exerciseId")
-                if ex_id == exercise_id:
-                    exercise_name = ex.get("name") or ex.get("exercise_name") or ex.get("exerciseName") or "Unknown Exercise"
-                    break
-            
-            # If not found in exercises data, get from database
-            if exercise_name == "Unknown Exercise":
-                cursor.execute("SELECT name FROM exercises WHERE id = %s", (exercise_id,))
-                ex_result = cursor.fetchone()
-                if ex_result:
-                    exercise_name = ex_result[0]
-
-            # Get most recent SAVED session for this exercise and focus type (exclude current session)
-            cursor.execute("""
-                SELECT ws.id, ws.date
-                FROM workout_sessions ws
-                JOIN workout_sets wset ON wset.session_id = ws.id
-                WHERE ws.user_id = %s
-                  AND ws.focus_type = %s
-                  AND wset.exercise_id = %s
-                  AND ws.id != %s
-                  AND ws.is_saved = true
-                  AND wset.is_saved = true
-                ORDER BY ws.date DESC
-                LIMIT 1
-            """, (current_user.id, focus_type, exercise_id, session_id))
-            previous_session = cursor.fetchone()
-
-            total_sets += len(current_sets)
-
-            # Current session calculations
-            if current_sets:
-                heaviest_set = max(current_sets, key=lambda s: s["weight"])
-                best_set = max(current_sets, key=lambda s: s["reps"] * s["weight"])
-                total_volume_ex = sum(s["reps"] * s["weight"] for s in current_sets)
-                current_total_volume += total_volume_ex
-            else:
-                continue
-
-            if previous_session:
-                previous_session_id, previous_date = previous_session
-
-                # Get the last SAVED set data from previous session for this exercise
-                cursor.execute("""
-                    SELECT reps, weight
-                    FROM workout_sets
-                    WHERE session_id = %s AND exercise_id = %s AND is_saved = true
-                    ORDER BY id DESC
-                    LIMIT 1
-                """, (previous_session_id, exercise_id))
-                last_set = cursor.fetchone()
-
-                # Get stats from previous session for this exercise (only saved sets)
-                cursor.execute("""
-                    SELECT COUNT(*) as set_count, COALESCE(SUM(reps * weight), 0) as total_volume
-                    FROM workout_sets
-                    WHERE session_id = %s AND exercise_id = %s AND is_saved = true
-                """, (previous_session_id, exercise_id))
-                previous_stats = cursor.fetchone()
-
-                if last_set and previous_stats:
-                    last_reps, last_weight = int(last_set[0] or 0), float(last_set[1] or 0.0)
-                    last_set_count, last_total_volume_ex = int(previous_stats[0] or 0), float(previous_stats[1] or 0.0)
-                    last_volume = last_reps * last_weight
-
-                    # PRs
-                    if (best_set["reps"] * best_set["weight"]) > last_volume and last_volume > 0:
-                        personal_records.append({
-                            "exercise": exercise_name,
-                            "type": "bestSet",
-                            "weight": best_set["weight"],
-                            "reps": best_set["reps"],
-                            "previousBest": {"weight": last_weight, "reps": last_reps}
-                        })
-                    if heaviest_set["weight"] > last_weight and last_weight > 0:
-                        personal_records.append({
-                            "exercise": exercise_name,
-                            "type": "heaviestWeight",
-                            "weight": heaviest_set["weight"],
-                            "reps": None,
-                            "previousBest": {"weight": last_weight, "reps": last_reps}
-                        })
-
-                    # Per-set comparisons
-                    for idx, s in enumerate(current_sets, start=1):
-                        reps = int(s.get("reps") or 0)
-                        weight = float(s.get("weight") or 0.0)
-                        current_volume = reps * weight
-                        volume_change = current_volume - last_volume
-                        set_comparisons.append({
-                            "setId": f"{exercise_id}-{idx}",
-                            "exerciseId": exercise_id,
-                            "currentReps": reps,
-                            "currentWeight": weight,
-                            "currentVolume": current_volume,
-                            "previousReps": last_reps,
-                            "previousWeight": last_weight,
-                            "previousVolume": last_volume,
-                            "volumeChange": volume_change,
-                            "noPrevious": False,
-                            "isNew": False
-                        })
-
-                    # Improvements
-                    if total_volume_ex > last_total_volume_ex:
-                        volume_improvements += 1
-                        improvements.append({
-                            "exercise": exercise_name,
-                            "type": "volume",
-                            "volumeChange": total_volume_ex - last_total_volume_ex
-                        })
-
-                    if len(current_sets) > last_set_count:
-                        sets_improvements += 1
-                        improvements.append({
-                            "exercise": exercise_name,
-                            "type": "sets",
-                            "setsChange": len(current_sets) - last_set_count
-                        })
-                else:
-                    # Previous session exists but no data for this exercise
-                    new_exercises_count += 1
-                    for idx, s in enumerate(current_sets, start=1):
-                        reps = int(s.get("reps") or 0)
-                        weight = float(s.get("weight") or 0.0)
-                        current_volume = reps * weight
-                        set_comparisons.append({
-                            "setId": f"{exercise_id}-{idx}",
-                            "exerciseId": exercise_id,
-                            "currentReps": reps,
-                            "currentWeight": weight,
-                            "currentVolume": current_volume,
-                            "previousReps": 0,
-                            "previousWeight": 0.0,
-                            "previousVolume": 0.0,
-                            "volumeChange": current_volume,
-                            "noPrevious": True,
-                            "isNew": True
-                        })
-            else:
-                # First time doing this exercise in this focus type
-                new_exercises_count += 1
-                for idx, s in enumerate(current_sets, start=1):
-                    reps = int(s.get("reps") or 0)
-                    weight = float(s.get("weight") or 0.0)
-                    current_volume = reps * weight
-                    set_comparisons.append({
-                        "setId": f"{exercise_id}-{idx}",
-                        "exerciseId": exercise_id,
-                        "currentReps": reps,
-                        "currentWeight": weight,
-                        "currentVolume": current_volume,
-                        "previousReps": 0,
-                        "previousWeight": 0.0,
-                        "previousVolume": 0.0,
-                        "volumeChange": current_volume,
-                        "noPrevious": True,
-                        "isNew": True
-                    })
-
-        # Get previous session totals for same focus_type (exclude current session)
-        cursor.execute("""
-            SELECT ws.id
-            FROM workout_sessions ws
-            WHERE ws.user_id = %s
-            AND ws.focus_type = %s
-            AND ws.name = %s
-            AND ws.id != %s
-            AND ws.is_saved = true
-            ORDER BY ws.date DESC
-            LIMIT 1
-        """, (current_user.id, focus_type, name, session_id))
-        last_session_result = cursor.fetchone()
-
-        if not last_session_result:
-            cursor.execute("""
-                SELECT ws.id
-                FROM workout_sessions ws
-                WHERE ws.user_id = %s
-                AND ws.focus_type = %s
-                AND ws.id != %s
-                AND ws.is_saved = true
-                ORDER BY ws.date DESC
-                LIMIT 1
-            """, (current_user.id, focus_type, session_id))
-            last_session_result = cursor.fetchone()
-
-        last_total_volume = 0.0
-        last_total_sets = 0
-
-        if last_session_result:
-            last_session_id = last_session_result[0]
-
-            cursor.execute("""
-                SELECT COALESCE(SUM(reps * weight), 0) as total_volume
-                FROM workout_sets
-                WHERE session_id = %s AND is_saved = true
-            """, (last_session_id,))
-            volume_result = cursor.fetchone()
-            last_total_volume = float(volume_result[0] or 0.0)
-
-            cursor.execute("""
-                SELECT COUNT(*) as total_sets
-                FROM workout_sets
-                WHERE session_id = %s AND is_saved = true
-            """, (last_session_id,))
-            sets_result = cursor.fetchone()
-            last_total_sets = int(sets_result[0] or 0)
-
-        volume_change_percent = ((current_total_volume - last_total_volume) / last_total_volume * 100.0) if last_total_volume else 0.0
-        sets_change = total_sets - last_total_sets
-
-        conn.commit()
-
         # ============================================================================
         # STEP 6: Auto-add workout calories to TDEE if enabled
         # ============================================================================
@@ -6293,6 +5153,7 @@ def save_workout():
                     """, (user_id, date, base_tdee, day_total_workout_calories, steps_calories, daily_tdee))
                     
                     conn.commit()
+                    tdee_service.invalidate(user_id)
                     
                     print(f"TDEE Updated: Base={base_tdee}, Workout={day_total_workout_calories}, Steps={steps_calories}, Total={daily_tdee}")
         except Exception as e:
@@ -6300,226 +5161,43 @@ def save_workout():
             import traceback
             traceback.print_exc()
             pass
-# ============================================================================
-# STEP 6.5: WORKOUT STREAK LOGIC
-# ============================================================================
-        streak_awarded = False
-        current_streak = 0
-        previous_streak = 0
-
-        try:
-            # Get current streak info
-            cursor.execute("""
-                SELECT workout_streak, last_streak_date 
-                FROM users 
-                WHERE id = %s
-            """, (user_id,))
-            
-            streak_data = cursor.fetchone()
-            
-            if streak_data:
-                previous_streak = int(streak_data[0] or 0)
-                last_streak_date = streak_data[1]
-                current_streak = previous_streak
-                
-                # Only award streak if we haven't already awarded one for today
-                if last_streak_date != date:
-                    # Check if yesterday had a workout with 20+ minutes (1200+ seconds)
-                    yesterday = date - timedelta(days=1)
-                    
-                    cursor.execute("""
-                        SELECT COALESCE(SUM(total_duration_seconds), 0) as total_duration
-                        FROM workout_sessions
-                        WHERE user_id = %s 
-                        AND date = %s 
-                        AND is_saved = true
-                    """, (user_id, yesterday))
-                    
-                    yesterday_duration = cursor.fetchone()
-                    yesterday_total_seconds = int(yesterday_duration[0] or 0)
-                    
-                    # Award streak if yesterday had 20+ minutes OR if this is their first workout
-                    if yesterday_total_seconds >= 1200 or previous_streak == 0:
-                        current_streak = previous_streak + 1
-                        streak_awarded = True
-                        
-                        # Update user's streak
-                        cursor.execute("""
-                            UPDATE users 
-                            SET workout_streak = %s, 
-                                last_streak_date = %s 
-                            WHERE id = %s
-                        """, (current_streak, date, user_id))
-                        
-                        app.logger.info(f"Streak awarded! User {user_id}: {previous_streak} -> {current_streak}")
-                    else:
-                        # Reset streak to 1 if they missed yesterday
-                        current_streak = 1
-                        streak_awarded = True
-                        
-                        cursor.execute("""
-                            UPDATE users 
-                            SET workout_streak = %s, 
-                                last_streak_date = %s 
-                            WHERE id = %s
-                        """, (current_streak, date, user_id))
-                        
-                        app.logger.info(f"Streak reset! User {user_id}: {previous_streak} -> 1 (missed yesterday)")
-                else:
-                    app.logger.info(f"Streak already awarded today for user {user_id}")
-            
-            conn.commit()
-            
-        except Exception as e:
-            app.logger.error(f"Error calculating workout streak: {e}")
-            import traceback
-            traceback.print_exc()
-            # Don't fail the entire request if streak calculation fails
-            pass
 
         # ============================================================================
         # STEP 6.7: CHECK IF USER ALREADY EARNED XP TODAY (STRENGTH & CARDIO)
         # ============================================================================
         
-        # Check if user already has saved strength sets TODAY
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM workout_sets ws
-            JOIN workout_sessions wsess ON ws.session_id = wsess.id
-            WHERE wsess.user_id = %s 
-            AND wsess.date = %s 
-            AND ws.is_saved = true
-            AND wsess.id != %s
-        """, (user_id, date, session_id))
-        
-        existing_strength_saved_today = cursor.fetchone()[0] > 0
-        
-        # Check if user already has saved cardio TODAY
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM cardio_sessions cs
-            JOIN workout_sessions wsess ON cs.session_id = wsess.id
-            WHERE wsess.user_id = %s 
-            AND wsess.date = %s 
-            AND cs.is_saved = true
-            AND wsess.id != %s
-        """, (user_id, date, session_id))
-        
-        existing_cardio_saved_today = cursor.fetchone()[0] > 0
-        
-        app.logger.info(f"XP eligibility check - User {user_id} on {date}:")
-        app.logger.info(f"  Existing strength saved: {existing_strength_saved_today}")
-        app.logger.info(f"  Existing cardio saved: {existing_cardio_saved_today}")
+        existing_strength_saved_today, existing_cardio_saved_today = \
+            workout_saved.xp_already_earned(cursor, user_id, date, session_id)
 
+        # Totals shown in the workout history
+        workout_rollup.refresh(cursor, user_id, [date])
+        leaderboard.refresh(cursor, user_id)
 
-        # 
         # ============================================================================
-        # STEP 7: XP REWARDS LOGIC
+        # STEP 8: Queue comparisons, PRs, streak and XP, return right away
         # ============================================================================
-        xp_sources = {}
-        
-        # Only award cardio XP if this is the first cardio save of the day
-        if not existing_cardio_saved_today and cardio_duration > 0:
-            xp_cardio_duration = float(cardio_duration) * 0.03
-            xp_sources['cardio_duration'] = xp_cardio_duration
-            app.logger.info(f"Cardio duration XP awarded: {xp_cardio_duration}")
-        else:
-            xp_cardio_duration = 0.0
-            xp_sources['cardio_duration'] = 0.0
-            if existing_cardio_saved_today:
-                app.logger.info(f"Cardio XP NOT awarded - already saved cardio today")
-        
-        # Only award cardio calories XP if this is the first cardio save of the day
-        if not existing_cardio_saved_today and cardio_calories > 0:
-            xp_cardio_calories = float(cardio_calories) * 0.3
-            xp_sources['cardio_calories'] = xp_cardio_calories
-            app.logger.info(f"Cardio calories XP awarded: {xp_cardio_calories}")
-        else:
-            xp_cardio_calories = 0.0
-            xp_sources['cardio_calories'] = 0.0
-        
-        # Only award strength volume XP if this is the first strength save of the day
-        if not existing_strength_saved_today and current_total_volume > 0:
-            xp_weights_volume = float(current_total_volume) * 0.04
-            xp_sources['weights_volume'] = xp_weights_volume
-            app.logger.info(f"Weights volume XP awarded: {xp_weights_volume}")
-        else:
-            xp_weights_volume = 0.0
-            xp_sources['weights_volume'] = 0.0
-            if existing_strength_saved_today:
-                app.logger.info(f"Strength XP NOT awarded - already saved strength today")
-        
-        # Only award workout duration XP if this is the first strength save of the day
-        if not existing_strength_saved_today and workout_duration_seconds > 0:
-            xp_workout_duration = float(workout_duration_seconds) * 0.03
-            xp_sources['workout_duration'] = xp_workout_duration
-            app.logger.info(f"Workout duration XP awarded: {xp_workout_duration}")
-        else:
-            xp_workout_duration = 0.0
-            xp_sources['workout_duration'] = 0.0
-        
-        # Only award new exercises XP if this is the first strength save of the day
-        if not existing_strength_saved_today:
-            xp_new_exercises = int(new_exercises_count) * 25.0
-            xp_sources['new_exercises'] = xp_new_exercises
-            app.logger.info(f"New exercises XP awarded: {xp_new_exercises}")
-        else:
-            xp_new_exercises = 0.0
-            xp_sources['new_exercises'] = 0.0
-        
-        # Only award personal bests XP if this is the first strength save of the day
-        if not existing_strength_saved_today:
-            xp_personal_bests = float(len(personal_records)) * 30.0
-            xp_sources['personal_bests'] = xp_personal_bests
-            app.logger.info(f"Personal bests XP awarded: {xp_personal_bests}")
-        else:
-            xp_personal_bests = 0.0
-            xp_sources['personal_bests'] = 0.0
-        
-        # Calculate base XP before streak multiplier
-        base_xp_gain = sum(xp_sources.values())
-        
-        # Get current streak and calculate multiplier
-        streak_multiplier = calculate_streak_xp_multiplier(current_streak)
-        xp_gain = int(round(base_xp_gain * streak_multiplier))
-        
-        app.logger.info(f"Base XP gain: {base_xp_gain}, Streak: {current_streak}, Multiplier: {streak_multiplier}x, Final XP: {xp_gain}")
-
-
-        cursor.execute("SELECT COALESCE(xp_points,0), COALESCE(level,1) FROM users WHERE id = %s", (user_id,))
-        row = cursor.fetchone()
-        current_xp = int(row[0] or 0)
-        current_level = clamp_level(int(row[1] or 1))
-
-        new_levels = 0
-        pool = current_xp + xp_gain
-        level_cursor = current_level
-
-        while pool >= xp_to_next_level(level_cursor) and level_cursor < LEVEL_CAP:
-            need = xp_to_next_level(level_cursor)
-            pool -= need
-            level_cursor += 1
-            new_levels += 1
-            if level_cursor >= LEVEL_CAP:
-                level_cursor = LEVEL_CAP
-                pool = 0
-                break
-
-        cursor.execute(
-            "UPDATE users SET xp_points = %s, level = %s WHERE id = %s",
-            (int(pool), int(level_cursor), user_id)
-        )
-
+        job_id = jobs.enqueue(cursor, 'workout_saved', user_id, {
+            "session_id": session_id,
+            "date": date.isoformat(),
+            "name": name,
+            "focus_type": focus_type,
+            "exercises": exercises,
+            "cardio_duration": cardio_duration,
+            "cardio_calories": cardio_calories,
+            "workout_duration_seconds": workout_duration_seconds,
+            "existing_strength_saved_today": existing_strength_saved_today,
+            "existing_cardio_saved_today": existing_cardio_saved_today
+        })
         conn.commit()
+        jobs.notify()
+        landing_page.invalidate()
+        profile_stats.invalidate(user_id)
 
-        # ============================================================================
-        # STEP 8: Return response
-        # ============================================================================
         return jsonify({
             "success": True,
             "session_id": session_id,
             "session_name": name,
-            "exercises_saved": len(saved_sets_by_exercise),
+            "exercises_saved": len({row[1] for row in saved_sets_rows}),
             "timer_data": {
                 "totalSeconds": int(timer_data.get('totalSeconds') or 0),
                 "calories": float(timer_data.get('calories', 0) or 0.0)
@@ -6529,47 +5207,11 @@ def save_workout():
             "auto_calories_enabled": bool(auto_calories_enabled),
             "base_tdee": float(base_tdee) if base_tdee is not None else None,
             "daily_tdee": float(daily_tdee) if daily_tdee is not None else None,
-            "streak": {
-                "current": int(current_streak),
-                "previous": int(previous_streak),
-                "awarded": bool(streak_awarded)
-            },
-            "comparisonData": {
-                "setComparisons": set_comparisons,
-                "totalSets": int(total_sets),
-                "setsChange": int(sets_change),
-                "totalVolume": float(current_total_volume),
-                "volumeChange": float(round(volume_change_percent, 2))
-            },
-            "achievements": {
-                "personalRecords": personal_records,
-                "improvements": improvements,
-                "newExercises": int(new_exercises_count),
-                "volumeImprovements": int(volume_improvements),
-                "setsImprovements": int(sets_improvements)
-            },
-            "xp": {
-                "gained": int(xp_gain),
-                "sources": {
-                    "cardio_duration": int(round(xp_cardio_duration)),
-                    "cardio_calories": int(round(xp_cardio_calories)),
-                    "weights_volume": int(round(xp_weights_volume)),
-                    "workout_duration": int(round(xp_workout_duration)),
-                    "new_exercises": int(round(xp_new_exercises)),
-                    "personal_bests": int(round(xp_personal_bests))
-                },
-                "levels_gained": int(new_levels),
-                "level_before": int(current_level),
-                "level_after": int(level_cursor),
-                "current_xp": int(pool),
-                "xp_to_next_level": int(xp_to_next_level(level_cursor)),
-                "streak_multiplier": float(streak_multiplier),
-                "daily_limits": {
-                    "strength_already_earned_today": bool(existing_strength_saved_today),
-                    "cardio_already_earned_today": bool(existing_cardio_saved_today)
-                }
+            "job": {
+                "id": job_id,
+                "status": "queued",
+                "result_url": url_for('workout_save_result', job_id=job_id)
             }
-
         })
 
 
@@ -6584,6 +5226,25 @@ def save_workout():
         conn.close()
 
 
+@app.route('/workout/save/result/<int:job_id>', methods=['GET'])
+@login_required
+def workout_save_result(job_id):
+    """
+    Polled by the workout page after /workout/save. status is queued, done or
+    failed; result holds streak, comparisonData, achievements and xp once done.
+    """
+    job = jobs.get_job(job_id, current_user.id)
+    if job is None or job["kind"] != 'workout_saved':
+        return jsonify(success=False, error="Not found"), 404
+    return jsonify(
+        success=True,
+        status=job["status"],
+        result=job["result"] if job["status"] == 'done' else None,
+        error=job["error"] if job["status"] == 'failed' else None
+    )
+
+
+
 def get_oauth_connection(provider, provider_user_id):
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=DictCursor)
@@ -6913,7 +5574,12 @@ def copy_from_session():
             sets_copied += 1
         
         print(f"DEBUG: Successfully copied {sets_copied} sets")
+        exercise_stats.refresh(cursor, current_user.id, target_date)
+        workout_rollup.refresh(cursor, current_user.id, [target_date])
+        leaderboard.refresh(cursor, current_user.id)
         conn.commit()
+        landing_page.invalidate()
+        profile_stats.invalidate(current_user.id)
         
         return jsonify({
             "success": True, 
@@ -7197,8 +5863,10 @@ def delete_cardio_session(session_id):
         # ✅ Delete only the specific cardio session
         cursor.execute('DELETE FROM cardio_sessions WHERE id = %s', (session_id,))
         deleted_count = cursor.rowcount
+        workout_rollup.refresh(cursor, user_id, [session_info['date']])
         
         conn.commit()
+        profile_stats.invalidate(user_id)
         
         app.logger.info(f"Deleted cardio session {session_id} ({session_info['exercise_name']}) for user {user_id} on {session_info['date']}, rows affected: {deleted_count}")
         
@@ -7258,73 +5926,18 @@ def workout_history_muscle_detail(muscle_group):
     week_start = request.args.get('week_start')
     month_start = request.args.get('month_start')
     
+    bounds = workout_totals.period_bounds(period, date_filter, week_start, month_start)
+    if bounds is None:
+        return jsonify(error="Invalid parameters"), 400
+    
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=DictCursor)
     
     try:
-        if period == 'daily' and date_filter:
-            cursor.execute('''
-                SELECT 
-                    e.id as exercise_id,
-                    e.name as exercise_name,
-                    ws.reps,
-                    ws.weight,
-                    ws.volume,
-                    ws.id
-                FROM workout_sessions s
-                JOIN workout_sets ws ON s.id = ws.session_id
-                JOIN exercises e ON ws.exercise_id = e.id
-                WHERE s.user_id = %s 
-                AND s.date = %s
-                AND LOWER(e.muscle_group) = LOWER(%s)
-                AND ws.is_saved = TRUE
-                ORDER BY e.name, ws.id
-            ''', (user_id, date_filter, muscle_group))
-            
-        elif period == 'weekly' and week_start:
-            cursor.execute('''
-                SELECT 
-                    e.id as exercise_id,
-                    e.name as exercise_name,
-                    ws.reps,
-                    ws.weight,
-                    ws.volume,
-                    ws.id,
-                    s.date
-                FROM workout_sessions s
-                JOIN workout_sets ws ON s.id = ws.session_id
-                JOIN exercises e ON ws.exercise_id = e.id
-                WHERE s.user_id = %s 
-                AND s.date >= %s::date
-                AND s.date < %s::date + INTERVAL '7 days'
-                AND LOWER(e.muscle_group) = LOWER(%s)
-                AND ws.is_saved = TRUE
-                ORDER BY e.name, s.date DESC, ws.id
-            ''', (user_id, week_start, week_start, muscle_group))
-            
-        elif period == 'monthly' and month_start:
-            cursor.execute('''
-                SELECT 
-                    e.id as exercise_id,
-                    e.name as exercise_name,
-                    ws.reps,
-                    ws.weight,
-                    ws.volume,
-                    ws.id,
-                    s.date
-                FROM workout_sessions s
-                JOIN workout_sets ws ON s.id = ws.session_id
-                JOIN exercises e ON ws.exercise_id = e.id
-                WHERE s.user_id = %s 
-                AND DATE_TRUNC('month', s.date) = %s::date
-                AND LOWER(e.muscle_group) = LOWER(%s)
-                AND ws.is_saved = TRUE
-                ORDER BY e.name, s.date DESC, ws.id
-            ''', (user_id, month_start, muscle_group))
-        else:
-            return jsonify(error="Invalid parameters"), 400
-            
-        rows = cursor.fetchall()
+        muscle_group_id = muscle_groups.get_id(cursor, muscle_group)
+        if muscle_group_id is None:
+            return jsonify(exercises=[])
+        rows = workout_totals.load_muscle_sets(cursor, user_id, muscle_group_id, *bounds)
         
         # Group by exercise and check for PRs
         exercises = {}
@@ -7342,38 +5955,13 @@ def workout_history_muscle_detail(muscle_group):
             # Calculate set number
             set_number = len(exercises[ex_id]['sets']) + 1
             
-            # Check if this is a PR (heaviest weight for this exercise)
-            cursor.execute('''
-                SELECT MAX(weight) as max_weight
-                FROM workout_sets ws
-                JOIN workout_sessions s ON ws.session_id = s.id
-                WHERE s.user_id = %s 
-                AND ws.exercise_id = %s
-                AND s.date < %s
-                AND ws.is_saved = TRUE
-            ''', (user_id, ex_id, date_filter if date_filter else row.get('date')))
-            
-            prev_max = cursor.fetchone()
-            prev_max_weight = float(prev_max['max_weight'] or 0) if prev_max else 0
+            # PR flags against the heaviest weight / best set before this day
+            prev_max_weight = row['prev_max_weight']
             current_weight = float(row['weight'] or 0)
-            
-            # PR flags
             is_heaviest_weight = current_weight > prev_max_weight and prev_max_weight > 0
             
-            # Check for best set (weight * reps)
             current_volume_per_set = current_weight * int(row['reps'] or 0)
-            cursor.execute('''
-                SELECT MAX(reps * weight) as max_volume
-                FROM workout_sets ws
-                JOIN workout_sessions s ON ws.session_id = s.id
-                WHERE s.user_id = %s 
-                AND ws.exercise_id = %s
-                AND s.date < %s
-                AND ws.is_saved = TRUE
-            ''', (user_id, ex_id, date_filter if date_filter else row.get('date')))
-            
-            prev_best = cursor.fetchone()
-            prev_best_volume = float(prev_best['max_volume'] or 0) if prev_best else 0
+            prev_best_volume = row['prev_max_volume']
             is_best_set = current_volume_per_set > prev_best_volume and prev_best_volume > 0
             
             exercises[ex_id]['sets'].append({
@@ -7381,7 +5969,7 @@ def workout_history_muscle_detail(muscle_group):
                 'reps': row['reps'],
                 'weight': current_weight,
                 'volume': float(row['volume'] or 0),
-                'date': row.get('date', date_filter),
+                'date': date_filter if period == 'daily' else row['date'],
                 'is_heaviest_weight': is_heaviest_weight,
                 'is_best_set': is_best_set,
                 'has_pr': is_heaviest_weight or is_best_set
@@ -7576,241 +6164,24 @@ def index():
     news_posts = []
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=DictCursor)
-        
-        # Fetch published news posts (visible to everyone)
-        cursor.execute("""
-            SELECT np.*, u.username, u.avatar, u.level 
-            FROM news_post np 
-            JOIN users u ON np.author_id = u.id 
-            WHERE np.is_published = TRUE 
-            ORDER BY np.created_at DESC 
-            LIMIT 4
-        """)
-        news_posts_raw = cursor.fetchall()
-        news_posts = [dict(row) for row in news_posts_raw]
+        # News and today's lifts come from the shared landing page snapshot,
+        # only the random selection below is done per request
+        snapshot = landing_page.get_snapshot()
+        news_posts = snapshot['news']
         
         # Fetch data only if user is authenticated
         if current_user.is_authenticated:
             is_authenticated = True
-            user_id = current_user.id
-            
-            # Check admin status using 'role' column
-            cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-            user = cursor.fetchone()
-            if user and user['role'] == 'admin':
-                is_admin = True
-            
-            today = datetime.now().date()
-            
-            # ===== BEST LIFTS OF TODAY - ALL USERS (RANDOMIZED) =====
-            cursor.execute("""
-                SELECT 
-                    u.id as user_id, u.username, u.avatar, u.level, u.gender,
-                    e.name as exercise_name,
-                    ws.reps, ws.weight,
-                    (ws.reps * ws.weight) as volume
-                FROM workout_sets ws
-                JOIN workout_sessions wses ON ws.session_id = wses.id
-                JOIN users u ON wses.user_id = u.id
-                JOIN exercises e ON ws.exercise_id = e.id
-                WHERE wses.date = %s
-                  AND ws.is_saved = true
-                  AND (ws.reps * ws.weight) > 20
-                ORDER BY volume DESC
-            """, (today,))
-            
-            all_lifts_raw = cursor.fetchall()
-            
-            # Group lifts by user and randomize selection for MAIN tab
-            lifts_by_user = {}
-            for row in all_lifts_raw:
-                user_id_lift = row['user_id']
-                if user_id_lift not in lifts_by_user:
-                    lifts_by_user[user_id_lift] = []
-                lifts_by_user[user_id_lift].append(dict(row))
-            
-            import random
-            best_lifts_main = []
-            users = list(lifts_by_user.keys())
-            random.shuffle(users)
-            
-            for user_id_lift in users:
-                user_lifts = lifts_by_user[user_id_lift]
-                user_lifts.sort(key=lambda x: x['volume'], reverse=True)
-                num_lifts = 1 if random.random() < 0.7 else min(2, len(user_lifts))
-                best_lifts_main.extend(user_lifts[:num_lifts])
-                if len(best_lifts_main) >= 15:
-                    break
-            
-            random.shuffle(best_lifts_main)
-            best_lifts_main = best_lifts_main[:15]
-            
-            # ===== BEST LIFTS OF TODAY - MALE USERS =====
-            lifts_by_user_male = {}
-            for row in all_lifts_raw:
-                if row['gender'] == 'male':
-                    user_id_lift = row['user_id']
-                    if user_id_lift not in lifts_by_user_male:
-                        lifts_by_user_male[user_id_lift] = []
-                    lifts_by_user_male[user_id_lift].append(dict(row))
-            
-            best_lifts_male = []
-            users_male = list(lifts_by_user_male.keys())
-            random.shuffle(users_male)
-            
-            for user_id_lift in users_male:
-                user_lifts = lifts_by_user_male[user_id_lift]
-                user_lifts.sort(key=lambda x: x['volume'], reverse=True)
-                num_lifts = 1 if random.random() < 0.7 else min(2, len(user_lifts))
-                best_lifts_male.extend(user_lifts[:num_lifts])
-                if len(best_lifts_male) >= 15:
-                    break
-            
-            random.shuffle(best_lifts_male)
-            best_lifts_male = best_lifts_male[:15]
-            
-            # ===== BEST LIFTS OF TODAY - FEMALE USERS =====
-            lifts_by_user_female = {}
-            for row in all_lifts_raw:
-                if row['gender'] == 'female':
-                    user_id_lift = row['user_id']
-                    if user_id_lift not in lifts_by_user_female:
-                        lifts_by_user_female[user_id_lift] = []
-                    lifts_by_user_female[user_id_lift].append(dict(row))
-            
-            best_lifts_female = []
-            users_female = list(lifts_by_user_female.keys())
-            random.shuffle(users_female)
-            
-            for user_id_lift in users_female:
-                user_lifts = lifts_by_user_female[user_id_lift]
-                user_lifts.sort(key=lambda x: x['volume'], reverse=True)
-                num_lifts = 1 if random.random() < 0.7 else min(2, len(user_lifts))
-                best_lifts_female.extend(user_lifts[:num_lifts])
-                if len(best_lifts_female) >= 15:
-                    break
-            
-            random.shuffle(best_lifts_female)
-            best_lifts_female = best_lifts_female[:15]
+            is_admin = current_user.role == 'admin'
             
-            # ===== HEAVIEST LIFTS - BENCH PRESS (MALE) =====
-            cursor.execute("""
-                SELECT 
-                    u.id as user_id, u.username, u.avatar, u.level,
-                    e.name as exercise_name,
-                    ws.reps, ws.weight
-                FROM workout_sets ws
-                JOIN workout_sessions wses ON ws.session_id = wses.id
-                JOIN users u ON wses.user_id = u.id
-                JOIN exercises e ON ws.exercise_id = e.id
-                WHERE wses.date = %s
-                  AND ws.is_saved = true
-                  AND ws.exercise_id IN (11, 43)
-                  AND u.gender = 'male'
-                ORDER BY ws.weight DESC
-                LIMIT 10
-            """, (today,))
-            heaviest_lifts_male['bench'] = [dict(row) for row in cursor.fetchall()]
-            
-            # ===== HEAVIEST LIFTS - DEADLIFT (MALE) =====
-            cursor.execute("""
-                SELECT 
-                    u.id as user_id, u.username, u.avatar, u.level,
-                    e.name as exercise_name,
-                    ws.reps, ws.weight
-                FROM workout_sets ws
-                JOIN workout_sessions wses ON ws.session_id = wses.id
-                JOIN users u ON wses.user_id = u.id
-                JOIN exercises e ON ws.exercise_id = e.id
-                WHERE wses.date = %s
-                  AND ws.is_saved = true
-                  AND ws.exercise_id IN (117, 12, 57)
-                  AND u.gender = 'male'
-                ORDER BY ws.weight DESC
-                LIMIT 10
-            """, (today,))
-            heaviest_lifts_male['deadlift'] = [dict(row) for row in cursor.fetchall()]
-            
-            # ===== HEAVIEST LIFTS - SQUAT (MALE) =====
-            cursor.execute("""
-                SELECT 
-                    u.id as user_id, u.username, u.avatar, u.level,
-                    e.name as exercise_name,
-                    ws.reps, ws.weight
-                FROM workout_sets ws
-                JOIN workout_sessions wses ON ws.session_id = wses.id
-                JOIN users u ON wses.user_id = u.id
-                JOIN exercises e ON ws.exercise_id = e.id
-                WHERE wses.date = %s
-                  AND ws.is_saved = true
-                  AND ws.exercise_id = 23
-                  AND u.gender = 'male'
-                ORDER BY ws.weight DESC
-                LIMIT 10
-            """, (today,))
-            heaviest_lifts_male['squat'] = [dict(row) for row in cursor.fetchall()]
-            
-            # ===== HEAVIEST LIFTS - BENCH PRESS (FEMALE) =====
-            cursor.execute("""
-                SELECT 
-                    u.id as user_id, u.username, u.avatar, u.level,
-                    e.name as exercise_name,
-                    ws.reps, ws.weight
-                FROM workout_sets ws
-                JOIN workout_sessions wses ON ws.session_id = wses.id
-                JOIN users u ON wses.user_id = u.id
-                JOIN exercises e ON ws.exercise_id = e.id
-                WHERE wses.date = %s
-                  AND ws.is_saved = true
-                  AND ws.exercise_id IN (11, 43)
-                  AND u.gender = 'female'
-                ORDER BY ws.weight DESC
-                LIMIT 10
-            """, (today,))
-            heaviest_lifts_female['bench'] = [dict(row) for row in cursor.fetchall()]
-            
-            # ===== HEAVIEST LIFTS - DEADLIFT (FEMALE) =====
-            cursor.execute("""
-                SELECT 
-                    u.id as user_id, u.username, u.avatar, u.level,
-                    e.name as exercise_name,
-                    ws.reps, ws.weight
-                FROM workout_sets ws
-                JOIN workout_sessions wses ON ws.session_id = wses.id
-                JOIN users u ON wses.user_id = u.id
-                JOIN exercises e ON ws.exercise_id = e.id
-                WHERE wses.date = %s
-                  AND ws.is_saved = true
-                  AND ws.exercise_id IN (117, 12, 57)
-                  AND u.gender = 'female'
-                ORDER BY ws.weight DESC
-                LIMIT 10
-            """, (today,))
-            heaviest_lifts_female['deadlift'] = [dict(row) for row in cursor.fetchall()]
+            # ===== BEST LIFTS OF TODAY - ALL / MALE / FEMALE USERS (RANDOMIZED) =====
+            best_lifts_main = landing_page.pick_best_lifts(snapshot['lifts_by_user']['main'])
+            best_lifts_male = landing_page.pick_best_lifts(snapshot['lifts_by_user']['male'])
+            best_lifts_female = landing_page.pick_best_lifts(snapshot['lifts_by_user']['female'])
             
-            # ===== HEAVIEST LIFTS - SQUAT (FEMALE) =====
-            cursor.execute("""
-                SELECT 
-                    u.id as user_id, u.username, u.avatar, u.level,
-                    e.name as exercise_name,
-                    ws.reps, ws.weight
-                FROM workout_sets ws
-                JOIN workout_sessions wses ON ws.session_id = wses.id
-                JOIN users u ON wses.user_id = u.id
-                JOIN exercises e ON ws.exercise_id = e.id
-                WHERE wses.date = %s
-                  AND ws.is_saved = true
-                  AND ws.exercise_id = 23
-                  AND u.gender = 'female'
-                ORDER BY ws.weight DESC
-                LIMIT 10
-            """, (today,))
-            heaviest_lifts_female['squat'] = [dict(row) for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
+            # ===== HEAVIEST LIFTS OF TODAY - BENCH / DEADLIFT / SQUAT =====
+            heaviest_lifts_male = snapshot['heaviest']['male']
+            heaviest_lifts_female = snapshot['heaviest']['female']
         
         return render_template(
             'index.html',
@@ -7845,551 +6216,44 @@ def index():
 @login_required
 def get_profile_stats(user_id):
     """Fetch heaviest lifts and cardio personal bests for a user profile"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=DictCursor)
-    
     try:
-        # Check if user exists and get their gender
-        cursor.execute("""
-            SELECT id, gender
-            FROM users 
-            WHERE id = %s
-        """, (user_id,))
-        user_data = cursor.fetchone()
-        
-        if not user_data:
+        snapshot = profile_stats.get_snapshot(user_id)
+        if snapshot is None:
             return jsonify(error="User not found"), 404
         
-        user_gender = user_data['gender']  # Get user's gender (male, female, other)
-        
-        # ===== HEAVIEST LIFTS - ALL TIME =====
-        # Bench Press (exercise_id IN 11, 43)
-        cursor.execute("""
-            SELECT 
-                e.name as exercise_name,
-                ws.reps, 
-                ws.weight,
-                wses.date,
-                (ws.reps * ws.weight) as volume
-            FROM workout_sets ws
-            JOIN workout_sessions wses ON ws.session_id = wses.id
-            JOIN exercises e ON ws.exercise_id = e.id
-            WHERE wses.user_id = %s
-              AND ws.is_saved = true
-              AND ws.exercise_id IN (11, 43)
-            ORDER BY ws.weight DESC
-            LIMIT 1
-        """, (user_id,))
-        heaviest_bench = cursor.fetchone()
-        
-        # Deadlift (exercise_id IN 117, 12, 57)
-        cursor.execute("""
-            SELECT 
-                e.name as exercise_name,
-                ws.reps, 
-                ws.weight,
-                wses.date,
-                (ws.reps * ws.weight) as volume
-            FROM workout_sets ws
-            JOIN workout_sessions wses ON ws.session_id = wses.id
-            JOIN exercises e ON ws.exercise_id = e.id
-            WHERE wses.user_id = %s
-              AND ws.is_saved = true
-              AND ws.exercise_id IN (117, 12, 57)
-            ORDER BY ws.weight DESC
-            LIMIT 1
-        """, (user_id,))
-        heaviest_deadlift = cursor.fetchone()
-        
-        # Squat (exercise_id = 23)
-        cursor.execute("""
-            SELECT 
-                e.name as exercise_name,
-                ws.reps, 
-                ws.weight,
-                wses.date,
-                (ws.reps * ws.weight) as volume
-            FROM workout_sets ws
-            JOIN workout_sessions wses ON ws.session_id = wses.id
-            JOIN exercises e ON ws.exercise_id = e.id
-            WHERE wses.user_id = %s
-              AND ws.is_saved = true
-              AND ws.exercise_id = 23
-            ORDER BY ws.weight DESC
-            LIMIT 1
-        """, (user_id,))
-        heaviest_squat = cursor.fetchone()
-        
-        # ===== CALCULATE TOTAL AND GENDER-BASED RANK =====
-        # Calculate total powerlifting score
-        total_weight = 0
-        if heaviest_bench:
-            total_weight += heaviest_bench['weight']
-        if heaviest_squat:
-            total_weight += heaviest_squat['weight']
-        if heaviest_deadlift:
-            total_weight += heaviest_deadlift['weight']
-        
-        # Calculate user's rank based on total weight FILTERED BY SAME GENDER
-        user_rank = None
-        total_users_same_gender = 0
-        
-        if total_weight > 0:
-            cursor.execute("""
-                WITH user_totals AS (
-                    SELECT 
-                        wses.user_id,
-                        u.gender,
-                        COALESCE(
-                            (SELECT MAX(ws.weight) 
-                             FROM workout_sets ws 
-                             JOIN workout_sessions wses2 ON ws.session_id = wses2.id 
-                             WHERE wses2.user_id = wses.user_id 
-                               AND ws.is_saved = true 
-                               AND ws.exercise_id IN (11, 43)
-                            ), 0
-                        ) +
-                        COALESCE(
-                            (SELECT MAX(ws.weight) 
-                             FROM workout_sets ws 
-                             JOIN workout_sessions wses2 ON ws.session_id = wses2.id 
-                             WHERE wses2.user_id = wses.user_id 
-                               AND ws.is_saved = true 
-                               AND ws.exercise_id = 23
-                            ), 0
-                        ) +
-                        COALESCE(
-                            (SELECT MAX(ws.weight) 
-                             FROM workout_sets ws 
-                             JOIN workout_sessions wses2 ON ws.session_id = wses2.id 
-                             WHERE wses2.user_id = wses.user_id 
-                               AND ws.is_saved = true 
-                               AND ws.exercise_id IN (117, 12, 57)
-                            ), 0
-                        ) as total_weight
-                    FROM workout_sessions wses
-                    JOIN users u ON wses.user_id = u.id
-                    GROUP BY wses.user_id, u.gender
-                    HAVING 
-                        COALESCE(
-                            (SELECT MAX(ws.weight) 
-                             FROM workout_sets ws 
-                             JOIN workout_sessions wses2 ON ws.session_id = wses2.id 
-                             WHERE wses2.user_id = wses.user_id 
-                               AND ws.is_saved = true 
-                               AND ws.exercise_id IN (11, 43)
-                            ), 0
-                        ) +
-                        COALESCE(
-                            (SELECT MAX(ws.weight) 
-                             FROM workout_sets ws 
-                             JOIN workout_sessions wses2 ON ws.session_id = wses2.id 
-                             WHERE wses2.user_id = wses.user_id 
-                               AND ws.is_saved = true 
-                               AND ws.exercise_id = 23
-                            ), 0
-                        ) +
-                        COALESCE(
-                            (SELECT MAX(ws.weight) 
-                             FROM workout_sets ws 
-                             JOIN workout_sessions wses2 ON ws.session_id = wses2.id 
-                             WHERE wses2.user_id = wses.user_id 
-                               AND ws.is_saved = true 
-                               AND ws.exercise_id IN (117, 12, 57)
-                            ), 0
-                        ) > 0
-                )
-                SELECT 
-                    (SELECT COUNT(*) FROM user_totals WHERE total_weight > %s AND gender = %s) + 1 as rank,
-                    (SELECT COUNT(*) FROM user_totals WHERE gender = %s) as total_users
-            """, (total_weight, user_gender, user_gender))
-            rank_result = cursor.fetchone()
-            
-            if rank_result:
-                user_rank = rank_result['rank']
-                total_users_same_gender = rank_result['total_users']
-        
-        # ===== TOP 5 VOLUME LIFTS - ALL TIME =====
-        cursor.execute("""
-            SELECT 
-                e.name as exercise_name,
-                ws.reps, 
-                ws.weight,
-                wses.date,
-                (ws.reps * ws.weight) as volume
-            FROM workout_sets ws
-            JOIN workout_sessions wses ON ws.session_id = wses.id
-            JOIN exercises e ON ws.exercise_id = e.id
-            WHERE wses.user_id = %s
-              AND ws.is_saved = true
-              AND (ws.reps * ws.weight) > 20
-            ORDER BY volume DESC
-            LIMIT 5
-        """, (user_id,))
-        top_volume_lifts = cursor.fetchall()
-        
-        # ===== CARDIO PERSONAL BESTS - RUNNING =====
-        # Longest running session
-        cursor.execute("""
-            SELECT 
-                ce.name as cardio_exercise,
-                cs.duration_minutes,
-                cs.calories_burned,
-                cs.distance_km,
-                wses.date
-            FROM cardio_sessions cs
-            JOIN workout_sessions wses ON cs.session_id = wses.id
-            JOIN cardio_exercises ce ON cs.cardio_exercise_id = ce.id
-            WHERE wses.user_id = %s
-              AND cs.is_saved = true
-              AND cs.cardio_exercise_id IN (1, 2, 3, 4, 5, 10)
-            ORDER BY cs.duration_minutes DESC
-            LIMIT 1
-        """, (user_id,))
-        longest_running_session = cursor.fetchone()
-        
-        # Longest distance - Running
-        cursor.execute("""
-            SELECT 
-                ce.name as cardio_exercise,
-                cs.duration_minutes,
-                cs.calories_burned,
-                cs.distance_km,
-                wses.date
-            FROM cardio_sessions cs
-            JOIN workout_sessions wses ON cs.session_id = wses.id
-            JOIN cardio_exercises ce ON cs.cardio_exercise_id = ce.id
-            WHERE wses.user_id = %s
-              AND cs.is_saved = true
-              AND cs.cardio_exercise_id IN (1, 2, 3, 4, 5, 10)
-              AND cs.distance_km IS NOT NULL
-            ORDER BY cs.distance_km DESC
-            LIMIT 1
-        """, (user_id,))
-        longest_distance_running = cursor.fetchone()
-        
-        # ===== RUNNING - BEST 5KM =====
-        cursor.execute("""
-            SELECT 
-                ce.name as cardio_exercise,
-                cs.duration_minutes,
-                cs.distance_km,
-                cs.avg_speed,
-                cs.avg_heart_rate,
-                wses.date,
-                (cs.duration_minutes / cs.distance_km) as pace_min_per_km,
-                (cs.distance_km / (cs.duration_minutes / 60.0)) as speed_kmh,
-                -- Calculate estimated time for exactly 5km based on pace
-                ((cs.duration_minutes / cs.distance_km) * 5.0) as estimated_5km_time
-            FROM cardio_sessions cs
-            JOIN workout_sessions wses ON cs.session_id = wses.id
-            JOIN cardio_exercises ce ON cs.cardio_exercise_id = ce.id
-            WHERE wses.user_id = %s
-            AND cs.is_saved = true
-            AND cs.cardio_exercise_id IN (1, 2, 3, 4, 5, 10)
-            AND cs.distance_km >= 5.0
-            ORDER BY (cs.duration_minutes / cs.distance_km) ASC
-            LIMIT 1
-        """, (user_id,))
-        best_5km_run = cursor.fetchone()
-
-        # ===== RUNNING - BEST 10KM =====
-        cursor.execute("""
-            SELECT 
-                ce.name as cardio_exercise,
-                cs.duration_minutes,
-                cs.distance_km,
-                cs.avg_speed,
-                cs.avg_heart_rate,
-                wses.date,
-                (cs.duration_minutes / cs.distance_km) as pace_min_per_km,
-                (cs.distance_km / (cs.duration_minutes / 60.0)) as speed_kmh,
-                -- Calculate estimated time for exactly 10km based on pace
-                ((cs.duration_minutes / cs.distance_km) * 10.0) as estimated_10km_time
-            FROM cardio_sessions cs
-            JOIN workout_sessions wses ON cs.session_id = wses.id
-            JOIN cardio_exercises ce ON cs.cardio_exercise_id = ce.id
-            WHERE wses.user_id = %s
-            AND cs.is_saved = true
-            AND cs.cardio_exercise_id IN (1, 2, 3, 4, 5, 10)
-            AND cs.distance_km >= 10.0
-            ORDER BY (cs.duration_minutes / cs.distance_km) ASC
-            LIMIT 1
-        """, (user_id,))
-        best_10km_run = cursor.fetchone()
-
-        # ===== RUNNING - BEST 21KM (HALF MARATHON) =====
-        cursor.execute("""
-            SELECT 
-                ce.name as cardio_exercise,
-                cs.duration_minutes,
-                cs.distance_km,
-                cs.avg_speed,
-                cs.avg_heart_rate,
-                wses.date,
-                (cs.duration_minutes / cs.distance_km) as pace_min_per_km,
-                (cs.distance_km / (cs.duration_minutes / 60.0)) as speed_kmh,
-                -- Calculate estimated time for exactly 21km based on pace
-                ((cs.duration_minutes / cs.distance_km) * 21.0) as estimated_21km_time
-            FROM cardio_sessions cs
-            JOIN workout_sessions wses ON cs.session_id = wses.id
-            JOIN cardio_exercises ce ON cs.cardio_exercise_id = ce.id
-            WHERE wses.user_id = %s
-            AND cs.is_saved = true
-            AND cs.cardio_exercise_id IN (1, 2, 3, 4, 5, 10)
-            AND cs.distance_km >= 21.0
-            ORDER BY (cs.duration_minutes / cs.distance_km) ASC
-            LIMIT 1
-        """, (user_id,))
-        best_21km_run = cursor.fetchone()
-        # Longest cycling session
-        cursor.execute("""
-            SELECT 
-                ce.name as cardio_exercise,
-                cs.duration_minutes,
-                cs.calories_burned,
-                cs.distance_km,
-                wses.date
-            FROM cardio_sessions cs
-            JOIN workout_sessions wses ON cs.session_id = wses.id
-            JOIN cardio_exercises ce ON cs.cardio_exercise_id = ce.id
-            WHERE wses.user_id = %s
-              AND cs.is_saved = true
-              AND cs.cardio_exercise_id IN (11, 12, 13, 14, 15, 16, 17, 18)
-            ORDER BY cs.duration_minutes DESC
-            LIMIT 1
-        """, (user_id,))
-        longest_cycling_session = cursor.fetchone()
-        
-        # Longest distance - Cycling
-        cursor.execute("""
-            SELECT 
-                ce.name as cardio_exercise,
-                cs.duration_minutes,
-                cs.calories_burned,
-                cs.distance_km,
-                wses.date
-            FROM cardio_sessions cs
-            JOIN workout_sessions wses ON cs.session_id = wses.id
-            JOIN cardio_exercises ce ON cs.cardio_exercise_id = ce.id
-            WHERE wses.user_id = %s
-              AND cs.is_saved = true
-              AND cs.cardio_exercise_id IN (11, 12, 13, 14, 15, 16, 17, 18)
-              AND cs.distance_km IS NOT NULL
-            ORDER BY cs.distance_km DESC
-            LIMIT 1
-        """, (user_id,))
-        longest_distance_cycling = cursor.fetchone()
-        # ===== CYCLING - BEST 30KM =====
-        cursor.execute("""
-            SELECT 
-                ce.name as cardio_exercise,
-                cs.duration_minutes,
-                cs.distance_km,
-                cs.avg_speed,
-                cs.avg_heart_rate,
-                wses.date,
-                (cs.duration_minutes / cs.distance_km) as pace_min_per_km,
-                (cs.distance_km / (cs.duration_minutes / 60.0)) as speed_kmh,
-                -- Calculate estimated time for exactly 30km based on pace
-                ((cs.duration_minutes / cs.distance_km) * 30.0) as estimated_30km_time
-            FROM cardio_sessions cs
-            JOIN workout_sessions wses ON cs.session_id = wses.id
-            JOIN cardio_exercises ce ON cs.cardio_exercise_id = ce.id
-            WHERE wses.user_id = %s
-            AND cs.is_saved = true
-            AND cs.cardio_exercise_id IN (11, 12, 13, 14, 15, 16, 17, 18)
-            AND cs.distance_km >= 30.0
-            ORDER BY (cs.duration_minutes / cs.distance_km) ASC
-            LIMIT 1
-        """, (user_id,))
-        best_30km_cycle = cursor.fetchone()
-
-        # ===== CYCLING - BEST 60KM =====
-        cursor.execute("""
-            SELECT 
-                ce.name as cardio_exercise,
-                cs.duration_minutes,
-                cs.distance_km,
-                cs.avg_speed,
-                cs.avg_heart_rate,
-                wses.date,
-                (cs.duration_minutes / cs.distance_km) as pace_min_per_km,
-                (cs.distance_km / (cs.duration_minutes / 60.0)) as speed_kmh,
-                -- Calculate estimated time for exactly 60km based on pace
-                ((cs.duration_minutes / cs.distance_km) * 60.0) as estimated_60km_time
-            FROM cardio_sessions cs
-            JOIN workout_sessions wses ON cs.session_id = wses.id
-            JOIN cardio_exercises ce ON cs.cardio_exercise_id = ce.id
-            WHERE wses.user_id = %s
-            AND cs.is_saved = true
-            AND cs.cardio_exercise_id IN (11, 12, 13, 14, 15, 16, 17, 18)
-            AND cs.distance_km >= 60.0
-            ORDER BY (cs.duration_minutes / cs.distance_km) ASC
-            LIMIT 1
-        """, (user_id,))
-        best_60km_cycle = cursor.fetchone()
-
-        # ===== CYCLING - BEST 100KM =====
-        cursor.execute("""
-            SELECT 
-                ce.name as cardio_exercise,
-                cs.duration_minutes,
-                cs.distance_km,
-                cs.avg_speed,
-                cs.avg_heart_rate,
-                wses.date,
-                (cs.duration_minutes / cs.distance_km) as pace_min_per_km,
-                (cs.distance_km / (cs.duration_minutes / 60.0)) as speed_kmh,
-                -- Calculate estimated time for exactly 100km based on pace
-                ((cs.duration_minutes / cs.distance_km) * 100.0) as estimated_100km_time
-            FROM cardio_sessions cs
-            JOIN workout_sessions wses ON cs.session_id = wses.id
-            JOIN cardio_exercises ce ON cs.cardio_exercise_id = ce.id
-            WHERE wses.user_id = %s
-            AND cs.is_saved = true
-            AND cs.cardio_exercise_id IN (11, 12, 13, 14, 15, 16, 17, 18)
-            AND cs.distance_km >= 100.0
-            ORDER BY (cs.duration_minutes / cs.distance_km) ASC
-            LIMIT 1
-        """, (user_id,))
-        best_100km_cycle = cursor.fetchone()
-        
-        # Convert dict rows to regular dicts for JSON serialization
-        response_data = {
-            'user_gender': user_gender,  # Return user's gender for frontend reference
-            'heaviest_lifts': {
-                'bench': dict(heaviest_bench) if heaviest_bench else None,
-                'deadlift': dict(heaviest_deadlift) if heaviest_deadlift else None,
-                'squat': dict(heaviest_squat) if heaviest_squat else None,
-                'total': total_weight,
-                'total_rank': user_rank,
-                'total_users': total_users_same_gender
-            },
-            'top_volume_lifts': [dict(row) for row in top_volume_lifts],
-            'cardio_records': {
-                'running': {
-                    'longest_session': dict(longest_running_session) if longest_running_session else None,
-                    'longest_distance': dict(longest_distance_running) if longest_distance_running else None,
-                    'best_5km': dict(best_5km_run) if best_5km_run else None,
-                    'best_10km': dict(best_10km_run) if best_10km_run else None,
-                    'best_21km': dict(best_21km_run) if best_21km_run else None
-                },
-                'cycling': {
-                    'longest_session': dict(longest_cycling_session) if longest_cycling_session else None,
-                    'longest_distance': dict(longest_distance_cycling) if longest_distance_cycling else None,
-                    'best_30km': dict(best_30km_cycle) if best_30km_cycle else None,
-                    'best_60km': dict(best_60km_cycle) if best_60km_cycle else None,
-                    'best_100km': dict(best_100km_cycle) if best_100km_cycle else None
-                }
-            }
-        }
-        
-        return jsonify(response_data)
+        return jsonify(snapshot['stats'])
         
     except Exception as e:
         app.logger.error(f"Error loading profile stats: {e}")
         import traceback
         app.logger.error(traceback.format_exc())
         return jsonify(error="Could not load profile stats"), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @app.route('/profile/<int:user_id>/stats/recent', methods=['GET'])
 @login_required
 def get_profile_stats_recent(user_id):
     """Fetch recent 30-day stats for profile"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=DictCursor)
-    
     try:
-        # Check if user exists and privacy settings
-        cursor.execute("""
-            SELECT show_health_metrics 
-            FROM users 
-            WHERE id = %s
-        """, (user_id,))
-        user_data = cursor.fetchone()
-        
-        if not user_data:
+        # Read per request, the snapshot may predate a privacy change
+        show_health_metrics = profile_stats.show_health_metrics(user_id)
+        if show_health_metrics is None:
             return jsonify(error="User not found"), 404
         
-        if not user_data.get('show_health_metrics', False) and user_id != current_user.id:
+        if not show_health_metrics and user_id != current_user.id:
             return jsonify(error="Stats are private"), 403
         
-        # Calculate date 30 days ago
-        from datetime import datetime, timedelta
-        thirty_days_ago = (datetime.now() - timedelta(days=30)).date()
-        
-        # Recent workout count
-        cursor.execute("""
-            SELECT COUNT(DISTINCT id) as recent_workouts
-            FROM workout_sessions
-            WHERE user_id = %s 
-              AND is_saved = true 
-              AND date >= %s
-        """, (user_id, thirty_days_ago))
-        recent_workouts = cursor.fetchone()['recent_workouts'] or 0
-        
-        # Recent volume
-        cursor.execute("""
-            SELECT COALESCE(SUM(ws.reps * ws.weight), 0) as recent_volume
-            FROM workout_sets ws
-            JOIN workout_sessions wses ON ws.session_id = wses.id
-            WHERE wses.user_id = %s 
-              AND ws.is_saved = true
-              AND wses.date >= %s
-        """, (user_id, thirty_days_ago))
-        recent_volume = float(cursor.fetchone()['recent_volume'] or 0)
-        
-        # Recent cardio time
-        cursor.execute("""
-            SELECT COALESCE(SUM(cs.duration_minutes), 0) as recent_cardio_minutes
-            FROM cardio_sessions cs
-            JOIN workout_sessions wses ON cs.session_id = wses.id
-            WHERE wses.user_id = %s 
-              AND cs.is_saved = true
-              AND wses.date >= %s
-        """, (user_id, thirty_days_ago))
-        recent_cardio_minutes = float(cursor.fetchone()['recent_cardio_minutes'] or 0)
-        
-        # Most trained muscle group (last 30 days)
-        cursor.execute("""
-            SELECT 
-                e.muscle_group,
-                COUNT(ws.id) as set_count
-            FROM workout_sets ws
-            JOIN workout_sessions wses ON ws.session_id = wses.id
-            JOIN exercises e ON ws.exercise_id = e.id
-            WHERE wses.user_id = %s 
-              AND ws.is_saved = true
-              AND wses.date >= %s
-            GROUP BY e.muscle_group
-            ORDER BY set_count DESC
-            LIMIT 1
-        """, (user_id, thirty_days_ago))
-        top_muscle = cursor.fetchone()
-        
-        response_data = {
-            'period_days': 30,
-            'recent_workouts': recent_workouts,
-            'recent_volume_kg': recent_volume,
-            'recent_cardio_hours': round(recent_cardio_minutes / 60, 1),
-            'top_muscle_group': dict(top_muscle) if top_muscle else None
-        }
+        snapshot = profile_stats.get_snapshot(user_id)
+        if snapshot is None:
+            return jsonify(error="User not found"), 404
         
-        return jsonify(response_data)
+        return jsonify(snapshot['recent'])
         
     except Exception as e:
         app.logger.error(f"Error loading recent profile stats: {e}")
         import traceback
         app.logger.error(traceback.format_exc())
         return jsonify(error="Could not load recent stats"), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 if __name__ == '__main__':
     try:
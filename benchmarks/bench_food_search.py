@@ -0,0 +1,100 @@
+# bench_food_search.py - per-keystroke latency of the LIKE vs indexed food search
+#
+# Usage:
+#   DB_ENV=local python benchmarks/bench_food_search.py            # 100k and 1M foods
+#   DB_ENV=local python benchmarks/bench_food_search.py 100000
+#
+# Builds synthetic foods in a scratch schema (bench_food_search), which is
+# dropped at the end. Never point this at production.
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from psycopg2.extras import DictCursor
+from dotenv import load_dotenv
+
+import food_search
+from db import get_database_url
+
+SCHEMA = "bench_food_search"
+KEYSTROKES = ["m", "ma", "mai", "mait", "maito", "maito r", "maito ras", "jäätelö", "6414893400012"]
+REPEAT = 20
+
+WORDS = ["maito", "rasvaton", "kevyt", "jäätelö", "leipä", "ruis", "kaura", "juusto",
+         "kana", "broileri", "jauheliha", "peruna", "omena", "banaani", "jogurtti",
+         "mansikka", "mustikka", "riisi", "pasta", "lohi", "kinkku", "kahvi", "sokeri"]
+
+
+def setup(cursor, n_foods):
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"SET search_path = {SCHEMA}, public")
+    cursor.execute("""
+        CREATE TABLE foods (
+            key TEXT PRIMARY KEY, name TEXT NOT NULL,
+            carbs REAL NOT NULL, proteins REAL NOT NULL, fats REAL NOT NULL,
+            calories REAL NOT NULL, serving REAL, half REAL, entire REAL, bigserving REAL,
+            ean TEXT UNIQUE, owner_id INTEGER
+        )
+    """)
+    cursor.execute("CREATE TABLE food_usage (user_id INTEGER, food_key TEXT, count INTEGER, PRIMARY KEY (user_id, food_key))")
+    cursor.execute("CREATE TABLE food_usage_global (food_key TEXT PRIMARY KEY, count INTEGER)")
+    cursor.execute("""
+        INSERT INTO foods (key, name, carbs, proteins, fats, calories, ean)
+        SELECT 'food_' || i,
+               (%(words)s::text[])[1 + i %% %(n_words)s] || ' ' ||
+               (%(words)s::text[])[1 + (i / %(n_words)s) %% %(n_words)s] || ' ' || i,
+               10, 5, 2, 78,
+               CASE WHEN i %% 3 = 0 THEN (6414893400000 + i)::text END
+        FROM generate_series(1, %(n)s) AS i
+    """, {"words": WORDS, "n_words": len(WORDS), "n": n_foods})
+    cursor.execute("""
+        INSERT INTO food_usage (user_id, food_key, count)
+        SELECT 1, 'food_' || i, 1 + i %% 17 FROM generate_series(1, %s, 97) AS i
+    """, (n_foods,))
+    cursor.execute("""
+        INSERT INTO food_usage_global (food_key, count)
+        SELECT 'food_' || i, 1 + i %% 101 FROM generate_series(1, %s, 13) AS i
+    """, (n_foods,))
+    if not food_search.init_food_search(cursor):
+        raise SystemExit("pg_trgm / unaccent not available, cannot benchmark the indexed mode")
+    cursor.execute("ANALYZE")
+
+
+def measure(cursor, search, query):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        search(cursor, 1, False, query, 25, 0)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def run(conn, n_foods):
+    cursor = conn.cursor(cursor_factory=DictCursor)
+    print(f"\n=== {n_foods:,} foods ===")
+    setup(cursor, n_foods)
+    print(f"{'query':<16}{'like p50':>10}{'like p95':>10}{'idx p50':>10}{'idx p95':>10}  (ms)")
+    for query in KEYSTROKES:
+        like_p50, like_p95 = measure(cursor, food_search.search_foods_legacy, query)
+        idx_p50, idx_p95 = measure(cursor, food_search.search_foods_indexed, query)
+        print(f"{query:<16}{like_p50:>10.2f}{like_p95:>10.2f}{idx_p50:>10.2f}{idx_p95:>10.2f}")
+    cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    cursor.close()
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+    conn = psycopg2.connect(get_database_url())
+    conn.autocommit = True
+    try:
+        for n in sizes:
+            run(conn, n)
+    finally:
+        conn.close()
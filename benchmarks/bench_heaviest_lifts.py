@@ -0,0 +1,192 @@
+# bench_heaviest_lifts.py - landing page heaviest-lift boards
+#
+# Compares, on the same synthetic workout history:
+#   six queries - one top 10 query per (lift, gender), the old index() path
+#   ranked      - landing_page._load_heaviest, one ROW_NUMBER() query
+# under four index setups:
+#   baseline         - what production has anyway (primary keys and the
+#                      muscle_groups range-scan indexes)
+#   exercise/weight  - + partial workout_sets (exercise_id, weight DESC) WHERE is_saved
+#   date             - + landing_page.init_landing_page (workout_sessions (date))
+#   date + ex/weight - both
+#
+# Usage:
+#   DB_ENV=local python benchmarks/bench_heaviest_lifts.py [users] [days] [sets_per_session]
+#
+# Builds the tables in a scratch schema (bench_heaviest_lifts) that is
+# dropped at the end. Never point this at production.
+import os
+import sys
+import time
+import statistics
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from psycopg2.extras import DictCursor
+from dotenv import load_dotenv
+
+import landing_page
+from db import get_database_url
+
+SCHEMA = "bench_heaviest_lifts"
+REPEAT = 20
+N_EXERCISES = 150
+
+LEGACY_SQL = """
+    SELECT
+        u.id as user_id, u.username, u.avatar, u.level,
+        e.name as exercise_name,
+        ws.reps, ws.weight
+    FROM workout_sets ws
+    JOIN workout_sessions wses ON ws.session_id = wses.id
+    JOIN users u ON wses.user_id = u.id
+    JOIN exercises e ON ws.exercise_id = e.id
+    WHERE wses.date = %s
+      AND ws.is_saved = true
+      AND ws.exercise_id IN %s
+      AND u.gender = %s
+    ORDER BY ws.weight DESC
+    LIMIT 10
+"""
+
+
+def setup(cursor, n_users, days, sets_per_session):
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    # Scratch schema only, the index changes must not reach real tables
+    cursor.execute(f"SET search_path = {SCHEMA}")
+    cursor.execute("""
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY, username TEXT NOT NULL, avatar TEXT,
+            level INTEGER NOT NULL, gender TEXT
+        )
+    """)
+    cursor.execute("CREATE TABLE exercises (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    cursor.execute("""
+        CREATE TABLE workout_sessions (
+            id SERIAL PRIMARY KEY, user_id INTEGER NOT NULL, date DATE NOT NULL,
+            is_saved BOOLEAN NOT NULL DEFAULT TRUE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE workout_sets (
+            id SERIAL PRIMARY KEY, session_id INTEGER NOT NULL, exercise_id INTEGER NOT NULL,
+            reps INTEGER NOT NULL, weight REAL NOT NULL, is_saved BOOLEAN NOT NULL
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO users (id, username, avatar, level, gender)
+        SELECT i, 'user_' || i, NULL, 1 + i %% 50,
+               (ARRAY['male', 'female', 'other', NULL])[1 + i %% 4]
+        FROM generate_series(1, %s) i
+    """, (n_users,))
+    cursor.execute("""
+        INSERT INTO exercises (id, name)
+        SELECT i, 'exercise_' || i FROM generate_series(1, %s) i
+    """, (N_EXERCISES,))
+    # Every user trains on ~1 day in 3
+    cursor.execute("""
+        INSERT INTO workout_sessions (user_id, date)
+        SELECT u, CURRENT_DATE - d
+        FROM generate_series(1, %s) u, generate_series(0, %s - 1) d
+        WHERE (u + d) %% 3 = 0
+    """, (n_users, days))
+    # A third of the sets are one of the six board lifts
+    cursor.execute("""
+        INSERT INTO workout_sets (session_id, exercise_id, reps, weight, is_saved)
+        SELECT s.id,
+               CASE WHEN random() < 0.33
+                    THEN (ARRAY[11, 43, 117, 12, 57, 23])[1 + floor(random() * 6)::int]
+                    ELSE 1 + floor(random() * %s)::int END,
+               1 + floor(random() * 12)::int,
+               round((20 + random() * 200)::numeric, 1),
+               random() < 0.95
+        FROM workout_sessions s, generate_series(1, %s) n
+    """, (N_EXERCISES, sets_per_session))
+    # As created by muscle_groups.init_muscle_groups
+    cursor.execute("""
+        CREATE INDEX idx_workout_sessions_user_date
+        ON workout_sessions (user_id, date) INCLUDE (id, is_saved)
+    """)
+    cursor.execute("""
+        CREATE INDEX idx_workout_sets_session_exercise
+        ON workout_sets (session_id, exercise_id) INCLUDE (reps, weight, is_saved)
+    """)
+    cursor.execute("ANALYZE")
+    cursor.execute("SELECT COUNT(*) FROM workout_sets")
+    return cursor.fetchone()[0]
+
+
+def create_exercise_weight_index(cursor):
+    cursor.execute("""
+        CREATE INDEX idx_workout_sets_exercise_weight
+        ON workout_sets (exercise_id, weight DESC) INCLUDE (session_id, reps)
+        WHERE is_saved
+    """)
+    cursor.execute("ANALYZE")
+
+
+def six_queries(cursor, today):
+    heaviest = {}
+    for gender in landing_page.GENDERS:
+        heaviest[gender] = {}
+        for lift, exercise_ids in landing_page.HEAVIEST_EXERCISES.items():
+            cursor.execute(LEGACY_SQL, (today, tuple(exercise_ids), gender))
+            heaviest[gender][lift] = [dict(row) for row in cursor.fetchall()]
+    return heaviest
+
+
+def timed(fn):
+    timings = []
+    result = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def assert_same(expected, actual):
+    # Ties on weight may come back in either order, compare the weights
+    for gender, lifts in expected.items():
+        for lift, rows in lifts.items():
+            got = actual[gender][lift]
+            assert [r['weight'] for r in rows] == [r['weight'] for r in got], (gender, lift, rows, got)
+
+
+def run(cursor, label, today):
+    six_ms, expected = timed(lambda: six_queries(cursor, today))
+    ranked_ms, result = timed(lambda: landing_page._load_heaviest(cursor, today))
+    assert_same(expected, result)
+    print(f"{label:<18} six queries p50 {six_ms:8.2f} ms   ranked p50 {ranked_ms:8.2f} ms")
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    sets_per_session = int(sys.argv[3]) if len(sys.argv) > 3 else 15
+
+    conn = psycopg2.connect(get_database_url())
+    conn.autocommit = True
+    cursor = conn.cursor(cursor_factory=DictCursor)
+    try:
+        n_sets = setup(cursor, n_users, days, sets_per_session)
+        print(f"{n_users} users, {days} days, {n_sets} sets")
+        today = date.today()
+
+        run(cursor, "baseline", today)
+        create_exercise_weight_index(cursor)
+        run(cursor, "exercise/weight", today)
+        cursor.execute("DROP INDEX idx_workout_sets_exercise_weight")
+        landing_page.init_landing_page(cursor)
+        cursor.execute("ANALYZE")
+        run(cursor, "date", today)
+        create_exercise_weight_index(cursor)
+        run(cursor, "date + ex/weight", today)
+    finally:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.close()
+        conn.close()
@@ -0,0 +1,189 @@
+# bench_weekly_averages.py - weekly nutrition averages over 5 years of days
+#
+# Compares, on the same synthetic history:
+#   legacy  - sum every item per day in Python, then legacy_weekly_averages
+#   python  - legacy_weekly_averages over stored per-day totals
+#   sql     - food_log._load_period_averages (GROUP BY ISO week in PostgreSQL)
+#
+# Usage:
+#   DB_ENV=local python benchmarks/bench_weekly_averages.py [years] [items_per_day]
+#
+# The SQL run uses a scratch schema (bench_weekly_averages) that is dropped
+# at the end. Never point this at production.
+import os
+import sys
+import time
+import random
+import statistics
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+import food_log
+from db import get_database_url
+
+SCHEMA = "bench_weekly_averages"
+USER_ID = 1
+REPEAT = 20
+
+
+def make_history(years, items_per_day):
+    random.seed(42)
+    history = {}
+    day = date.today() - timedelta(days=365 * years)
+    while day <= date.today():
+        history[day.strftime("%Y-%m-%d")] = [
+            {column: random.uniform(0, 200) for column in food_log.TOTAL_COLUMNS}
+            for _ in range(items_per_day)
+        ]
+        day += timedelta(days=1)
+    return history
+
+
+def legacy_weekly_averages(daily_totals):
+    """
+    The Python weekly averages /history used before load_period_averages.
+    daily_totals: {date: totals tuple in food_log.TOTAL_COLUMNS order}
+    """
+    weekly_data = {}
+
+    for date_str, day_totals in daily_totals.items():
+        try:
+            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+            year, week_num, _ = date_obj.isocalendar()
+            week_key = f"{year}-W{week_num:02d}"
+
+            if week_key not in weekly_data:
+                weekly_data[week_key] = {
+                    "days": [],
+                    "calories": 0,
+                    "proteins": 0,
+                    "fats": 0,
+                    "carbs": 0,
+                    "sugars": 0,
+
+                    "salt": 0,
+                    "saturated": 0,
+                    "fiber": 0,
+                    "count": 0
+                }
+
+            calories, proteins, fats, carbs, sugars, salt, saturated, fiber = day_totals
+            weekly_data[week_key]["days"].append(date_str)
+            weekly_data[week_key]["calories"] += calories
+            weekly_data[week_key]["proteins"] += proteins
+            weekly_data[week_key]["fats"] += fats
+            weekly_data[week_key]["carbs"] += carbs
+            weekly_data[week_key]["sugars"] += sugars
+            weekly_data[week_key]["salt"] += salt
+            weekly_data[week_key]["saturated"] += saturated
+            weekly_data[week_key]["fiber"] += fiber
+            weekly_data[week_key]["count"] += 1
+
+        except Exception as e:
+            print(f"Error processing date {date_str}: {e}")
+            continue
+
+    result = []
+    for week_key, data in weekly_data.items():
+        count = data["count"]
+        if count > 0:
+            result.append({
+                "week": week_key,
+                "start_date": min(data["days"]),
+                "end_date": max(data["days"]),
+                "avg_calories": data["calories"] / count,
+                "avg_proteins": data["proteins"] / count,
+                "avg_fats": data["fats"] / count,
+                "avg_carbs": data["carbs"] / count,
+                "avg_sugars": data["sugars"] / count,
+                "avg_salt": data["salt"] / count,
+                "avg_saturated": data["saturated"] / count,
+                "avg_fiber": data["fiber"] / count
+            })
+
+    result.sort(key=lambda x: x["end_date"], reverse=True)
+    return result
+
+
+def daily_totals_from_items(history):
+    return {
+        day: tuple(sum(item[column] for item in items) for column in food_log.TOTAL_COLUMNS)
+        for day, items in history.items()
+    }
+
+
+def timed(fn):
+    timings = []
+    result = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def assert_same(expected, actual):
+    assert len(expected) == len(actual), (len(expected), len(actual))
+    for e, a in zip(expected, actual):
+        assert (e['week'], e['start_date'], e['end_date']) == (a['week'], a['start_date'], a['end_date']), (e, a)
+        for column in food_log.TOTAL_COLUMNS:
+            key = f"avg_{column}"
+            assert abs(e[key] - a[key]) < 1e-6, (e['week'], key, e[key], a[key])
+
+
+def bench_sql(totals):
+    conn = psycopg2.connect(get_database_url())
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(f"SET search_path = {SCHEMA}")
+        cursor.execute(f"""
+            CREATE TABLE daily_nutrition_totals (
+                user_id INTEGER NOT NULL, date TEXT NOT NULL,
+                {', '.join(f'{column} DOUBLE PRECISION NOT NULL' for column in food_log.TOTAL_COLUMNS)},
+                item_count INTEGER NOT NULL,
+                PRIMARY KEY (user_id, date)
+            )
+        """)
+        execute_values(cursor, f"""
+            INSERT INTO daily_nutrition_totals (user_id, date, {', '.join(food_log.TOTAL_COLUMNS)}, item_count)
+            VALUES %s
+        """, [(USER_ID, day) + values + (1,) for day, values in totals.items()])
+        cursor.execute("ANALYZE daily_nutrition_totals")
+
+        return timed(lambda: food_log._load_period_averages(cursor, USER_ID, 'week'))
+    finally:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    items_per_day = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    history = make_history(years, items_per_day)
+    totals = daily_totals_from_items(history)
+    print(f"{len(history)} days, {items_per_day} items per day")
+
+    legacy_ms, expected = timed(lambda: legacy_weekly_averages(daily_totals_from_items(history)))
+    python_ms, python_result = timed(lambda: legacy_weekly_averages(totals))
+    assert_same(expected, python_result)
+    print(f"legacy (items -> weeks)  p50 {legacy_ms:8.2f} ms")
+    print(f"python (totals -> weeks) p50 {python_ms:8.2f} ms")
+
+    try:
+        sql_ms, sql_result = bench_sql(totals)
+    except psycopg2.OperationalError as e:
+        print(f"sql                      skipped, no database: {e}")
+    else:
+        assert_same(expected, sql_result)
+        print(f"sql (GROUP BY ISO week)  p50 {sql_ms:8.2f} ms  (includes the round trip)")
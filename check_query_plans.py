@@ -0,0 +1,109 @@
+# check_query_plans.py - EXPLAIN regression check for the workout history queries
+#
+# Runs EXPLAIN on the muscle group detail query for a daily, weekly and
+# monthly period and fails (exit code 1) when workout_sessions, workout_sets
+# or exercises is read with a sequential scan, i.e. when the plan no longer
+# uses idx_workout_sessions_user_date / idx_workout_sets_session_exercise /
+# idx_exercises_muscle_group_id (see muscle_groups.py).
+#
+# Usage:
+#   DB_ENV=local python check_query_plans.py [--user ID] [--muscle-group NAME] [--planner-costs]
+#
+# By default sequential scans are disabled for the check: the planner then
+# still picks one only when no index can serve the predicate, which makes
+# the result independent of table sizes. --planner-costs checks the plan the
+# database would really choose with the current statistics.
+import argparse
+import json
+import sys
+from datetime import date, timedelta
+
+import psycopg2
+from dotenv import load_dotenv
+
+import workout_totals
+from db import get_database_url
+
+CHECKED_TABLES = {'workout_sessions', 'workout_sets', 'exercises'}
+
+
+def seq_scans(plan):
+    """Relation names read with a Seq Scan anywhere in an EXPLAIN JSON plan"""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in CHECKED_TABLES:
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when history queries fall back to sequential scans")
+    parser.add_argument("--user", type=int, help="user to plan for (default: the most active one)")
+    parser.add_argument("--muscle-group", help="muscle group name (default: the most used one)")
+    parser.add_argument("--planner-costs", action="store_true", help="keep enable_seqscan on")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = psycopg2.connect(get_database_url())
+    cursor = conn.cursor()
+    failures = 0
+    try:
+        user_id = args.user
+        if user_id is None:
+            cursor.execute('''
+                SELECT user_id FROM workout_sessions
+                GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1
+            ''')
+            row = cursor.fetchone()
+            user_id = row[0] if row else 0
+
+        if args.muscle_group:
+            cursor.execute('SELECT id FROM muscle_groups WHERE key = %s',
+                           (args.muscle_group.strip().lower(),))
+        else:
+            cursor.execute('''
+                SELECT muscle_group_id FROM exercises
+                WHERE muscle_group_id IS NOT NULL
+                GROUP BY muscle_group_id ORDER BY COUNT(*) DESC LIMIT 1
+            ''')
+        row = cursor.fetchone()
+        muscle_group_id = row[0] if row else 0
+
+        if not args.planner_costs:
+            cursor.execute('SET enable_seqscan = off')
+
+        today = date.today()
+        periods = {
+            'daily': workout_totals.period_bounds('daily', date_filter=today.isoformat()),
+            'weekly': workout_totals.period_bounds(
+                'weekly', week_start=(today - timedelta(days=today.weekday())).isoformat()),
+            'monthly': workout_totals.period_bounds('monthly', month_start=today.replace(day=1).isoformat()),
+        }
+        for period, (start, end) in periods.items():
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + workout_totals.MUSCLE_SETS_SQL, {
+                'user_id': user_id, 'start': start, 'end': end, 'muscle_group_id': muscle_group_id
+            })
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans = seq_scans(plan[0]['Plan'])
+            if scans:
+                failures += 1
+                print(f"FAIL {period}: sequential scan on {', '.join(sorted(set(scans)))}")
+                cursor.execute('EXPLAIN ' + workout_totals.MUSCLE_SETS_SQL, {
+                    'user_id': user_id, 'start': start, 'end': end, 'muscle_group_id': muscle_group_id
+                })
+                print('\n'.join('    ' + row[0] for row in cursor.fetchall()))
+            else:
+                print(f"ok   {period}")
+    finally:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
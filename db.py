@@ -0,0 +1,395 @@
+# db.py - Pooled PostgreSQL connections shared by app.py and smartwatch.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import psycopg2
+from psycopg2 import extensions
+from flask import g, has_request_context, current_app
+
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+# Every gunicorn worker process gets its own pool, so the worst case number of
+# server connections is WEB_CONCURRENCY * DB_POOL_MAX. Keep that below the
+# Neon connection limit.
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# One connection per gunicorn thread and per job worker thread (jobs.py) plus
+# headroom for the scheduler jobs
+DB_POOL_MAX = _env_int(
+    "DB_POOL_MAX", _env_int("GUNICORN_THREADS", 1) + _env_int("JOB_WORKER_THREADS", 1) + 2
+)
+DB_POOL_TIMEOUT = _env_float("DB_POOL_TIMEOUT", 10.0)            # seconds to wait for a free connection
+DB_POOL_MAX_LIFETIME = _env_float("DB_POOL_MAX_LIFETIME", 1800.0)  # recycle connections after this many seconds
+DB_POOL_HEALTH_CHECK_IDLE = _env_float("DB_POOL_HEALTH_CHECK_IDLE", 30.0)  # ping connections idle longer than this
+
+
+def get_database_url():
+    """
+    Returns the database URL.
+    Chooses local or Neon DB based on DB_ENV environment variable.
+    """
+    db_env = os.getenv("DB_ENV", "local").lower()  # default to local
+    if db_env == "neon":
+        database_url = os.getenv("NEON_DB_URL")
+    else:
+        database_url = os.getenv("LOCAL_DB_URL")
+
+    if not database_url:
+        raise ValueError(f"No database URL defined for DB_ENV={db_env}")
+    return database_url
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time."""
+
+
+class _PoolEntry:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+# ==============================================================================
+# CONNECTION POOL
+# ==============================================================================
+
+class ConnectionPool:
+    """
+    Thread-safe pool of autocommit psycopg2 connections.
+
+    Connections are checked for liveness when they have been idle for a while,
+    recycled after max_lifetime seconds and callers wait at most `timeout`
+    seconds for a free connection before PoolTimeout is raised.
+    """
+
+    def __init__(self, dsn, maxconn=DB_POOL_MAX,
+                 timeout=DB_POOL_TIMEOUT, max_lifetime=DB_POOL_MAX_LIFETIME,
+                 health_check_idle=DB_POOL_HEALTH_CHECK_IDLE):
+        self.dsn = dsn
+        self.maxconn = max(1, maxconn)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_idle = health_check_idle
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = []   # LIFO so hot connections are reused first
+        self._size = 0    # idle + checked out + being opened
+
+    def _connect(self):
+        print(f"Opening pooled database connection (pid {self.pid}): {self.dsn.split('@')[-1]}")
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        return _PoolEntry(conn)
+
+    def _expired(self, entry):
+        return (self.max_lifetime > 0
+                and time.monotonic() - entry.created_at > self.max_lifetime)
+
+    def _is_healthy(self, entry):
+        """Cheap liveness check, only pings connections that sat idle for a while"""
+        conn = entry.conn
+        if conn.closed or self._expired(entry):
+            return False
+        if time.monotonic() - entry.last_used < self.health_check_idle:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, entry):
+        try:
+            if not entry.conn.closed:
+                entry.conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def getconn(self):
+        """Check out a connection entry, waiting up to self.timeout seconds"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            entry = None
+            with self._cond:
+                while True:
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1  # reserve the slot, connect outside the lock
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"No database connection available within {self.timeout}s "
+                            f"(pool size {self.maxconn})"
+                        )
+                    self._cond.wait(remaining)
+
+            if entry is None:
+                try:
+                    return self._connect()
+                except Exception as e:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    print(f"Database connection failed: {e}")
+                    raise
+
+            if self._is_healthy(entry):
+                return entry
+            self._discard(entry)
+
+    def putconn(self, entry):
+        """Return a checked out entry to the pool, resetting its session state"""
+        conn = entry.conn
+        if os.getpid() != self.pid:
+            return  # forked copy, the parent owns the socket
+        if conn.closed or self._expired(entry):
+            self._discard(entry)
+            return
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if not conn.autocommit:
+                conn.autocommit = True
+        except psycopg2.Error:
+            self._discard(entry)
+            return
+
+        entry.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+
+class PooledConnection:
+    """
+    Proxy around a pooled psycopg2 connection.
+
+    Behaves like the raw connection, except close() hands it back to the pool.
+    Request-scoped connections ignore close() and are released at teardown.
+    """
+
+    def __init__(self, pool, entry, request_scoped=False):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_entry", entry)
+        object.__setattr__(self, "_request_scoped", request_scoped)
+        object.__setattr__(self, "_uow", None)
+
+    @property
+    def raw(self):
+        entry = self._entry
+        if entry is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return entry.conn
+
+    @property
+    def closed(self):
+        entry = self._entry
+        return 1 if entry is None else entry.conn.closed
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.raw, name, value)
+
+    def __enter__(self):
+        self.raw.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return self.raw.__exit__(exc_type, exc_value, tb)
+
+    def commit(self):
+        if self._uow is not None:
+            return  # the unit of work commits once when it ends
+        self.raw.commit()
+
+    def rollback(self):
+        if self._uow is not None:
+            self._uow.rollback_only = True
+            return
+        self.raw.rollback()
+
+    def close(self):
+        if self._request_scoped:
+            return  # released by release_request_connection()
+        self.release()
+
+    def release(self):
+        entry = self._entry
+        if entry is None:
+            return
+        object.__setattr__(self, "_entry", None)
+        self._pool.putconn(entry)
+
+    def __del__(self):
+        # Safety net for code paths that forget conn.close()
+        try:
+            self.release()
+        except Exception:
+            pass
+
+
+# ==============================================================================
+# PROCESS-WIDE POOL + REQUEST SCOPE
+# ==============================================================================
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return this process' pool, creating a fresh one after a fork"""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(get_database_url())
+        return _pool
+
+
+def get_db_connection():
+    """
+    Returns a pooled psycopg2 connection (autocommit).
+
+    Inside a Flask request the same checked-out connection is returned for the
+    whole request and conn.close() is a no-op; it goes back to the pool at
+    teardown. Outside a request conn.close() returns it to the pool.
+    """
+    if has_request_context():
+        conn = g.get("_db_conn")
+        if conn is None or conn.closed:
+            pool = get_pool()
+            conn = PooledConnection(pool, pool.getconn(), request_scoped=True)
+            g._db_conn = conn
+        return conn
+
+    pool = get_pool()
+    return PooledConnection(pool, pool.getconn())
+
+
+def release_request_connection(exc=None):
+    conn = g.pop("_db_conn", None)
+    if conn is not None:
+        conn.release()
+
+
+def init_app(app):
+    """Register the request teardown that returns the request connection"""
+    app.teardown_appcontext(release_request_connection)
+
+
+# ==============================================================================
+# UNIT OF WORK
+# ==============================================================================
+
+class UnitOfWork:
+    """One transaction on the request connection, committed once at the end."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rollback_only = False
+
+
+def current_unit_of_work():
+    """Return the active UnitOfWork of this request, or None"""
+    if not has_request_context():
+        return None
+    return g.get("_db_uow")
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Run the enclosed block as a single transaction on the request connection.
+
+    Helpers that call get_db_connection() inside the block join the
+    transaction automatically; their conn.commit() calls are deferred and
+    conn.rollback() marks the unit of work for rollback. Nested blocks join
+    the outer unit of work.
+
+        with unit_of_work() as conn:
+            items, _ = get_current_session(user_id, date)   # row is locked
+            ...
+            save_current_session(user_id, items, date)
+    """
+    if not has_request_context():
+        raise RuntimeError("unit_of_work() requires an active request")
+
+    outer = g.get("_db_uow")
+    if outer is not None:
+        yield outer.conn
+        return
+
+    conn = get_db_connection()
+    raw = conn.raw
+    uow = UnitOfWork(conn)
+    raw.autocommit = False
+    object.__setattr__(conn, "_uow", uow)
+    g._db_uow = uow
+    try:
+        yield conn
+        if uow.rollback_only:
+            raw.rollback()
+        else:
+            raw.commit()
+    except BaseException:
+        if not raw.closed:
+            raw.rollback()
+        raise
+    finally:
+        g.pop("_db_uow", None)
+        object.__setattr__(conn, "_uow", None)
+        if not raw.closed:
+            raw.autocommit = True
+
+
+def transactional(f):
+    """
+    Route decorator: run the whole view in one unit of work.
+
+    Error responses (status >= 400) are rolled back, everything else is
+    committed once after the view returns.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with unit_of_work():
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code >= 400:
+                g._db_uow.rollback_only = True
+            return response
+    return decorated_function
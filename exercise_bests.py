@@ -0,0 +1,194 @@
+# exercise_bests.py - Per-user, per-exercise bests for save_workout
+#
+# user_exercise_bests keeps, for every (user, exercise, focus_type):
+#   - the most recent saved session with that exercise: its last set,
+#     set count and volume (what save_workout compares against)
+#   - the heaviest set and the best volume set ever saved
+# save_workout reads the rows for all of a session's exercises in one query
+# and merges the session back in with one upsert, so PR detection no longer
+# depends on how much history the user has.
+#
+# Rows are a cache of workout_sets: a row whose last session was deleted,
+# unsaved or re-focused, or that points at the session being saved, is
+# rebuilt from history for just that exercise before it is used. Editing or
+# deleting a saved set calls rebuild() for its exercise, since the row's
+# last session / heaviest / best set may be the set that changed.
+
+LAST_COLUMNS = ('last_session_id', 'last_date', 'last_reps', 'last_weight',
+                'last_set_count', 'last_volume')
+HEAVIEST_COLUMNS = ('heaviest_weight', 'heaviest_reps')
+BEST_SET_COLUMNS = ('best_set_weight', 'best_set_reps')
+ALL_COLUMNS = LAST_COLUMNS + HEAVIEST_COLUMNS + BEST_SET_COLUMNS
+
+
+def init_exercise_bests(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_exercise_bests (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            exercise_id INTEGER NOT NULL,
+            focus_type TEXT NOT NULL,
+            last_session_id INTEGER NOT NULL,
+            last_date DATE NOT NULL,
+            last_reps INTEGER NOT NULL,
+            last_weight REAL NOT NULL,
+            last_set_count INTEGER NOT NULL,
+            last_volume REAL NOT NULL,
+            heaviest_weight REAL NOT NULL,
+            heaviest_reps INTEGER NOT NULL,
+            best_set_weight REAL NOT NULL,
+            best_set_reps INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, exercise_id, focus_type)
+        )
+    ''')
+
+    # One-off backfill when the table is introduced on an existing database
+    cursor.execute("SELECT to_regclass('workout_sets') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return
+    cursor.execute('SELECT 1 FROM user_exercise_bests LIMIT 1')
+    if cursor.fetchone() is None:
+        cursor.execute(_upsert_sql("TRUE", merge=False))
+        print(f"[INIT] Backfilled user_exercise_bests ({cursor.rowcount} rows)")
+
+
+def _upsert_sql(where_clause, merge):
+    """
+    Aggregate the saved sets matching where_clause (over ws / wset) into
+    user_exercise_bests rows. merge=True keeps whichever of the stored and new
+    values is the latest session / the heavier / the better set, merge=False
+    overwrites. RETURNING exercise_id + ALL_COLUMNS.
+    """
+    if merge:
+        # A stored last session that no longer qualifies never wins
+        newer = """(
+            (EXCLUDED.last_date, EXCLUDED.last_session_id) >= (b.last_date, b.last_session_id)
+            OR NOT EXISTS (
+                SELECT 1 FROM workout_sessions s
+                WHERE s.id = b.last_session_id AND s.is_saved AND s.focus_type = b.focus_type
+            )
+        )"""
+        heavier = "(EXCLUDED.heaviest_weight, EXCLUDED.heaviest_reps) > (b.heaviest_weight, b.heaviest_reps)"
+        better = ("(EXCLUDED.best_set_weight * EXCLUDED.best_set_reps, EXCLUDED.best_set_weight)"
+                  " > (b.best_set_weight * b.best_set_reps, b.best_set_weight)")
+        updates = [f"{c} = CASE WHEN {newer} THEN EXCLUDED.{c} ELSE b.{c} END" for c in LAST_COLUMNS]
+        updates += [f"{c} = CASE WHEN {heavier} THEN EXCLUDED.{c} ELSE b.{c} END" for c in HEAVIEST_COLUMNS]
+        updates += [f"{c} = CASE WHEN {better} THEN EXCLUDED.{c} ELSE b.{c} END" for c in BEST_SET_COLUMNS]
+    else:
+        updates = [f"{c} = EXCLUDED.{c}" for c in ALL_COLUMNS]
+    updates.append("updated_at = NOW()")
+
+    key = "user_id, exercise_id, focus_type"
+    return f'''
+        WITH saved AS (
+            SELECT ws.user_id, wset.exercise_id, ws.focus_type, ws.id AS session_id, ws.date,
+                   wset.id AS set_id, wset.reps, wset.weight
+            FROM workout_sessions ws
+            JOIN workout_sets wset ON wset.session_id = ws.id
+            WHERE ws.is_saved AND wset.is_saved AND ws.focus_type IS NOT NULL
+              AND {where_clause}
+        ),
+        last_session AS (
+            SELECT DISTINCT ON ({key}) {key}, session_id, date
+            FROM saved
+            ORDER BY {key}, date DESC, session_id DESC
+        ),
+        last_stats AS (
+            SELECT s.user_id, s.exercise_id, s.focus_type,
+                   COUNT(*) AS set_count,
+                   SUM(s.reps * s.weight) AS volume,
+                   (ARRAY_AGG(s.reps ORDER BY s.set_id DESC))[1] AS reps,
+                   (ARRAY_AGG(s.weight ORDER BY s.set_id DESC))[1] AS weight
+            FROM saved s
+            JOIN last_session l USING ({key}, session_id)
+            GROUP BY s.user_id, s.exercise_id, s.focus_type
+        ),
+        heaviest AS (
+            SELECT DISTINCT ON ({key}) {key}, weight, reps
+            FROM saved
+            ORDER BY {key}, weight DESC, reps DESC
+        ),
+        best_set AS (
+            SELECT DISTINCT ON ({key}) {key}, weight, reps
+            FROM saved
+            ORDER BY {key}, reps * weight DESC, weight DESC
+        )
+        INSERT INTO user_exercise_bests AS b ({key}, {', '.join(ALL_COLUMNS)})
+        SELECT l.user_id, l.exercise_id, l.focus_type,
+               l.session_id, l.date, st.reps, st.weight, st.set_count, st.volume,
+               h.weight, h.reps, bs.weight, bs.reps
+        FROM last_session l
+        JOIN last_stats st USING ({key})
+        JOIN heaviest h USING ({key})
+        JOIN best_set bs USING ({key})
+        ON CONFLICT ({key}) DO UPDATE SET {', '.join(updates)}
+        RETURNING exercise_id, {', '.join(ALL_COLUMNS)}
+    '''
+
+
+def _as_dict(row):
+    return dict(zip(ALL_COLUMNS, row))
+
+
+def _rebuild(cursor, user_id, focus_type, exercise_ids, exclude_session_id=None):
+    """Recompute rows from history, leaving out exclude_session_id"""
+    cursor.execute('''
+        DELETE FROM user_exercise_bests
+        WHERE user_id = %s AND focus_type = %s AND exercise_id = ANY(%s)
+    ''', (user_id, focus_type, exercise_ids))
+    cursor.execute(_upsert_sql(
+        "ws.user_id = %s AND ws.focus_type = %s AND wset.exercise_id = ANY(%s)"
+        " AND ws.id IS DISTINCT FROM %s",
+        merge=False
+    ), (user_id, focus_type, exercise_ids, exclude_session_id))
+    return {row[0]: _as_dict(row[1:]) for row in cursor.fetchall()}
+
+
+def rebuild(cursor, user_id, focus_type, exercise_ids):
+    """Recompute rows from all saved history (after editing / deleting saved sets)"""
+    exercise_ids = list(exercise_ids)
+    if focus_type is None or not exercise_ids:
+        return
+    _rebuild(cursor, user_id, focus_type, exercise_ids)
+
+
+def load_for_session(cursor, user_id, focus_type, session_id, exercise_ids):
+    """
+    Names and previous bests for every exercise of a session being saved:
+    {exercise_id: {'name': str or None, 'previous': dict or None}}. previous
+    holds ALL_COLUMNS for the latest other saved session with the same
+    focus_type, None when the exercise is new for this focus.
+    """
+    exercise_ids = list(exercise_ids)
+    if not exercise_ids:
+        return {}
+
+    cursor.execute(f'''
+        SELECT ids.exercise_id, e.name, b.exercise_id IS NOT NULL,
+               b.last_session_id != %s AND s.id IS NOT NULL,
+               {', '.join(f"b.{c}" for c in ALL_COLUMNS)}
+        FROM unnest(%s::int[]) AS ids(exercise_id)
+        LEFT JOIN exercises e ON e.id = ids.exercise_id
+        LEFT JOIN user_exercise_bests b
+               ON b.user_id = %s AND b.focus_type = %s AND b.exercise_id = ids.exercise_id
+        LEFT JOIN workout_sessions s
+               ON s.id = b.last_session_id AND s.is_saved AND s.focus_type = b.focus_type
+    ''', (session_id, exercise_ids, user_id, focus_type))
+
+    result, stale = {}, []
+    for row in cursor.fetchall():
+        exercise_id, name, has_row, is_valid = row[:4]
+        result[exercise_id] = {'name': name, 'previous': _as_dict(row[4:]) if is_valid else None}
+        if has_row and not is_valid:
+            stale.append(exercise_id)
+
+    if stale and focus_type is not None:
+        rebuilt = _rebuild(cursor, user_id, focus_type, stale, session_id)
+        for exercise_id in stale:
+            result[exercise_id]['previous'] = rebuilt.get(exercise_id)
+    return result
+
+
+def record_session(cursor, session_id):
+    """Merge a just-saved session's sets into user_exercise_bests"""
+    cursor.execute(_upsert_sql("ws.id = %s", merge=True), (session_id,))
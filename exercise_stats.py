@@ -0,0 +1,240 @@
+# exercise_stats.py - Per-user exercise statistics for /workout/exercises
+#
+# user_exercise_monthly_stats keeps one row per (user, exercise, month) with
+# the set count, volume, heaviest weight and last performed date of that
+# user's sets. The exercise list sums a user's rows instead of scanning
+# workout_sets, so its cost depends on that user's history only.
+#
+# Rows are maintained by the routes that write sets:
+#   - record_sets() adds freshly inserted sets to their month
+#   - refresh() recomputes whole months from workout_sets after sets were
+#     deleted or edited (a MAX can't be decremented)
+#
+# load_exercise_history() serves the detail view of one exercise
+# (/workout/exercise/<id>) with a single query, paginated by date.
+
+
+def init_exercise_stats(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_exercise_monthly_stats (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            exercise_id INTEGER NOT NULL,
+            month DATE NOT NULL,
+            set_count INTEGER NOT NULL,
+            volume DOUBLE PRECISION NOT NULL,
+            best_weight REAL NOT NULL,
+            last_performed DATE NOT NULL,
+            PRIMARY KEY (user_id, exercise_id, month)
+        )
+    ''')
+
+    # One-off backfill when the table is introduced on an existing database
+    cursor.execute("SELECT to_regclass('workout_sets') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return
+    cursor.execute('SELECT 1 FROM user_exercise_monthly_stats LIMIT 1')
+    if cursor.fetchone() is None:
+        cursor.execute(_REFRESH_SQL.format(where="TRUE", stale_where="FALSE"))
+        print(f"[INIT] Backfilled user_exercise_monthly_stats ({cursor.rowcount} rows)")
+
+
+# Recompute the months matching {where} (over s = workout_sessions and
+# ws = workout_sets) and drop the rows matching {stale_where} that no longer
+# have sets
+_REFRESH_SQL = '''
+    WITH fresh AS (
+        SELECT s.user_id, ws.exercise_id, date_trunc('month', s.date)::date AS month,
+               COUNT(*) AS set_count,
+               SUM(ws.volume) AS volume,
+               MAX(ws.weight) AS best_weight,
+               MAX(s.date) AS last_performed
+        FROM workout_sessions s
+        JOIN workout_sets ws ON ws.session_id = s.id
+        WHERE {where}
+        GROUP BY s.user_id, ws.exercise_id, date_trunc('month', s.date)
+    ),
+    gone AS (
+        DELETE FROM user_exercise_monthly_stats st
+        WHERE {stale_where}
+          AND NOT EXISTS (
+              SELECT 1 FROM fresh f
+              WHERE f.user_id = st.user_id AND f.exercise_id = st.exercise_id AND f.month = st.month
+          )
+    )
+    INSERT INTO user_exercise_monthly_stats AS st
+        (user_id, exercise_id, month, set_count, volume, best_weight, last_performed)
+    SELECT user_id, exercise_id, month, set_count, volume, best_weight, last_performed
+    FROM fresh
+    ON CONFLICT (user_id, exercise_id, month) DO UPDATE SET
+        set_count = EXCLUDED.set_count,
+        volume = EXCLUDED.volume,
+        best_weight = EXCLUDED.best_weight,
+        last_performed = EXCLUDED.last_performed
+'''
+
+
+def record_sets(cursor, user_id, date, sets):
+    """Add newly inserted sets, [(exercise_id, reps, weight), ...] on date"""
+    if not sets:
+        return
+    exercise_ids, reps, weights = (list(column) for column in zip(*sets))
+    cursor.execute('''
+        INSERT INTO user_exercise_monthly_stats AS st
+            (user_id, exercise_id, month, set_count, volume, best_weight, last_performed)
+        SELECT %s, exercise_id, date_trunc('month', %s::date)::date,
+               COUNT(*), SUM(reps * weight), MAX(weight), %s::date
+        FROM unnest(%s::int[], %s::int[], %s::real[]) AS s(exercise_id, reps, weight)
+        GROUP BY exercise_id
+        ON CONFLICT (user_id, exercise_id, month) DO UPDATE SET
+            set_count = st.set_count + EXCLUDED.set_count,
+            volume = st.volume + EXCLUDED.volume,
+            best_weight = GREATEST(st.best_weight, EXCLUDED.best_weight),
+            last_performed = GREATEST(st.last_performed, EXCLUDED.last_performed)
+    ''', (user_id, date, date, exercise_ids, reps, weights))
+
+
+def refresh(cursor, user_id, date, exercise_ids=None):
+    """Recompute the user's month containing date, optionally for some exercises only"""
+    where = "s.user_id = %s AND s.date >= date_trunc('month', %s::date) " \
+            "AND s.date < date_trunc('month', %s::date) + INTERVAL '1 month'"
+    stale_where = "st.user_id = %s AND st.month = date_trunc('month', %s::date)::date"
+    params = [user_id, date, date]
+    stale_params = [user_id, date]
+    if exercise_ids is not None:
+        where += " AND ws.exercise_id = ANY(%s)"
+        stale_where += " AND st.exercise_id = ANY(%s)"
+        params.append(list(exercise_ids))
+        stale_params.append(list(exercise_ids))
+    cursor.execute(_REFRESH_SQL.format(where=where, stale_where=stale_where), params + stale_params)
+
+
+def load_exercise_list(cursor, user_id):
+    """
+    Every exercise with the user's personal best, last performed date, total
+    volume and month-over-month volume trend (percent)
+    """
+    cursor.execute('''
+        WITH stats AS (
+            SELECT exercise_id,
+                   MAX(best_weight) AS personal_best,
+                   MAX(last_performed) AS last_performed,
+                   SUM(volume) AS total_volume,
+                   SUM(volume) FILTER (
+                       WHERE month = date_trunc('month', CURRENT_DATE)::date
+                   ) AS current_month_volume,
+                   SUM(volume) FILTER (
+                       WHERE month = (date_trunc('month', CURRENT_DATE) - INTERVAL '1 month')::date
+                   ) AS previous_month_volume
+            FROM user_exercise_monthly_stats
+            WHERE user_id = %s
+            GROUP BY exercise_id
+        )
+        SELECT e.id, e.name, e.muscle_group,
+               COALESCE(st.personal_best, 0) AS personal_best,
+               st.last_performed,
+               COALESCE(st.total_volume, 0) AS total_volume,
+               CASE
+                   WHEN st.previous_month_volume > 0
+                   THEN ((COALESCE(st.current_month_volume, 0) - st.previous_month_volume)
+                         / st.previous_month_volume) * 100
+                   ELSE 0
+               END AS volume_trend
+        FROM exercises e
+        LEFT JOIN stats st ON st.exercise_id = e.id
+        ORDER BY e.name
+    ''', (user_id,))
+    return cursor.fetchall()
+
+
+HISTORY_PAGE_SIZE = 60
+
+# Summary and one page of per-day history from one scan of the user's sets
+# for the exercise (the sets CTE is materialized once). Returns one row per
+# page day, newest first, or a single row with a NULL date when the page is
+# empty; no rows for an unknown exercise.
+_HISTORY_SQL = '''
+    WITH sets AS (
+        SELECT s.date, ws.reps, ws.weight, ws.volume
+        FROM workout_sets ws
+        JOIN workout_sessions s ON ws.session_id = s.id
+        WHERE s.user_id = %(user_id)s AND ws.exercise_id = %(exercise_id)s
+    ),
+    days AS (
+        SELECT date,
+               COUNT(*) AS sets,
+               MAX(weight) AS best_weight,
+               (ARRAY_AGG(weight || 'kg × ' || reps ORDER BY weight DESC, reps DESC))[1] AS best_set,
+               SUM(volume) AS volume
+        FROM sets
+        GROUP BY date
+    ),
+    best_set AS (
+        SELECT weight, reps
+        FROM sets
+        ORDER BY volume DESC
+        LIMIT 1
+    ),
+    summary AS (
+        SELECT MAX(best_weight) AS personal_best,
+               SUM(volume) FILTER (
+                   WHERE date >= date_trunc('month', CURRENT_DATE)
+                     AND date < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
+               ) AS monthly_volume
+        FROM days
+    ),
+    page AS (
+        SELECT date, sets, best_weight, best_set, volume
+        FROM days
+        WHERE %(before)s::date IS NULL OR date < %(before)s::date
+        ORDER BY date DESC
+        LIMIT %(limit)s + 1
+    )
+    SELECT e.name, sm.personal_best, sm.monthly_volume, b.weight AS best_set_weight,
+           b.reps AS best_set_reps, p.date, p.sets, p.best_weight, p.best_set, p.volume
+    FROM exercises e
+    CROSS JOIN summary sm
+    LEFT JOIN best_set b ON TRUE
+    LEFT JOIN page p ON TRUE
+    WHERE e.id = %(exercise_id)s
+    ORDER BY p.date DESC NULLS LAST
+'''
+
+
+def load_exercise_history(cursor, user_id, exercise_id, before=None, limit=HISTORY_PAGE_SIZE):
+    """
+    Detail view of one exercise for a user: name, personal best, current
+    month volume, best set ever and the per-day history older than `before`,
+    newest first, at most `limit` days. 'next_before' is the cursor for the
+    next page (None on the last one). Returns None for an unknown exercise.
+    """
+    cursor.execute(_HISTORY_SQL, {
+        'user_id': user_id, 'exercise_id': exercise_id, 'before': before, 'limit': limit
+    })
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+
+    first = rows[0]
+    days = [row for row in rows if row['date'] is not None]
+    has_more = len(days) > limit
+    days = days[:limit]
+
+    best_weight, best_reps = first['best_set_weight'], first['best_set_reps']
+    return {
+        'name': first['name'],
+        'personal_best': float(first['personal_best'] or 0),
+        'monthly_volume': float(first['monthly_volume'] or 0),
+        'best_set': {
+            'weight': float(best_weight) if best_weight is not None else 0,
+            'reps': int(best_reps) if best_reps is not None else 0,
+            'formatted': f"{best_weight}kg × {best_reps}" if best_weight is not None else '-'
+        },
+        'history': [{
+            'date': row['date'].strftime('%Y-%m-%d'),
+            'sets': row['sets'],
+            'best_weight': float(row['best_weight'] or 0),
+            'best_set': row['best_set'] or '-',
+            'volume': float(row['volume'] or 0)
+        } for row in days],
+        'next_before': days[-1]['date'].strftime('%Y-%m-%d') if has_more else None
+    }
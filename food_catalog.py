@@ -0,0 +1,204 @@
+# food_catalog.py - Per-worker in-memory index of the foods table
+#
+# Food rows almost never change but are looked up on every log / grams edit,
+# so each worker keeps a compact copy keyed by normalized key, plus name and
+# EAN indexes. A row-level trigger on foods appends the changed key to
+# food_changes; workers poll that log (at most every CHECK_INTERVAL seconds)
+# and reload only the keys that changed since their last version.
+import os
+import threading
+import time
+
+from db import get_db_connection
+
+FOOD_COLUMNS = (
+    'key', 'name', 'carbs', 'sugars', 'fiber', 'proteins', 'fats', 'saturated',
+    'salt', 'calories', 'grams', 'half', 'entire', 'serving', 'bigserving',
+    'ean', 'owner_id'
+)
+_SELECT_FOODS = f"SELECT {', '.join(FOOD_COLUMNS)} FROM foods"
+
+CHECK_INTERVAL = float(os.getenv("FOOD_CATALOG_CHECK_INTERVAL", 5))
+FULL_RELOAD_INTERVAL = float(os.getenv("FOOD_CATALOG_FULL_RELOAD_INTERVAL", 3600))
+MAX_INCREMENTAL_CHANGES = 5000
+# Re-read a few already seen versions, a slower transaction can commit a
+# lower sequence value after a higher one was read
+VERSION_OVERLAP = 50
+
+
+class FoodRecord:
+    __slots__ = FOOD_COLUMNS
+
+    def __init__(self, row):
+        for column, value in zip(FOOD_COLUMNS, row):
+            setattr(self, column, value)
+
+    def to_dict(self):
+        return {column: getattr(self, column) for column in FOOD_COLUMNS}
+
+
+def init_food_catalog(cursor):
+    """Change log + trigger used to invalidate the worker catalogs"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS food_changes (
+            version BIGSERIAL PRIMARY KEY,
+            food_key TEXT NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION log_food_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO food_changes (food_key) VALUES (OLD.key);
+                RETURN OLD;
+            END IF;
+            IF TG_OP = 'UPDATE' AND OLD.key IS DISTINCT FROM NEW.key THEN
+                INSERT INTO food_changes (food_key) VALUES (OLD.key);
+            END IF;
+            INSERT INTO food_changes (food_key) VALUES (NEW.key);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute('DROP TRIGGER IF EXISTS foods_change_log ON foods')
+    cursor.execute('''
+        CREATE TRIGGER foods_change_log
+        AFTER INSERT OR UPDATE OR DELETE ON foods
+        FOR EACH ROW EXECUTE FUNCTION log_food_change()
+    ''')
+    # Workers do a full reload at least every FULL_RELOAD_INTERVAL, old
+    # entries are never needed
+    cursor.execute("DELETE FROM food_changes WHERE changed_at < NOW() - INTERVAL '7 days'")
+
+
+class FoodCatalog:
+    """Lazily loaded, incrementally refreshed food index for one worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_key = {}
+        self._by_lower_key = {}
+        self._by_name = {}
+        self._by_ean = {}
+        self.version = None        # last food_changes.version applied
+        self._seen_versions = set()  # versions inside the overlap window
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    # ---- index maintenance -------------------------------------------------
+
+    def _index(self, record):
+        self._by_key[record.key] = record
+        self._by_lower_key.setdefault(record.key.lower(), record)
+        if record.name:
+            self._by_name.setdefault(record.name.lower(), record)
+        if record.ean:
+            self._by_ean[record.ean] = record
+
+    def _unindex(self, key):
+        record = self._by_key.pop(key, None)
+        if record is None:
+            return
+        if self._by_lower_key.get(key.lower()) is record:
+            del self._by_lower_key[key.lower()]
+        if record.name and self._by_name.get(record.name.lower()) is record:
+            del self._by_name[record.name.lower()]
+        if record.ean and self._by_ean.get(record.ean) is record:
+            del self._by_ean[record.ean]
+
+    def _full_load(self, cursor):
+        cursor.execute('SELECT COALESCE(MAX(version), 0) FROM food_changes')
+        version = cursor.fetchone()[0]
+        cursor.execute(_SELECT_FOODS)
+        self._by_key, self._by_lower_key, self._by_name, self._by_ean = {}, {}, {}, {}
+        for row in cursor.fetchall():
+            self._index(FoodRecord(row))
+        self.version = version
+        self._seen_versions = set()
+        self._loaded_at = time.monotonic()
+        print(f"[FOOD CATALOG] Loaded {len(self._by_key)} foods (version {version})")
+
+    def _apply_changes(self, cursor):
+        cursor.execute('''
+            SELECT version, food_key FROM food_changes
+            WHERE version > %s
+            ORDER BY version
+            LIMIT %s
+        ''', (self.version - VERSION_OVERLAP, MAX_INCREMENTAL_CHANGES))
+        changes = cursor.fetchall()
+        if len(changes) >= MAX_INCREMENTAL_CHANGES:
+            self._full_load(cursor)
+            return
+        unseen = [(version, food_key) for version, food_key in changes
+                  if version not in self._seen_versions]
+        self._seen_versions = {version for version, _ in changes}
+        if not unseen:
+            return
+
+        keys = list({food_key for _, food_key in unseen})
+        cursor.execute(f"{_SELECT_FOODS} WHERE key = ANY(%s)", (keys,))
+        rows = cursor.fetchall()
+        for key in keys:
+            self._unindex(key)
+        for row in rows:
+            self._index(FoodRecord(row))
+        self.version = max(self.version, changes[-1][0])
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self.version is not None and now - self._checked_at < CHECK_INTERVAL:
+            return
+        with self._lock:
+            if self.version is not None and now - self._checked_at < CHECK_INTERVAL:
+                return
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            try:
+                if self.version is None or now - self._loaded_at > FULL_RELOAD_INTERVAL:
+                    self._full_load(cursor)
+                else:
+                    self._apply_changes(cursor)
+                self._checked_at = time.monotonic()
+            finally:
+                cursor.close()
+                conn.close()
+
+    # ---- public API --------------------------------------------------------
+
+    def invalidate(self):
+        """Check the change log on the next lookup (call after writing foods)"""
+        self._checked_at = 0.0
+
+    def put(self, food):
+        """Add a food dict fetched straight from the database"""
+        with self._lock:
+            if self.version is None:
+                return
+            self._unindex(food['key'])
+            self._index(FoodRecord([food.get(column) for column in FOOD_COLUMNS]))
+
+    def get(self, key):
+        """Exact key lookup, returns a fresh dict or None"""
+        self._refresh()
+        record = self._by_key.get(key)
+        return record.to_dict() if record else None
+
+    def lookup(self, normalized_key):
+        """
+        Same resolution order as the old SQL lookups: exact key,
+        case-insensitive key, then case-insensitive name.
+        """
+        self._refresh()
+        record = (self._by_key.get(normalized_key)
+                  or self._by_lower_key.get(normalized_key.lower())
+                  or self._by_name.get(normalized_key.lower()))
+        return record.to_dict() if record else None
+
+    def get_by_ean(self, ean):
+        self._refresh()
+        record = self._by_ean.get(ean)
+        return record.to_dict() if record else None
+
+
+food_catalog = FoodCatalog()
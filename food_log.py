@@ -0,0 +1,471 @@
+# food_log.py - Row-per-item storage for the food diary
+#
+# Each eaten item is one row in food_log_items, so logging, editing or
+# deleting an item is a single-row INSERT / UPDATE / DELETE instead of
+# rewriting the whole day's JSON blob in user_sessions. Items are still
+# handed to the routes as the same dicts the blob format used.
+import json
+import uuid
+
+from psycopg2.extras import execute_values
+
+from db import get_db_connection
+
+# (item dict key, column)
+ITEM_FIELDS = (
+    ('id', 'item_id'),
+    ('name', 'name'),
+    ('key', 'food_key'),
+    ('grams', 'grams'),
+    ('units', 'units'),
+    ('unit_type', 'unit_type'),
+    ('carbs', 'carbs'),
+    ('sugars', 'sugars'),
+    ('fiber', 'fiber'),
+    ('proteins', 'proteins'),
+    ('fats', 'fats'),
+    ('saturated', 'saturated'),
+    ('salt', 'salt'),
+    ('calories', 'calories'),
+    ('group', 'meal_group'),
+)
+ITEM_KEYS = {key for key, _ in ITEM_FIELDS}
+# Template items never had units / unit_type, leave them out when missing
+OPTIONAL_KEYS = {'units', 'unit_type'}
+
+_COLUMNS = ', '.join(column for _, column in ITEM_FIELDS)
+_SELECT_ITEMS = f"SELECT {_COLUMNS}, extra FROM food_log_items"
+
+MIGRATION_BATCH = 500
+
+# Order of the totals tuples returned by load_daily_totals()
+TOTAL_COLUMNS = ('calories', 'proteins', 'fats', 'carbs', 'sugars', 'salt', 'saturated', 'fiber')
+EMPTY_DAY_TOTALS = (0.0,) * len(TOTAL_COLUMNS)
+_TOTAL_COLUMNS_SQL = ', '.join(TOTAL_COLUMNS)
+_TOTAL_SUMS_SQL = ', '.join(f"COALESCE(SUM({column}), 0)" for column in TOTAL_COLUMNS)
+
+
+def init_food_log(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS food_log_items (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            date TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            position BIGSERIAL,
+            name TEXT,
+            food_key TEXT,
+            grams DOUBLE PRECISION,
+            units DOUBLE PRECISION,
+            unit_type TEXT,
+            carbs DOUBLE PRECISION NOT NULL DEFAULT 0,
+            sugars DOUBLE PRECISION NOT NULL DEFAULT 0,
+            fiber DOUBLE PRECISION NOT NULL DEFAULT 0,
+            proteins DOUBLE PRECISION NOT NULL DEFAULT 0,
+            fats DOUBLE PRECISION NOT NULL DEFAULT 0,
+            saturated DOUBLE PRECISION NOT NULL DEFAULT 0,
+            salt DOUBLE PRECISION NOT NULL DEFAULT 0,
+            calories DOUBLE PRECISION NOT NULL DEFAULT 0,
+            meal_group TEXT,
+            extra JSONB,  -- any other keys the item dict carried
+            PRIMARY KEY (user_id, date, item_id)
+        )
+    ''')
+
+    # Per-day rollup, refreshed by every write below
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_nutrition_totals (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            date TEXT NOT NULL,
+            calories DOUBLE PRECISION NOT NULL DEFAULT 0,
+            proteins DOUBLE PRECISION NOT NULL DEFAULT 0,
+            fats DOUBLE PRECISION NOT NULL DEFAULT 0,
+            carbs DOUBLE PRECISION NOT NULL DEFAULT 0,
+            sugars DOUBLE PRECISION NOT NULL DEFAULT 0,
+            salt DOUBLE PRECISION NOT NULL DEFAULT 0,
+            saturated DOUBLE PRECISION NOT NULL DEFAULT 0,
+            fiber DOUBLE PRECISION NOT NULL DEFAULT 0,
+            item_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, date)
+        )
+    ''')
+
+    # One-off backfill when the rollup is introduced on an existing database
+    cursor.execute('SELECT 1 FROM daily_nutrition_totals LIMIT 1')
+    if cursor.fetchone() is None:
+        cursor.execute(f'''
+            INSERT INTO daily_nutrition_totals (user_id, date, {_TOTAL_COLUMNS_SQL}, item_count)
+            SELECT user_id, date, {_TOTAL_SUMS_SQL}, COUNT(*)
+            FROM food_log_items
+            GROUP BY user_id, date
+            ON CONFLICT (user_id, date) DO NOTHING
+        ''')
+
+
+def _item_to_row(user_id, date, item):
+    row = [user_id, date]
+    for key, column in ITEM_FIELDS:
+        value = item.get(key)
+        if key == 'id' and not value:
+            value = str(uuid.uuid4())
+        elif column in ('carbs', 'sugars', 'fiber', 'proteins', 'fats', 'saturated', 'salt', 'calories'):
+            value = value or 0.0
+        row.append(value)
+    extra = {k: v for k, v in item.items() if k not in ITEM_KEYS}
+    row.append(json.dumps(extra) if extra else None)
+    return row
+
+
+def _row_to_item(row):
+    item = {}
+    for (key, _), value in zip(ITEM_FIELDS, row):
+        if value is None and key in OPTIONAL_KEYS:
+            continue
+        item[key] = value
+    extra = row[len(ITEM_FIELDS)]
+    if extra:
+        item.update(extra)
+    return item
+
+
+def refresh_daily_totals(cursor, days):
+    """
+    Recompute daily_nutrition_totals for the given (user_id, date) pairs from
+    their rows. Runs on the writer's cursor so it joins the same transaction.
+    """
+    days = list(set(days))
+    if not days:
+        return
+    updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in TOTAL_COLUMNS)
+    execute_values(cursor, f'''
+        INSERT INTO daily_nutrition_totals (user_id, date, {_TOTAL_COLUMNS_SQL}, item_count)
+        SELECT d.user_id, d.date, {', '.join(f"COALESCE(SUM(i.{column}), 0)" for column in TOTAL_COLUMNS)},
+               COUNT(i.item_id)
+        FROM (VALUES %s) AS d(user_id, date)
+        LEFT JOIN food_log_items i ON i.user_id = d.user_id AND i.date = d.date
+        GROUP BY d.user_id, d.date
+        ON CONFLICT (user_id, date) DO UPDATE SET {updates}, item_count = EXCLUDED.item_count
+    ''', days, template="(%s::integer, %s::text)")
+
+
+# ==============================================================================
+# READS
+# ==============================================================================
+
+def load_day_items(user_id, date):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''
+            {_SELECT_ITEMS}
+            WHERE user_id = %s AND date = %s
+            ORDER BY position
+        ''', (user_id, date))
+        return [_row_to_item(row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def load_item(user_id, date, item_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''
+            {_SELECT_ITEMS}
+            WHERE user_id = %s AND date = %s AND item_id = %s
+        ''', (user_id, date, item_id))
+        row = cursor.fetchone()
+        return _row_to_item(row) if row else None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _date_range_clause(start, end):
+    """SQL + params for an optional inclusive date range ('YYYY-MM-DD' strings sort correctly)"""
+    clause, params = "", []
+    if start:
+        clause += " AND date >= %s"
+        params.append(str(start))
+    if end:
+        clause += " AND date <= %s"
+        params.append(str(end))
+    return clause, params
+
+
+def load_daily_totals(user_id, start=None, end=None):
+    """{date: (calories, proteins, fats, carbs, sugars, salt, saturated, fiber)} for logged days"""
+    range_clause, range_params = _date_range_clause(start, end)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''
+            SELECT date, {_TOTAL_COLUMNS_SQL}
+            FROM daily_nutrition_totals
+            WHERE user_id = %s AND item_count > 0{range_clause}
+        ''', [user_id] + range_params)
+        return {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def has_days_before(user_id, date):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            SELECT EXISTS (
+                SELECT 1 FROM daily_nutrition_totals
+                WHERE user_id = %s AND date < %s AND item_count > 0
+            )
+        ''', (user_id, str(date)))
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# ISO week key ("2024-W05") and calendar month
+PERIOD_FORMATS = {
+    'week': 'IYYY-"W"IW',
+    'month': 'YYYY-MM',
+}
+
+
+def _load_period_averages(cursor, user_id, period='week', start=None, end=None):
+    range_clause, range_params = _date_range_clause(start, end)
+    averages = ', '.join(f"AVG({column}) AS avg_{column}" for column in TOTAL_COLUMNS)
+    cursor.execute(f'''
+        SELECT to_char(date::date, %s) AS period,
+               MIN(date) AS start_date,
+               MAX(date) AS end_date,
+               {averages}
+        FROM daily_nutrition_totals
+        WHERE user_id = %s
+          AND item_count > 0
+          AND date ~ '^[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}}$'{range_clause}
+        GROUP BY period
+        ORDER BY end_date DESC
+    ''', [PERIOD_FORMATS[period], user_id] + range_params)
+    columns = [period, 'start_date', 'end_date'] + [f"avg_{column}" for column in TOTAL_COLUMNS]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def load_period_averages(user_id, period='week', start=None, end=None):
+    """
+    Weekly or monthly averages of the logged days, aggregated in the
+    database from daily_nutrition_totals, newest period first:
+    [{'week' (or 'month'), 'start_date', 'end_date', 'avg_<column>' ...}]
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        return _load_period_averages(cursor, user_id, period, start, end)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# ==============================================================================
+# DELTA WRITES
+# ==============================================================================
+
+def add_items(user_id, date, items):
+    """Append items to the end of the day"""
+    if not items:
+        return
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        execute_values(cursor, f'''
+            INSERT INTO food_log_items (user_id, date, {_COLUMNS}, extra)
+            VALUES %s
+        ''', [_item_to_row(user_id, date, item) for item in items])
+        refresh_daily_totals(cursor, [(user_id, date)])
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def update_item(user_id, date, item):
+    """Rewrite one item's values in place (keeps its position)"""
+    row = _item_to_row(user_id, date, item)
+    assignments = ', '.join(f"{column} = %s" for _, column in ITEM_FIELDS[1:])
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''
+            UPDATE food_log_items
+            SET {assignments}, extra = %s
+            WHERE user_id = %s AND date = %s AND item_id = %s
+        ''', row[3:] + [user_id, date, item['id']])
+        updated = cursor.rowcount
+        refresh_daily_totals(cursor, [(user_id, date)])
+        conn.commit()
+        return updated
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def delete_items(user_id, date, item_ids):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            DELETE FROM food_log_items
+            WHERE user_id = %s AND date = %s AND item_id = ANY(%s)
+        ''', (user_id, date, list(item_ids)))
+        deleted = cursor.rowcount
+        refresh_daily_totals(cursor, [(user_id, date)])
+        conn.commit()
+        return deleted
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def clear_day(user_id, date):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('DELETE FROM food_log_items WHERE user_id = %s AND date = %s', (user_id, date))
+        refresh_daily_totals(cursor, [(user_id, date)])
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def move_items(user_id, date, item_ids, target_date, new_group):
+    """Move items to another group and/or date, they go to the end of the target day"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            UPDATE food_log_items
+            SET date = %s,
+                meal_group = %s,
+                position = nextval(pg_get_serial_sequence('food_log_items', 'position'))
+            WHERE user_id = %s AND date = %s AND item_id = ANY(%s)
+        ''', (target_date, new_group, user_id, date, list(item_ids)))
+        moved = cursor.rowcount
+        refresh_daily_totals(cursor, [(user_id, date), (user_id, target_date)])
+        conn.commit()
+        return moved
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def replace_day(user_id, date, items):
+    """Full rewrite of a day, for callers that still work on whole lists"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('DELETE FROM food_log_items WHERE user_id = %s AND date = %s', (user_id, date))
+        if items:
+            execute_values(cursor, f'''
+                INSERT INTO food_log_items (user_id, date, {_COLUMNS}, extra)
+                VALUES %s
+            ''', [_item_to_row(user_id, date, item) for item in items])
+        refresh_daily_totals(cursor, [(user_id, date)])
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# ==============================================================================
+# MIGRATION FROM user_sessions BLOBS
+# ==============================================================================
+
+def _session_rows(user_id, date, data):
+    """food_log_items rows of one user_sessions blob, raises on unreadable data"""
+    items = json.loads(data) or []
+    rows = []
+    seen_ids = set()
+    for item in items:
+        # Old blobs can carry duplicate ids, the PK needs unique ones
+        if not item.get('id') or item['id'] in seen_ids:
+            item['id'] = str(uuid.uuid4())
+        seen_ids.add(item['id'])
+        rows.append(_item_to_row(user_id, date, item))
+    return rows
+
+
+def migrate_user_sessions():
+    """
+    Copy every user_sessions JSON blob into food_log_items and mark it with
+    migrated_at in the same transaction. Blobs are never deleted here: a
+    blob that cannot be read gets migration_error instead and stays as it
+    is, and migrated ones remain until the new storage has been proven and
+    the table is dropped by hand. Idempotent and safe to run from several
+    workers at once (rows are claimed with SKIP LOCKED).
+    """
+    conn = get_db_connection()
+    conn.autocommit = False
+    cursor = conn.cursor()
+    migrated = 0
+    failed = 0
+    try:
+        while True:
+            cursor.execute('''
+                SELECT user_id, date, data FROM user_sessions
+                WHERE migrated_at IS NULL AND migration_error IS NULL
+                ORDER BY user_id, date
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ''', (MIGRATION_BATCH,))
+            sessions = cursor.fetchall()
+            if not sessions:
+                break
+
+            rows = []
+            done = []
+            errors = []
+            for user_id, date, data in sessions:
+                try:
+                    rows.extend(_session_rows(user_id, date, data))
+                except (TypeError, ValueError, AttributeError) as e:
+                    print(f"[MIGRATION] Leaving unreadable session user={user_id} date={date} in place: {e}")
+                    errors.append((user_id, date, str(e)))
+                else:
+                    done.append((user_id, date))
+
+            if rows:
+                execute_values(cursor, f'''
+                    INSERT INTO food_log_items (user_id, date, {_COLUMNS}, extra)
+                    VALUES %s
+                    ON CONFLICT (user_id, date, item_id) DO NOTHING
+                ''', rows)
+            if done:
+                execute_values(cursor, '''
+                    UPDATE user_sessions s SET migrated_at = NOW()
+                    FROM (VALUES %s) AS m(user_id, date)
+                    WHERE s.user_id = m.user_id AND s.date = m.date
+                ''', done)
+                refresh_daily_totals(cursor, done)
+            if errors:
+                execute_values(cursor, '''
+                    UPDATE user_sessions s SET migration_error = m.error
+                    FROM (VALUES %s) AS m(user_id, date, error)
+                    WHERE s.user_id = m.user_id AND s.date = m.date
+                ''', errors)
+            conn.commit()
+            migrated += len(done)
+            failed += len(errors)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    if migrated:
+        print(f"[MIGRATION] Copied {migrated} user_sessions days into food_log_items")
+    if failed:
+        print(f"[MIGRATION] {failed} unreadable user_sessions days left in place (migration_error set)")
+    return migrated
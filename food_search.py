@@ -0,0 +1,203 @@
+# food_search.py - Indexed food search for /search_foods
+#
+# Indexed mode (default when the extensions are available):
+#   - exact EAN lookup first, served by the UNIQUE b-tree on foods.ean
+#   - pg_trgm GIN index on lower(unaccent(name)) for substring / typo matches
+#   - GIN tsvector index with a Finnish + unaccent text search configuration
+#   - results ranked by relevance blended with personal and global usage
+# Legacy mode is the original LIKE scan, used when pg_trgm / unaccent can't be
+# installed or FOOD_SEARCH_MODE=like is set.
+import os
+import re
+
+FOOD_SEARCH_MODE = os.getenv("FOOD_SEARCH_MODE", "indexed").lower()
+
+# How much usage counts compared to text relevance (relevance is 0..1)
+USAGE_WEIGHT = 0.15
+GLOBAL_USAGE_WEIGHT = 0.05
+
+EAN_RE = re.compile(r'^\d{8,14}$')
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Set by init_food_search() once the indexes are in place
+_indexed_available = False
+
+NORMALIZED_NAME = "lower(food_search_unaccent(f.name))"
+NAME_TSVECTOR = "to_tsvector('finnish_unaccent', f.name)"
+
+
+def init_food_search(cursor):
+    """
+    Create the extensions, helper function, text search configuration and
+    indexes used by the indexed search. Safe to run on every start.
+    Returns True when the indexed mode is available.
+    """
+    global _indexed_available
+    try:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+
+        # unaccent() is only STABLE, index expressions need an IMMUTABLE wrapper
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION food_search_unaccent(text)
+            RETURNS text
+            LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+            AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+        """)
+
+        # Finnish stemming on top of unaccent so "jäätelö" and "jaatelo" match
+        cursor.execute("""
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM pg_ts_config WHERE cfgname = 'finnish_unaccent'
+                ) THEN
+                    CREATE TEXT SEARCH CONFIGURATION finnish_unaccent (COPY = finnish);
+                    ALTER TEXT SEARCH CONFIGURATION finnish_unaccent
+                        ALTER MAPPING FOR hword, hword_part, word
+                        WITH public.unaccent, finnish_stem;
+                END IF;
+            END
+            $$;
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_foods_name_trgm
+            ON foods USING gin (lower(food_search_unaccent(name)) gin_trgm_ops)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_foods_name_fts
+            ON foods USING gin (to_tsvector('finnish_unaccent', name))
+        """)
+        _indexed_available = True
+    except Exception as e:
+        print(f"[WARNING] Indexed food search unavailable, using LIKE search: {e}")
+        _indexed_available = False
+    return _indexed_available
+
+
+def use_indexed_search():
+    return _indexed_available and FOOD_SEARCH_MODE != "like"
+
+
+def _escape_like(word):
+    return word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _prefix_tsquery(words):
+    """'maito ras' -> 'maito:* & ras:*' (only word characters survive)"""
+    tokens = []
+    for word in words:
+        tokens.extend(_WORD_RE.findall(word))
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+def _visibility(is_admin, user_id):
+    if is_admin:
+        return "TRUE", []
+    return "(f.owner_id IS NULL OR f.owner_id = %s)", [user_id]
+
+
+def _select_with_usage(where_clause, order_clause):
+    return f"""
+        SELECT f.*,
+               COALESCE(u.count, 0) AS usage,
+               COALESCE(g.count, 0) AS global_usage
+        FROM foods f
+        LEFT JOIN food_usage u ON f.key = u.food_key AND u.user_id = %s
+        LEFT JOIN food_usage_global g ON f.key = g.food_key
+        WHERE {where_clause}
+        ORDER BY {order_clause}
+        LIMIT %s OFFSET %s
+    """
+
+
+def search_foods_legacy(cursor, user_id, is_admin, query, limit, offset):
+    """Original sequential LIKE search, kept as the fallback / benchmark baseline"""
+    visibility_clause, visibility_params = _visibility(is_admin, user_id)
+    order_clause = "usage DESC, global_usage DESC, name ASC"
+
+    if not query:
+        sql = _select_with_usage(visibility_clause, order_clause)
+        cursor.execute(sql, [user_id] + visibility_params + [limit, offset])
+        return cursor.fetchall()
+
+    words = query.split()
+    word_conditions = " AND ".join(["LOWER(f.name) LIKE %s" for _ in words])
+    word_params = [f"%{w}%" for w in words]
+
+    sql = _select_with_usage(
+        f"{visibility_clause} AND ({word_conditions} OR f.ean = %s)",
+        order_clause
+    )
+    cursor.execute(sql, [user_id] + visibility_params + word_params + [query, limit, offset])
+    return cursor.fetchall()
+
+
+def search_foods_indexed(cursor, user_id, is_admin, query, limit, offset):
+    """Index-backed search: EAN fast path, then trigram / full-text ranked search"""
+    visibility_clause, visibility_params = _visibility(is_admin, user_id)
+
+    if not query:
+        sql = _select_with_usage(visibility_clause, "usage DESC, global_usage DESC, name ASC")
+        cursor.execute(sql, [user_id] + visibility_params + [limit, offset])
+        return cursor.fetchall()
+
+    # Barcode scans hit the unique b-tree on foods.ean and return right away
+    if EAN_RE.match(query):
+        sql = _select_with_usage(f"{visibility_clause} AND f.ean = %s", "f.name ASC")
+        cursor.execute(sql, [user_id] + visibility_params + [query, limit, offset])
+        rows = cursor.fetchall()
+        if rows:
+            return rows
+
+    words = query.split()
+    # Every word must appear in the name (same semantics as the LIKE search),
+    # the patterns are constant-folded so the trigram GIN index is used
+    word_conditions = " AND ".join(
+        [f"{NORMALIZED_NAME} LIKE '%%' || lower(food_search_unaccent(%s)) || '%%'" for _ in words]
+    )
+    word_params = [_escape_like(w) for w in words]
+
+    match_conditions = [f"({word_conditions})", f"{NORMALIZED_NAME} %% lower(food_search_unaccent(%s))"]
+    match_params = word_params + [query]
+
+    tsquery = _prefix_tsquery(words)
+    if tsquery:
+        match_conditions.append(f"{NAME_TSVECTOR} @@ to_tsquery('finnish_unaccent', %s)")
+        match_params.append(tsquery)
+        relevance = (
+            f"GREATEST(similarity({NORMALIZED_NAME}, lower(food_search_unaccent(%s))), "
+            f"ts_rank({NAME_TSVECTOR}, to_tsquery('finnish_unaccent', %s)))"
+        )
+        relevance_params = [query, tsquery]
+    else:
+        relevance = f"similarity({NORMALIZED_NAME}, lower(food_search_unaccent(%s)))"
+        relevance_params = [query]
+
+    sql = f"""
+        SELECT f.*,
+               COALESCE(u.count, 0) AS usage,
+               COALESCE(g.count, 0) AS global_usage
+        FROM foods f
+        LEFT JOIN food_usage u ON f.key = u.food_key AND u.user_id = %s
+        LEFT JOIN food_usage_global g ON f.key = g.food_key
+        WHERE {visibility_clause}
+          AND ({" OR ".join(match_conditions)})
+        ORDER BY
+            {relevance}
+              + {USAGE_WEIGHT} * ln(1 + COALESCE(u.count, 0))
+              + {GLOBAL_USAGE_WEIGHT} * ln(1 + COALESCE(g.count, 0)) DESC,
+            f.name ASC
+        LIMIT %s OFFSET %s
+    """
+    params = [user_id] + visibility_params + match_params + relevance_params + [limit, offset]
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+def search_foods(cursor, user_id, is_admin, query, limit, offset):
+    """Run the food search in the configured mode, rows include usage and global_usage"""
+    if use_indexed_search():
+        return search_foods_indexed(cursor, user_id, is_admin, query, limit, offset)
+    return search_foods_legacy(cursor, user_id, is_admin, query, limit, offset)
@@ -0,0 +1,18 @@
+# job_worker.py - Run background jobs in a dedicated process
+#
+# Usage:
+#   JOB_WORKER_THREADS=0 gunicorn app:app   # web processes only enqueue
+#   python job_worker.py                    # this process runs the jobs
+#
+# Only the handler modules are imported, not app: the worker does not start
+# the Garmin scheduler or run init_db (the web process owns the schema).
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import jobs
+import workout_saved  # noqa: F401 - registers the 'workout_saved' handler
+
+if __name__ == '__main__':
+    print("[JOBS] Worker process started")
+    jobs.run_forever()
@@ -0,0 +1,199 @@
+# jobs.py - Postgres-backed background job queue
+#
+# Requests enqueue a job on their own cursor, so the job only becomes
+# visible when the request's writes commit. Worker threads claim jobs with
+# SELECT ... FOR UPDATE SKIP LOCKED and run the handler in the same
+# transaction that marks the job done: a job either completes with all of
+# its writes or not at all, and a worker that dies mid-job leaves the row
+# unlocked and still queued for the next worker.
+#
+# Handlers are registered with @handler(kind) and called as
+# fn(cursor, user_id, payload) -> JSON-serializable result.
+import json
+import os
+import threading
+import traceback
+
+from db import get_db_connection
+
+JOB_WORKER_THREADS = int(os.getenv("JOB_WORKER_THREADS", 1))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+# An empty queue is polled ever less often up to this, so an idle database
+# (e.g. Neon) can suspend. notify() still wakes the workers right away.
+JOB_IDLE_POLL_MAX = float(os.getenv("JOB_IDLE_POLL_MAX", 60.0))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+# Finished jobs are only needed until the page has polled the result
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", 7))
+
+_handlers = {}
+_wakeup = threading.Event()
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def init_jobs(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS background_jobs (
+            id BIGSERIAL PRIMARY KEY,
+            kind TEXT NOT NULL,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            payload JSONB NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued',  -- queued, done, failed
+            result JSONB,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_background_jobs_queued
+        ON background_jobs (run_after, id) WHERE status = 'queued'
+    ''')
+    cursor.execute('''
+        DELETE FROM background_jobs
+        WHERE status <> 'queued' AND finished_at < NOW() - %s * INTERVAL '1 day'
+    ''', (JOB_RETENTION_DAYS,))
+
+
+def handler(kind):
+    """Register fn(cursor, user_id, payload) as the handler for a job kind"""
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(cursor, kind, user_id, payload):
+    """
+    Queue a job on the caller's cursor (commits with the caller), returns its
+    id. Call notify() after the commit to run it right away.
+    """
+    cursor.execute('''
+        INSERT INTO background_jobs (kind, user_id, payload)
+        VALUES (%s, %s, %s)
+        RETURNING id
+    ''', (kind, user_id, json.dumps(payload, default=str)))
+    return cursor.fetchone()[0]
+
+
+def notify():
+    """Wake this process' workers (call after committing enqueued jobs)"""
+    _wakeup.set()
+
+
+def get_job(job_id, user_id):
+    """{'id', 'kind', 'status', 'result', 'error'} of one of the user's jobs, or None"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            SELECT id, kind, status, result, error
+            FROM background_jobs
+            WHERE id = %s AND user_id = %s
+        ''', (job_id, user_id))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return dict(zip(('id', 'kind', 'status', 'result', 'error'), row))
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def run_next_job():
+    """Claim and run one due job. Returns True when a job was processed."""
+    conn = get_db_connection()
+    conn.autocommit = False
+    cursor = conn.cursor()
+    job_id = None
+    try:
+        cursor.execute('''
+            SELECT id, kind, user_id, payload
+            FROM background_jobs
+            WHERE status = 'queued' AND run_after <= NOW()
+            ORDER BY run_after, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        ''')
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            return False
+
+        job_id, kind, user_id, payload = row
+        fn = _handlers.get(kind)
+        if fn is None:
+            raise LookupError(f"No handler registered for job kind '{kind}'")
+
+        result = fn(cursor, user_id, payload)
+        cursor.execute('''
+            UPDATE background_jobs
+            SET status = 'done', result = %s, error = NULL,
+                attempts = attempts + 1, finished_at = NOW()
+            WHERE id = %s
+        ''', (json.dumps(result, default=str), job_id))
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        if job_id is None:
+            raise
+        print(f"[JOBS] Job {job_id} failed: {e}")
+        traceback.print_exc()
+        # Back off and retry, give up after JOB_MAX_ATTEMPTS
+        cursor.execute('''
+            UPDATE background_jobs
+            SET attempts = attempts + 1,
+                error = %s,
+                status = CASE WHEN attempts + 1 >= %s THEN 'failed' ELSE 'queued' END,
+                finished_at = CASE WHEN attempts + 1 >= %s THEN NOW() END,
+                run_after = NOW() + (attempts + 1) * INTERVAL '5 seconds'
+            WHERE id = %s
+        ''', (str(e), JOB_MAX_ATTEMPTS, JOB_MAX_ATTEMPTS, job_id))
+        conn.commit()
+        return True
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _worker_loop():
+    poll_interval = JOB_POLL_INTERVAL
+    while True:
+        # Cleared before the pass, a notify() during it triggers another one
+        _wakeup.clear()
+        ran_job = False
+        try:
+            while run_next_job():
+                ran_job = True
+        except Exception as e:
+            print(f"[JOBS] Worker error: {e}")
+        if ran_job:
+            # Failed jobs come back after a short back-off, look again soon
+            poll_interval = JOB_POLL_INTERVAL
+        if _wakeup.wait(poll_interval):
+            poll_interval = JOB_POLL_INTERVAL
+        else:
+            poll_interval = min(poll_interval * 2, JOB_IDLE_POLL_MAX)
+
+
+def start_workers(threads=None):
+    """Start the worker threads once per process (safe to call on every request)"""
+    global _started_pid
+    threads = JOB_WORKER_THREADS if threads is None else threads
+    if _started_pid == os.getpid() or threads <= 0:
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        for i in range(threads):
+            threading.Thread(target=_worker_loop, name=f"job-worker-{i}", daemon=True).start()
+        _started_pid = os.getpid()
+        print(f"[JOBS] Started {threads} worker thread(s) in pid {_started_pid}")
+
+
+def run_forever():
+    """Run the worker loop in the foreground (see job_worker.py)"""
+    _worker_loop()
@@ -0,0 +1,202 @@
+# landing_page.py - Cached aggregates for the landing page
+#
+# The / route used to run the news query, today's best lifts of every user
+# and six heaviest-lift top 10 queries (now one ranked query) on every hit.
+# Those results are the same for everybody, so each worker keeps one
+# snapshot of them and reloads it when it is older than CACHE_TTL seconds or
+# belongs to another day.
+# Writers (news admin, saved / edited workouts) call invalidate() so the
+# worker that handled the write reloads on its next hit; the other workers
+# catch up within CACHE_TTL. The per-visitor shuffling of today's lifts is
+# done per request over the cached lists by pick_best_lifts().
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from psycopg2.extras import DictCursor
+
+from db import get_db_connection
+
+CACHE_TTL = float(os.getenv("LANDING_PAGE_CACHE_TTL", 60))
+
+NEWS_LIMIT = 4
+BEST_LIFTS_LIMIT = 15
+HEAVIEST_LIMIT = 10
+GENDERS = ('male', 'female')
+
+# Exercise ids of each heaviest-lift board
+HEAVIEST_EXERCISES = {
+    'bench': (11, 43),
+    'deadlift': (117, 12, 57),
+    'squat': (23,),
+}
+
+_NEWS_SQL = """
+    SELECT np.*, u.username, u.avatar, u.level
+    FROM news_post np
+    JOIN users u ON np.author_id = u.id
+    WHERE np.is_published = TRUE
+    ORDER BY np.created_at DESC
+    LIMIT %s
+"""
+
+_TODAY_LIFTS_SQL = """
+    SELECT
+        u.id as user_id, u.username, u.avatar, u.level, u.gender,
+        e.name as exercise_name,
+        ws.reps, ws.weight,
+        (ws.reps * ws.weight) as volume
+    FROM workout_sets ws
+    JOIN workout_sessions wses ON ws.session_id = wses.id
+    JOIN users u ON wses.user_id = u.id
+    JOIN exercises e ON ws.exercise_id = e.id
+    WHERE wses.date = %s
+      AND ws.is_saved = true
+      AND (ws.reps * ws.weight) > 20
+    ORDER BY volume DESC
+"""
+
+# Top HEAVIEST_LIMIT sets of today for every (lift, gender) in one pass:
+# today's sessions from idx_workout_sessions_date, their lift sets from
+# idx_workout_sets_session_exercise (muscle_groups)
+_HEAVIEST_SQL = """
+    WITH lifts(lift, exercise_id) AS (
+        SELECT * FROM unnest(%(lifts)s::text[], %(exercise_ids)s::int[])
+    ),
+    ranked AS (
+        SELECT
+            l.lift, u.gender,
+            u.id as user_id, u.username, u.avatar, u.level,
+            e.name as exercise_name,
+            ws.reps, ws.weight,
+            ROW_NUMBER() OVER (PARTITION BY l.lift, u.gender ORDER BY ws.weight DESC) AS position
+        FROM lifts l
+        JOIN workout_sets ws ON ws.exercise_id = l.exercise_id AND ws.is_saved = true
+        JOIN workout_sessions wses ON ws.session_id = wses.id
+        JOIN users u ON wses.user_id = u.id
+        JOIN exercises e ON ws.exercise_id = e.id
+        WHERE wses.date = %(date)s
+          AND u.gender = ANY(%(genders)s)
+    )
+    SELECT lift, gender, user_id, username, avatar, level, exercise_name, reps, weight
+    FROM ranked
+    WHERE position <= %(limit)s
+    ORDER BY lift, gender, position
+"""
+
+
+def init_landing_page(cursor):
+    cursor.execute("SELECT to_regclass('workout_sessions') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return
+    # Both landing page queries filter on one date across all users. A
+    # workout_sets (exercise_id, weight DESC) index does not help that
+    # filter, see benchmarks/bench_heaviest_lifts.py
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_workout_sessions_date
+        ON workout_sessions (date) INCLUDE (id, user_id)
+    ''')
+
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def _group_by_user(lifts):
+    """[[lifts of one user, heaviest volume first], ...]"""
+    by_user = {}
+    for lift in lifts:
+        by_user.setdefault(lift['user_id'], []).append(lift)
+    return list(by_user.values())
+
+
+def _load_heaviest(cursor, today):
+    """{gender: {lift: [top sets of today, heaviest first]}}"""
+    pairs = [(lift, exercise_id) for lift, ids in HEAVIEST_EXERCISES.items() for exercise_id in ids]
+    cursor.execute(_HEAVIEST_SQL, {
+        'lifts': [lift for lift, _ in pairs],
+        'exercise_ids': [exercise_id for _, exercise_id in pairs],
+        'date': today,
+        'genders': list(GENDERS),
+        'limit': HEAVIEST_LIMIT,
+    })
+    heaviest = {gender: {lift: [] for lift in HEAVIEST_EXERCISES} for gender in GENDERS}
+    for row in cursor.fetchall():
+        lift = dict(row)
+        heaviest[lift.pop('gender')][lift.pop('lift')].append(lift)
+    return heaviest
+
+
+def _load(today):
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=DictCursor)
+    try:
+        cursor.execute(_NEWS_SQL, (NEWS_LIMIT,))
+        news = [dict(row) for row in cursor.fetchall()]
+
+        cursor.execute(_TODAY_LIFTS_SQL, (today,))
+        lifts = [dict(row) for row in cursor.fetchall()]
+
+        heaviest = _load_heaviest(cursor, today)
+    finally:
+        cursor.close()
+        conn.close()
+
+    return {
+        'date': today,
+        'loaded_at': time.monotonic(),
+        'news': news,
+        'lifts_by_user': {
+            'main': _group_by_user(lifts),
+            'male': _group_by_user(l for l in lifts if l['gender'] == 'male'),
+            'female': _group_by_user(l for l in lifts if l['gender'] == 'female'),
+        },
+        'heaviest': heaviest,
+    }
+
+
+def get_snapshot():
+    """
+    {'date', 'news', 'lifts_by_user': {'main'|'male'|'female': [[lift, ...], ...]},
+     'heaviest': {'male'|'female': {'bench'|'deadlift'|'squat': [lift, ...]}}}
+    Shared between requests, treat as read-only.
+    """
+    global _snapshot
+    today = datetime.now().date()
+    snapshot = _snapshot
+    if snapshot and snapshot['date'] == today and time.monotonic() - snapshot['loaded_at'] < CACHE_TTL:
+        return snapshot
+    with _lock:
+        snapshot = _snapshot
+        if snapshot and snapshot['date'] == today and time.monotonic() - snapshot['loaded_at'] < CACHE_TTL:
+            return snapshot
+        _snapshot = _load(today)
+        return _snapshot
+
+
+def invalidate():
+    """Reload on the next hit of this worker (call after writing news or workouts)"""
+    global _snapshot
+    _snapshot = None
+
+
+def pick_best_lifts(lifts_by_user, limit=BEST_LIFTS_LIMIT):
+    """
+    Random selection of today's lifts: users in random order, one lift each
+    (two for ~30% of users), shuffled and capped at `limit`.
+    """
+    order = list(range(len(lifts_by_user)))
+    random.shuffle(order)
+
+    picked = []
+    for i in order:
+        user_lifts = lifts_by_user[i]
+        num_lifts = 1 if random.random() < 0.7 else min(2, len(user_lifts))
+        picked.extend(user_lifts[:num_lifts])
+        if len(picked) >= limit:
+            break
+
+    random.shuffle(picked)
+    return picked[:limit]
@@ -0,0 +1,130 @@
+# leaderboard.py - Powerlifting total leaderboard
+#
+# powerlifting_leaderboard keeps every user's heaviest saved bench, squat and
+# deadlift and their sum, together with the user's gender. refresh() rewrites
+# one user's row from their own sets whenever those sets or the gender
+# change, so reading a rank never touches other users' workouts:
+#   - rank = 1 + number of same-gender totals above the user's, an
+#     index-only count on idx_powerlifting_leaderboard_rank
+#   - top N = the first N entries of that index
+
+# Exercise ids counted as each lift
+LIFT_EXERCISES = {
+    'bench': (11, 43),
+    'deadlift': (117, 12, 57),
+    'squat': (23,),
+}
+
+
+def init_leaderboard(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS powerlifting_leaderboard (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            gender TEXT,
+            bench REAL NOT NULL DEFAULT 0,
+            squat REAL NOT NULL DEFAULT 0,
+            deadlift REAL NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_powerlifting_leaderboard_rank
+        ON powerlifting_leaderboard (gender, total DESC, user_id)
+        WHERE total > 0
+    ''')
+
+    # Backfill users without a row: every user when the table is introduced
+    # on an existing database, afterwards the users registered since the last
+    # start (readers never repair rows, see rebuild())
+    cursor.execute("SELECT to_regclass('workout_sets') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return
+    cursor.execute(_REFRESH_SQL.format(
+        where="NOT EXISTS (SELECT 1 FROM powerlifting_leaderboard m WHERE m.user_id = u.id)"
+    ), _lift_params())
+    if cursor.rowcount:
+        print(f"[INIT] Backfilled powerlifting_leaderboard ({cursor.rowcount} rows)")
+
+
+# Best lifts of the users matching {where} (over u = users)
+_REFRESH_SQL = '''
+    INSERT INTO powerlifting_leaderboard AS lb (user_id, gender, bench, squat, deadlift, total)
+    SELECT u.id, u.gender, b.bench, b.squat, b.deadlift, b.bench + b.squat + b.deadlift
+    FROM users u
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(MAX(ws.weight) FILTER (WHERE ws.exercise_id = ANY(%(bench)s)), 0) AS bench,
+               COALESCE(MAX(ws.weight) FILTER (WHERE ws.exercise_id = ANY(%(squat)s)), 0) AS squat,
+               COALESCE(MAX(ws.weight) FILTER (WHERE ws.exercise_id = ANY(%(deadlift)s)), 0) AS deadlift
+        FROM workout_sessions s
+        JOIN workout_sets ws ON ws.session_id = s.id
+        WHERE s.user_id = u.id
+          AND ws.is_saved = true
+          AND ws.exercise_id = ANY(%(all_lifts)s)
+    ) b
+    WHERE {where}
+    ON CONFLICT (user_id) DO UPDATE SET
+        gender = EXCLUDED.gender,
+        bench = EXCLUDED.bench,
+        squat = EXCLUDED.squat,
+        deadlift = EXCLUDED.deadlift,
+        total = EXCLUDED.total,
+        updated_at = NOW()
+    WHERE (lb.gender, lb.bench, lb.squat, lb.deadlift)
+          IS DISTINCT FROM (EXCLUDED.gender, EXCLUDED.bench, EXCLUDED.squat, EXCLUDED.deadlift)
+'''
+
+
+def _lift_params(**extra):
+    params = {lift: list(ids) for lift, ids in LIFT_EXERCISES.items()}
+    params['all_lifts'] = [i for ids in LIFT_EXERCISES.values() for i in ids]
+    params.update(extra)
+    return params
+
+
+def refresh(cursor, user_id):
+    """Recompute a user's best lifts (after saving / editing sets or a gender change)"""
+    cursor.execute(_REFRESH_SQL.format(where="u.id = %(user_id)s"), _lift_params(user_id=user_id))
+
+
+def rebuild(cursor, user_ids):
+    """refresh() for many users (rebuild_workout_rollup.py), returns rows changed"""
+    cursor.execute(_REFRESH_SQL.format(where="u.id = ANY(%(user_ids)s)"),
+                   _lift_params(user_ids=list(user_ids)))
+    return cursor.rowcount
+
+
+def get_rank(cursor, user_id):
+    """
+    {'gender', 'bench', 'squat', 'deadlift', 'total', 'rank', 'total_users'}
+    for a user, rank / total_users among users of the same gender with a
+    total above zero (rank None without a total). None without a row.
+    """
+    cursor.execute('''
+        SELECT lb.gender, lb.bench, lb.squat, lb.deadlift, lb.total,
+               CASE WHEN lb.total > 0 THEN (
+                   SELECT COUNT(*) + 1 FROM powerlifting_leaderboard o
+                   WHERE o.gender = lb.gender AND o.total > 0 AND o.total > lb.total
+               ) END AS rank,
+               (SELECT COUNT(*) FROM powerlifting_leaderboard o
+                WHERE o.gender = lb.gender AND o.total > 0) AS total_users
+        FROM powerlifting_leaderboard lb
+        WHERE lb.user_id = %s
+    ''', (user_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip(('gender', 'bench', 'squat', 'deadlift', 'total', 'rank', 'total_users'), row))
+
+
+def top(cursor, gender, limit=10):
+    """The `limit` best totals of a gender: [{'user_id', 'total', ...}]"""
+    cursor.execute('''
+        SELECT user_id, bench, squat, deadlift, total
+        FROM powerlifting_leaderboard
+        WHERE gender = %s AND total > 0
+        ORDER BY total DESC, user_id
+        LIMIT %s
+    ''', (gender, limit))
+    columns = ('user_id', 'bench', 'squat', 'deadlift', 'total')
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
@@ -0,0 +1,113 @@
+# levels.py - XP / level progression
+#
+# Advancing from level L to L + 1 costs max(MIN_STEP, round(BASE_XP * L**EXPONENT))
+# XP, up to LEVEL_CAP. users stores the level and the XP collected inside it
+# (xp_points). A LevelTable precomputes the cumulative XP needed to reach every
+# level once, so turning any amount of XP into a level is a bisect instead of
+# a level-by-level loop.
+#
+# Tuned for:
+#   - Early users: ~2-3 levels/week if very active
+#   - After level 10: ~1 level/week if active
+#   - Long-tail diminishing returns; practical long-term 50-60 range
+from bisect import bisect_right
+
+LEVEL_CAP = 999
+BASE_XP = 120
+EXPONENT = 1.72
+# Minimum floor to avoid tiny steps at very low levels
+MIN_STEP = 50
+# Shown as the next threshold at the cap, effectively unreachable
+CAP_STEP = 10**12
+
+
+# XP per unit of each source of a saved workout (see process_saved_workout)
+XP_PER_CARDIO_SECOND = 0.03
+XP_PER_CARDIO_CALORIE = 0.3
+XP_PER_VOLUME = 0.04            # per kg x rep
+XP_PER_WORKOUT_SECOND = 0.03
+XP_PER_NEW_EXERCISE = 25.0
+XP_PER_PERSONAL_BEST = 30.0
+
+# (minimum streak days, XP multiplier), highest first
+STREAK_MULTIPLIERS = ((20, 1.10), (10, 1.05), (5, 1.02))
+
+
+def calculate_streak_xp_multiplier(streak_days: int) -> float:
+    """
+    Calculate XP multiplier based on workout streak.
+
+    Formula:
+    - 0-4 days: 0% bonus (1.0x multiplier)
+    - 5-9 days: 2% bonus (1.02x multiplier)
+    - 10-19 days: 5% bonus (1.05x multiplier)
+    - 20+ days: 10% bonus (1.10x multiplier)
+    """
+    for min_days, multiplier in STREAK_MULTIPLIERS:
+        if streak_days >= min_days:
+            return multiplier
+    return 1.0
+
+
+def clamp_level(level: int) -> int:
+    return min(max(level, 1), LEVEL_CAP)
+
+
+class LevelTable:
+    """Cumulative XP thresholds for one (base_xp, exponent) curve."""
+
+    def __init__(self, base_xp=BASE_XP, exponent=EXPONENT):
+        self.base_xp = base_xp
+        self.exponent = exponent
+        # steps[L] = XP from level L to L + 1, cumulative[L] = XP from level 1 to L
+        self.steps = [0] * (LEVEL_CAP + 1)
+        self.cumulative = [0] * (LEVEL_CAP + 1)
+        for level in range(1, LEVEL_CAP):
+            self.steps[level] = max(MIN_STEP, int(round(base_xp * (level ** exponent))))
+            self.cumulative[level + 1] = self.cumulative[level] + self.steps[level]
+        self.steps[LEVEL_CAP] = CAP_STEP
+
+    def xp_to_next_level(self, level: int) -> int:
+        """XP required to advance from `level` to `level + 1`"""
+        if level >= LEVEL_CAP:
+            return CAP_STEP
+        return self.steps[max(level, 1)]
+
+    def total_xp(self, level: int, xp_in_level: int) -> int:
+        """All XP earned since level 1"""
+        return self.cumulative[clamp_level(level)] + max(int(xp_in_level), 0)
+
+    def from_total(self, total_xp: int):
+        """(level, xp_in_level, xp_to_next_level) for a lifetime XP total"""
+        level = bisect_right(self.cumulative, max(int(total_xp), 0), 1) - 1
+        if level >= LEVEL_CAP:
+            return LEVEL_CAP, 0, CAP_STEP
+        return level, int(total_xp) - self.cumulative[level], self.steps[level]
+
+    def progress(self, level: int, xp_in_level: int):
+        """
+        Normalized (level, xp_in_level, xp_to_next_level) for stored values,
+        e.g. xp_points above the threshold after a rebalance.
+        """
+        return self.from_total(self.total_xp(level, xp_in_level))
+
+    def add_xp(self, level: int, xp_in_level: int, gained: int):
+        """(new_level, new_xp_in_level, levels_gained) after gaining XP"""
+        level = clamp_level(level)
+        new_level, new_xp, _ = self.from_total(self.total_xp(level, xp_in_level) + int(gained))
+        return new_level, new_xp, max(new_level - level, 0)
+
+
+DEFAULT_TABLE = LevelTable()
+
+
+def xp_to_next_level(level: int) -> int:
+    return DEFAULT_TABLE.xp_to_next_level(level)
+
+
+def progress(level: int, xp_in_level: int):
+    return DEFAULT_TABLE.progress(level, xp_in_level)
+
+
+def add_xp(level: int, xp_in_level: int, gained: int):
+    return DEFAULT_TABLE.add_xp(level, xp_in_level, gained)
@@ -0,0 +1,88 @@
+# muscle_groups.py - Canonical muscle group dimension
+#
+# exercises.muscle_group is free text typed by admins ("Chest", "chest ",
+# ...). muscle_groups holds one row per canonical key (trimmed, lower case)
+# and exercises.muscle_group_id points at it, kept in sync by a trigger on
+# exercises. Queries filter on the id instead of LOWER(muscle_group), which
+# lets the planner drive them from the indexes created here.
+
+
+def canonical_key(name):
+    return (name or '').strip().lower()
+
+
+def init_muscle_groups(cursor):
+    cursor.execute("SELECT to_regclass('exercises') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS muscle_groups (
+            id SERIAL PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        ALTER TABLE exercises
+        ADD COLUMN IF NOT EXISTS muscle_group_id INTEGER REFERENCES muscle_groups(id)
+    ''')
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION set_exercise_muscle_group() RETURNS trigger AS $$
+        DECLARE
+            group_key TEXT := LOWER(TRIM(NEW.muscle_group));
+        BEGIN
+            INSERT INTO muscle_groups (key, name)
+            VALUES (group_key, TRIM(NEW.muscle_group))
+            ON CONFLICT (key) DO NOTHING;
+            SELECT id INTO NEW.muscle_group_id FROM muscle_groups WHERE key = group_key;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute('DROP TRIGGER IF EXISTS exercises_muscle_group ON exercises')
+    cursor.execute('''
+        CREATE TRIGGER exercises_muscle_group
+        BEFORE INSERT OR UPDATE OF muscle_group ON exercises
+        FOR EACH ROW EXECUTE FUNCTION set_exercise_muscle_group()
+    ''')
+
+    # Exercises created before the dimension existed
+    cursor.execute('''
+        INSERT INTO muscle_groups (key, name)
+        SELECT DISTINCT ON (LOWER(TRIM(muscle_group))) LOWER(TRIM(muscle_group)), TRIM(muscle_group)
+        FROM exercises
+        WHERE muscle_group_id IS NULL AND muscle_group IS NOT NULL
+        ORDER BY LOWER(TRIM(muscle_group)), id
+        ON CONFLICT (key) DO NOTHING
+    ''')
+    cursor.execute('''
+        UPDATE exercises e
+        SET muscle_group_id = mg.id
+        FROM muscle_groups mg
+        WHERE e.muscle_group_id IS NULL AND mg.key = LOWER(TRIM(e.muscle_group))
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_exercises_muscle_group_id
+        ON exercises (muscle_group_id) INCLUDE (name)
+    ''')
+    cursor.execute("SELECT to_regclass('workout_sets') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return
+    # Covering indexes for the history / muscle detail range scans
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_workout_sessions_user_date
+        ON workout_sessions (user_id, date) INCLUDE (id, is_saved)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_workout_sets_session_exercise
+        ON workout_sets (session_id, exercise_id) INCLUDE (reps, weight, volume, is_saved)
+    ''')
+
+
+def get_id(cursor, name):
+    """muscle_groups.id for a muscle group name in any spelling, or None"""
+    cursor.execute('SELECT id FROM muscle_groups WHERE key = %s', (canonical_key(name),))
+    row = cursor.fetchone()
+    return row[0] if row else None
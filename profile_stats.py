@@ -0,0 +1,316 @@
+# profile_stats.py - Cached statistics snapshot behind the profile page
+#
+# The profile page calls /profile/<id>/stats (heaviest lifts, rank, top
+# volume sets, running / cycling records) and /profile/<id>/stats/recent
+# (last 30 days). Both are served from one per-user snapshot built with a
+# handful of grouped queries:
+#   - strength: heaviest set per powerlifting lift + top volume sets
+#   - rank:     leaderboard.get_rank
+#   - cardio:   every running / cycling record, one DISTINCT ON per record
+#   - recent:   30-day workouts, volume, cardio time and top muscle group
+# Snapshots are kept per worker for CACHE_TTL seconds; saving or editing a
+# user's workouts, cardio or profile calls invalidate(user_id). The privacy
+# flag is not part of the snapshot, show_health_metrics() reads it per request
+# so hiding the stats takes effect right away in every worker.
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from psycopg2.extras import DictCursor
+
+import leaderboard
+from db import get_db_connection
+
+CACHE_TTL = float(os.getenv("PROFILE_STATS_CACHE_TTL", 300))
+MAX_CACHED_USERS = 2000
+
+RECENT_DAYS = 30
+TOP_VOLUME_LIMIT = 5
+
+# Cardio exercise ids of each sport and the distances (km) of its best-pace records
+CARDIO_RECORDS = {
+    'running': {'exercise_ids': (1, 2, 3, 4, 5, 10), 'best_km': (5, 10, 21)},
+    'cycling': {'exercise_ids': (11, 12, 13, 14, 15, 16, 17, 18), 'best_km': (30, 60, 100)},
+}
+
+_STRENGTH_SQL = """
+    WITH sets AS (
+        SELECT e.name as exercise_name, ws.exercise_id, ws.reps, ws.weight, wses.date,
+               (ws.reps * ws.weight) as volume
+        FROM workout_sets ws
+        JOIN workout_sessions wses ON ws.session_id = wses.id
+        JOIN exercises e ON ws.exercise_id = e.id
+        WHERE wses.user_id = %(user_id)s
+          AND ws.is_saved = true
+    ),
+    heaviest AS (
+        SELECT DISTINCT ON (l.lift) l.lift AS kind, 1 AS position,
+               s.exercise_name, s.reps, s.weight, s.date, s.volume
+        FROM sets s
+        JOIN unnest(%(lifts)s::text[], %(exercise_ids)s::int[]) AS l(lift, exercise_id)
+          ON l.exercise_id = s.exercise_id
+        ORDER BY l.lift, s.weight DESC
+    ),
+    top_volume AS (
+        SELECT 'volume' AS kind, ROW_NUMBER() OVER (ORDER BY volume DESC) AS position,
+               exercise_name, reps, weight, date, volume
+        FROM sets
+        WHERE volume > 20
+        ORDER BY volume DESC
+        LIMIT %(top_volume_limit)s
+    )
+    SELECT * FROM heaviest
+    UNION ALL
+    SELECT * FROM top_volume
+    ORDER BY kind, position
+"""
+
+_CARDIO_SQL = """
+    WITH cardio AS (
+        SELECT c.sport, ce.name as cardio_exercise,
+               cs.duration_minutes, cs.calories_burned, cs.distance_km,
+               cs.avg_speed, cs.avg_heart_rate, wses.date
+        FROM cardio_sessions cs
+        JOIN workout_sessions wses ON cs.session_id = wses.id
+        JOIN cardio_exercises ce ON cs.cardio_exercise_id = ce.id
+        JOIN unnest(%(sports)s::text[], %(exercise_ids)s::int[]) AS c(sport, exercise_id)
+          ON c.exercise_id = cs.cardio_exercise_id
+        WHERE wses.user_id = %(user_id)s
+          AND cs.is_saved = true
+    ),
+    records AS (
+        (SELECT DISTINCT ON (sport) 'longest_session' AS record, NULL::float AS km, *
+         FROM cardio
+         ORDER BY sport, duration_minutes DESC)
+        UNION ALL
+        (SELECT DISTINCT ON (sport) 'longest_distance', NULL::float, *
+         FROM cardio
+         WHERE distance_km IS NOT NULL
+         ORDER BY sport, distance_km DESC)
+        UNION ALL
+        (SELECT DISTINCT ON (b.sport, b.km) 'best', b.km, c.*
+         FROM cardio c
+         JOIN unnest(%(best_sports)s::text[], %(best_km)s::float[]) AS b(sport, km)
+           ON b.sport = c.sport AND c.distance_km >= b.km
+         ORDER BY b.sport, b.km, (c.duration_minutes / c.distance_km) ASC)
+    )
+    -- Pace / speed only for the best-pace records, their distance_km >= km > 0
+    -- (longest_session rows may have a zero or NULL distance)
+    SELECT record, km, sport, cardio_exercise, duration_minutes, calories_burned, distance_km,
+           avg_speed, avg_heart_rate, date,
+           CASE WHEN record = 'best' THEN duration_minutes / distance_km END as pace_min_per_km,
+           CASE WHEN record = 'best' THEN distance_km / (NULLIF(duration_minutes, 0) / 60.0) END as speed_kmh,
+           CASE WHEN record = 'best' THEN (duration_minutes / distance_km) * km END as estimated_time
+    FROM records
+"""
+
+_RECENT_SQL = """
+    WITH sessions AS (
+        SELECT id, is_saved
+        FROM workout_sessions
+        WHERE user_id = %(user_id)s
+          AND date >= %(since)s
+    ),
+    sets AS (
+        SELECT ws.id, e.id AS exercise_id, e.muscle_group, (ws.reps * ws.weight) AS volume
+        FROM sessions s
+        JOIN workout_sets ws ON ws.session_id = s.id
+        LEFT JOIN exercises e ON ws.exercise_id = e.id
+        WHERE ws.is_saved = true
+    ),
+    top_muscle AS (
+        SELECT muscle_group, COUNT(id) as set_count
+        FROM sets
+        WHERE exercise_id IS NOT NULL
+        GROUP BY muscle_group
+        ORDER BY set_count DESC
+        LIMIT 1
+    )
+    SELECT
+        (SELECT COUNT(*) FROM sessions WHERE is_saved) AS recent_workouts,
+        (SELECT COALESCE(SUM(volume), 0) FROM sets) AS recent_volume,
+        (SELECT COALESCE(SUM(cs.duration_minutes), 0)
+         FROM sessions s
+         JOIN cardio_sessions cs ON cs.session_id = s.id
+         WHERE cs.is_saved = true) AS recent_cardio_minutes,
+        tm.muscle_group, tm.set_count
+    FROM (SELECT 1) one
+    LEFT JOIN top_muscle tm ON TRUE
+"""
+
+_lock = threading.Lock()
+_snapshots = OrderedDict()  # user_id -> snapshot, least recently used first
+_invalidations = 0  # bumped by invalidate(), a load that raced one is not stored
+
+
+def _load_strength(cursor, user_id):
+    pairs = [(lift, exercise_id)
+             for lift, ids in leaderboard.LIFT_EXERCISES.items() for exercise_id in ids]
+    cursor.execute(_STRENGTH_SQL, {
+        'user_id': user_id,
+        'lifts': [lift for lift, _ in pairs],
+        'exercise_ids': [exercise_id for _, exercise_id in pairs],
+        'top_volume_limit': TOP_VOLUME_LIMIT,
+    })
+    heaviest = {lift: None for lift in leaderboard.LIFT_EXERCISES}
+    top_volume = []
+    for row in cursor.fetchall():
+        lift = {key: row[key] for key in ('exercise_name', 'reps', 'weight', 'date', 'volume')}
+        if row['kind'] == 'volume':
+            top_volume.append(lift)
+        else:
+            heaviest[row['kind']] = lift
+    return heaviest, top_volume
+
+
+def _load_rank(cursor, user_id, total_weight):
+    """(rank, total_users) among users of the same gender, (None, 0) without a total"""
+    if total_weight <= 0:
+        return None, 0
+    # Read only, writers and init_leaderboard / rebuild_workout_rollup.py
+    # keep the leaderboard rows current
+    standing = leaderboard.get_rank(cursor, user_id)
+    if not standing:
+        return None, 0
+    return standing['rank'], standing['total_users']
+
+
+def _load_cardio(cursor, user_id):
+    pairs = [(sport, exercise_id)
+             for sport, record in CARDIO_RECORDS.items() for exercise_id in record['exercise_ids']]
+    best = [(sport, km) for sport, record in CARDIO_RECORDS.items() for km in record['best_km']]
+    cursor.execute(_CARDIO_SQL, {
+        'user_id': user_id,
+        'sports': [sport for sport, _ in pairs],
+        'exercise_ids': [exercise_id for _, exercise_id in pairs],
+        'best_sports': [sport for sport, _ in best],
+        'best_km': [km for _, km in best],
+    })
+
+    records = {}
+    for sport, record in CARDIO_RECORDS.items():
+        records[sport] = {'longest_session': None, 'longest_distance': None}
+        records[sport].update({f"best_{km}km": None for km in record['best_km']})
+    for row in cursor.fetchall():
+        if row['record'] == 'best':
+            km = int(row['km'])
+            records[row['sport']][f"best_{km}km"] = {
+                'cardio_exercise': row['cardio_exercise'],
+                'duration_minutes': row['duration_minutes'],
+                'distance_km': row['distance_km'],
+                'avg_speed': row['avg_speed'],
+                'avg_heart_rate': row['avg_heart_rate'],
+                'date': row['date'],
+                'pace_min_per_km': row['pace_min_per_km'],
+                'speed_kmh': row['speed_kmh'],
+                f"estimated_{km}km_time": row['estimated_time'],
+            }
+        else:
+            records[row['sport']][row['record']] = {
+                key: row[key]
+                for key in ('cardio_exercise', 'duration_minutes', 'calories_burned', 'distance_km', 'date')
+            }
+    return records
+
+
+def _load_recent(cursor, user_id, today):
+    cursor.execute(_RECENT_SQL, {'user_id': user_id, 'since': today - timedelta(days=RECENT_DAYS)})
+    row = cursor.fetchone()
+    return {
+        'period_days': RECENT_DAYS,
+        'recent_workouts': row['recent_workouts'] or 0,
+        'recent_volume_kg': float(row['recent_volume'] or 0),
+        'recent_cardio_hours': round(float(row['recent_cardio_minutes'] or 0) / 60, 1),
+        'top_muscle_group': (
+            {'muscle_group': row['muscle_group'], 'set_count': row['set_count']}
+            if row['set_count'] else None
+        ),
+    }
+
+
+def _load(user_id, today):
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=DictCursor)
+    try:
+        cursor.execute("SELECT gender FROM users WHERE id = %s", (user_id,))
+        user = cursor.fetchone()
+        if not user:
+            return None
+
+        heaviest, top_volume = _load_strength(cursor, user_id)
+        total_weight = sum(lift['weight'] for lift in heaviest.values() if lift)
+        rank, total_users = _load_rank(cursor, user_id, total_weight)
+        cardio_records = _load_cardio(cursor, user_id)
+        recent = _load_recent(cursor, user_id, today)
+    finally:
+        cursor.close()
+        conn.close()
+
+    return {
+        'date': today,
+        'loaded_at': time.monotonic(),
+        'stats': {
+            'user_gender': user['gender'],
+            'heaviest_lifts': {
+                'bench': heaviest['bench'],
+                'deadlift': heaviest['deadlift'],
+                'squat': heaviest['squat'],
+                'total': total_weight,
+                'total_rank': rank,
+                'total_users': total_users,
+            },
+            'top_volume_lifts': top_volume,
+            'cardio_records': cardio_records,
+        },
+        'recent': recent,
+    }
+
+
+def show_health_metrics(user_id):
+    """The user's current privacy flag (not cached), None when the user does not exist"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT show_health_metrics FROM users WHERE id = %s", (user_id,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+    return None if row is None else bool(row[0])
+
+
+def get_snapshot(user_id):
+    """
+    {'stats', 'recent'} for a user, None when the user
+    does not exist. 'stats' / 'recent' are the /profile/<id>/stats and
+    /stats/recent payloads. Shared between requests, treat as read-only.
+    """
+    today = datetime.now().date()
+    with _lock:
+        snapshot = _snapshots.get(user_id)
+        if snapshot and snapshot['date'] == today and time.monotonic() - snapshot['loaded_at'] < CACHE_TTL:
+            _snapshots.move_to_end(user_id)
+            return snapshot
+
+    generation = _invalidations
+    snapshot = _load(user_id, today)
+    if snapshot is None:
+        return None
+    with _lock:
+        _snapshots.pop(user_id, None)
+        if generation != _invalidations:
+            return snapshot
+        _snapshots[user_id] = snapshot
+        while len(_snapshots) > MAX_CACHED_USERS:
+            _snapshots.popitem(last=False)
+    return snapshot
+
+
+def invalidate(user_id):
+    """Drop a user's snapshot (call after their workouts, cardio or profile change)"""
+    global _invalidations
+    with _lock:
+        _invalidations += 1
+        _snapshots.pop(user_id, None)
@@ -0,0 +1,65 @@
+# rebuild_workout_rollup.py - Rebuild workout_daily_rollup from the raw tables
+#
+# Use after a backfill or import that wrote workout_sessions / workout_sets /
+# cardio_sessions directly, or after changing the rollup definition. The
+# users' powerlifting_leaderboard rows are rebuilt in the same batches.
+#
+# Usage:
+#   DB_ENV=local python rebuild_workout_rollup.py [--user ID] [--batch-users N]
+#
+# Users are rebuilt in batches, one transaction per batch, so the history of
+# a user is never seen half rebuilt.
+import argparse
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+import leaderboard
+import workout_rollup
+from db import get_database_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the daily workout rollup")
+    parser.add_argument("--user", type=int, help="only this user")
+    parser.add_argument("--batch-users", type=int, default=200, help="users per transaction")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = psycopg2.connect(get_database_url())
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    try:
+        if args.user:
+            user_ids = [args.user]
+        else:
+            cursor.execute("SELECT DISTINCT user_id FROM workout_sessions ORDER BY user_id")
+            user_ids = [row[0] for row in cursor.fetchall()]
+            # Users whose sessions are all gone may still have rows
+            cursor.execute("SELECT DISTINCT user_id FROM workout_daily_rollup")
+            user_ids = sorted(set(user_ids) | {row[0] for row in cursor.fetchall()})
+        conn.commit()
+
+        rows = 0
+        leaderboard_rows = 0
+        for i in range(0, len(user_ids), args.batch_users):
+            batch = user_ids[i:i + args.batch_users]
+            rows += workout_rollup.rebuild(cursor, batch)
+            leaderboard_rows += leaderboard.rebuild(cursor, batch)
+            conn.commit()
+            print(f"  {min(i + args.batch_users, len(user_ids))}/{len(user_ids)} users")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    print(f"Rebuilt workout_daily_rollup for {len(user_ids)} users ({rows} rows, "
+          f"{leaderboard_rows} leaderboard rows changed) in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+# recompute_xp.py - Recompute every user's XP and level from workout history
+#
+# Replays the XP rules of process_saved_workout (levels.XP_* weights, streak
+# multipliers, the once-per-day strength / cardio limits, new exercises and
+# PRs against the previous session with the same focus) over all saved
+# sessions, then turns each user's total into a level with levels.py. Use it
+# after changing any of those constants.
+#
+# Usage:
+#   DB_ENV=local python recompute_xp.py --dry-run        # print the changes only
+#   python recompute_xp.py [--user ID] [--chunk-users N]
+#
+# Sessions are streamed user by user from a server-side cursor, XP is
+# computed per chunk of users with numpy and written back with batched
+# UPDATEs. Sessions are replayed in (date, id) order, which is how they would
+# have been saved in real time.
+import argparse
+import sys
+import time
+
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+import levels
+from db import get_database_url
+
+ITERSIZE = 20000
+
+# One row per saved session, ordered by user, date, id
+SESSION_FEATURES_SQL = """
+    WITH sessions AS (
+        SELECT ws.id, ws.user_id, ws.date, ws.focus_type,
+               COALESCE(ws.workout_duration_seconds, 0) AS workout_seconds,
+               COALESCE(ws.total_duration_seconds, 0) AS total_seconds
+        FROM workout_sessions ws
+        WHERE ws.is_saved {user_filter}
+    ),
+    set_stats AS (
+        SELECT s.session_id, s.exercise_id,
+               SUM(s.reps * s.weight) AS volume,
+               MAX(s.reps * s.weight) AS best_set_volume,
+               MAX(s.weight) AS heaviest,
+               (ARRAY_AGG(s.reps * s.weight ORDER BY s.id DESC))[1] AS last_volume,
+               (ARRAY_AGG(s.weight ORDER BY s.id DESC))[1] AS last_weight
+        FROM workout_sets s
+        JOIN sessions ss ON ss.id = s.session_id
+        WHERE s.is_saved
+        GROUP BY s.session_id, s.exercise_id
+    ),
+    compared AS (
+        SELECT st.*,
+               LAG(st.session_id) OVER w AS previous_session,
+               LAG(st.last_volume) OVER w AS previous_volume,
+               LAG(st.last_weight) OVER w AS previous_weight
+        FROM set_stats st
+        JOIN sessions ss ON ss.id = st.session_id
+        WINDOW w AS (PARTITION BY ss.user_id, ss.focus_type, st.exercise_id ORDER BY ss.date, ss.id)
+    ),
+    per_session AS (
+        SELECT session_id,
+               SUM(volume) AS volume,
+               COUNT(*) FILTER (WHERE previous_session IS NULL) AS new_exercises,
+               COUNT(*) FILTER (WHERE previous_volume > 0 AND best_set_volume > previous_volume)
+                 + COUNT(*) FILTER (WHERE previous_weight > 0 AND heaviest > previous_weight) AS personal_bests
+        FROM compared
+        GROUP BY session_id
+    ),
+    cardio AS (
+        SELECT cs.session_id,
+               SUM(cs.duration_minutes * 60) AS seconds,
+               SUM(cs.calories_burned) AS calories
+        FROM cardio_sessions cs
+        JOIN sessions ss ON ss.id = cs.session_id
+        WHERE cs.is_saved
+        GROUP BY cs.session_id
+    ),
+    day_seconds AS (
+        SELECT user_id, date, SUM(total_seconds) AS seconds
+        FROM sessions
+        GROUP BY user_id, date
+    )
+    SELECT ss.user_id, ss.date, ss.workout_seconds,
+           COALESCE(p.volume, 0), COALESCE(p.new_exercises, 0), COALESCE(p.personal_bests, 0),
+           COALESCE(c.seconds, 0), COALESCE(c.calories, 0),
+           COALESCE(y.seconds, 0),
+           p.session_id IS NOT NULL, c.session_id IS NOT NULL,
+           COALESCE(u.xp_points, 0), COALESCE(u.level, 1)
+    FROM sessions ss
+    JOIN users u ON u.id = ss.user_id
+    LEFT JOIN per_session p ON p.session_id = ss.id
+    LEFT JOIN cardio c ON c.session_id = ss.id
+    LEFT JOIN day_seconds y ON y.user_id = ss.user_id AND y.date = ss.date - 1
+    ORDER BY ss.user_id, ss.date, ss.id
+"""
+
+(USER, DATE, WORKOUT_SECONDS, VOLUME, NEW_EXERCISES, PERSONAL_BESTS, CARDIO_SECONDS,
+ CARDIO_CALORIES, YESTERDAY_SECONDS, HAS_SETS, HAS_CARDIO, OLD_XP, OLD_LEVEL) = range(13)
+
+STREAK_MIN_SECONDS = 1200
+
+
+def _group_starts(*keys):
+    """Boolean mask of rows that start a new run of equal keys"""
+    starts = np.ones(len(keys[0]), dtype=bool)
+    if len(starts) > 1:
+        changed = np.zeros(len(starts) - 1, dtype=bool)
+        for key in keys:
+            changed |= key[1:] != key[:-1]
+        starts[1:] = changed
+    return starts
+
+
+def _earlier_in_group(flags, starts):
+    """For each row, how many earlier rows of its group have flags set"""
+    inclusive = np.cumsum(flags)
+    start_index = np.maximum.accumulate(np.where(starts, np.arange(len(flags)), 0))
+    before_group = inclusive[start_index] - flags[start_index]
+    return inclusive - flags - before_group
+
+
+def session_xp(rows):
+    """XP gained by each session of a chunk (rows ordered by user, date, id)"""
+    data = np.array(rows, dtype=object)
+    users = data[:, USER].astype(np.int64)
+    days = np.array([d.toordinal() for d in data[:, DATE]], dtype=np.int64)
+    f = lambda column: data[:, column].astype(np.float64)
+    has_sets = data[:, HAS_SETS].astype(bool)
+    has_cardio = data[:, HAS_CARDIO].astype(bool)
+
+    day_starts = _group_starts(users, days)
+    user_starts = _group_starts(users)
+
+    # Once-per-day limits: only the first session of a day with sets / cardio
+    # earns strength / cardio XP
+    strength_ok = _earlier_in_group(has_sets.astype(np.int64), day_starts) == 0
+    cardio_ok = _earlier_in_group(has_cardio.astype(np.int64), day_starts) == 0
+
+    # Streak, counted on the first session of each day: +1 when yesterday had
+    # 20+ minutes, otherwise (or on the user's first day) back to 1
+    day_index = np.cumsum(day_starts) - 1
+    first_rows = np.flatnonzero(day_starts)
+    resets = user_starts[first_rows] | (f(YESTERDAY_SECONDS)[first_rows] < STREAK_MIN_SECONDS)
+    positions = np.arange(len(first_rows))
+    last_reset = np.maximum.accumulate(np.where(resets, positions, 0))
+    streak = (positions - last_reset + 1)[day_index]
+
+    multiplier = np.ones(len(rows))
+    for min_days, value in reversed(levels.STREAK_MULTIPLIERS):
+        multiplier[streak >= min_days] = value
+
+    strength_xp = (f(VOLUME) * levels.XP_PER_VOLUME
+                   + f(WORKOUT_SECONDS) * levels.XP_PER_WORKOUT_SECOND
+                   + f(NEW_EXERCISES) * levels.XP_PER_NEW_EXERCISE
+                   + f(PERSONAL_BESTS) * levels.XP_PER_PERSONAL_BEST)
+    cardio_xp = (f(CARDIO_SECONDS) * levels.XP_PER_CARDIO_SECOND
+                 + f(CARDIO_CALORIES) * levels.XP_PER_CARDIO_CALORIE)
+    base = np.where(strength_ok, strength_xp, 0.0) + np.where(cardio_ok, cardio_xp, 0.0)
+    # np.rint rounds half to even like round() in the job
+    return users, user_starts, np.rint(base * multiplier).astype(np.int64), data
+
+
+def user_levels(rows, table):
+    """[(user_id, old_xp, old_level, new_xp, new_level)] for a chunk of whole users"""
+    users, user_starts, gained, data = session_xp(rows)
+    first_rows = np.flatnonzero(user_starts)
+    totals = np.add.reduceat(gained, first_rows)
+
+    cumulative = np.array(table.cumulative[1:], dtype=np.int64)  # index 0 -> level 1
+    new_levels = np.searchsorted(cumulative, totals, side='right')
+    at_cap = new_levels >= levels.LEVEL_CAP
+    new_levels = np.minimum(new_levels, levels.LEVEL_CAP)
+    new_xp = np.where(at_cap, 0, totals - cumulative[new_levels - 1])
+
+    return list(zip(users[first_rows].tolist(),
+                    data[first_rows, OLD_XP].tolist(), data[first_rows, OLD_LEVEL].tolist(),
+                    new_xp.tolist(), new_levels.tolist()))
+
+
+def iter_user_chunks(cursor, chunk_users):
+    """Yield row lists holding up to chunk_users complete users"""
+    chunk, users_in_chunk, current_user = [], 0, None
+    for row in cursor:
+        if row[USER] != current_user:
+            if users_in_chunk >= chunk_users:
+                yield chunk
+                chunk, users_in_chunk = [], 0
+            current_user = row[USER]
+            users_in_chunk += 1
+        chunk.append(row)
+    if chunk:
+        yield chunk
+
+
+def write_levels(cursor, results):
+    execute_values(cursor, """
+        UPDATE users SET xp_points = v.xp, level = v.level
+        FROM (VALUES %s) AS v(id, xp, level)
+        WHERE users.id = v.id
+    """, [(user_id, new_xp, new_level) for user_id, _, _, new_xp, new_level in results], page_size=1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute XP and levels from workout history")
+    parser.add_argument("--dry-run", action="store_true", help="print the changes, write nothing")
+    parser.add_argument("--user", type=int, help="only this user")
+    parser.add_argument("--chunk-users", type=int, default=500, help="users per numpy chunk / UPDATE batch")
+    args = parser.parse_args()
+
+    load_dotenv()
+    table = levels.DEFAULT_TABLE
+    read_conn = psycopg2.connect(get_database_url())
+    write_conn = psycopg2.connect(get_database_url())
+    write_conn.autocommit = True
+    write_cursor = write_conn.cursor()
+
+    user_filter, params = "", ()
+    if args.user:
+        user_filter, params = "AND ws.user_id = %s", (args.user,)
+
+    sessions = users = changed = 0
+    started = time.perf_counter()
+    try:
+        # Named cursor: rows are streamed from the server ITERSIZE at a time
+        cursor = read_conn.cursor(name="recompute_xp")
+        cursor.itersize = ITERSIZE
+        cursor.execute(SESSION_FEATURES_SQL.format(user_filter=user_filter), params)
+
+        for rows in iter_user_chunks(cursor, args.chunk_users):
+            results = user_levels(rows, table)
+            updates = [r for r in results if (r[1], r[2]) != (r[3], r[4])]
+            sessions += len(rows)
+            users += len(results)
+            changed += len(updates)
+
+            if args.dry_run:
+                for user_id, old_xp, old_level, new_xp, new_level in updates:
+                    print(f"user {user_id}: level {old_level} ({old_xp} xp) -> level {new_level} ({new_xp} xp)")
+            elif updates:
+                write_levels(write_cursor, updates)
+        cursor.close()
+    finally:
+        read_conn.close()
+        write_cursor.close()
+        write_conn.close()
+
+    elapsed = time.perf_counter() - started
+    rate = sessions / elapsed * 60 if elapsed else 0
+    action = "would change" if args.dry_run else "updated"
+    print(f"{sessions} sessions, {users} users, {action} {changed} users "
+          f"in {elapsed:.1f}s ({rate:,.0f} sessions/min)")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
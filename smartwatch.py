@@ -6,16 +6,11 @@ from datetime import datetime, date, timedelta
 from psycopg2.extras import DictCursor
 import json
 import logging
+from db import get_db_connection
 
 # Create Blueprint
 smartwatch_bp = Blueprint('smartwatch_bp', __name__, url_prefix='/garmin')
 
-# Import from your main app (these need to be accessible)
-# You'll need to pass these as dependencies or import from a shared module
-def get_db_connection():
-    """Import this from your main app or create shared db module"""
-    from app import get_db_connection as _get_db
-    return _get_db()
 
 # Garmin client storage (shared with main app)
 garmin_clients = {}
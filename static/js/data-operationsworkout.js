@@ -567,8 +567,11 @@ $(document).off("click", "#save-workout-btn").on("click", "#save-workout-btn", f
         }
                 $("#saveWorkoutModal").modal("hide");
                 
-                // Continue analysis for 4 seconds, then show XP or results
-                setTimeout(() => {
+                // Continue analysis for 4 seconds (and until the background
+                // XP / PR processing has finished), then show XP or results
+                const analysisShown = new Promise(resolve => setTimeout(resolve, 4000));
+                Promise.all([waitForWorkoutResult(response), analysisShown]).then(([result]) => {
+                    response = result;
                     hideWorkoutAnalysis();
                     
                     // Check if XP data exists and user gained XP
@@ -584,7 +587,7 @@ $(document).off("click", "#save-workout-btn").on("click", "#save-workout-btn", f
                         showWorkoutResults(response.comparisonData, response.achievements);
                         updateSetRowsWithProgress(response.comparisonData);
                     }
-                }, 4000);
+                });
                 
                 // Clear local storage
                 const date = currentSelectedDate;
@@ -603,6 +606,41 @@ $(document).off("click", "#save-workout-btn").on("click", "#save-workout-btn", f
     });
 });
 
+// Streak, comparisons, PRs and XP of a saved workout are computed by a
+// background job, poll its result and merge it into the save response
+function waitForWorkoutResult(response, maxAttempts = 60) {
+    return new Promise(resolve => {
+        if (!response.job) {
+            resolve(response);
+            return;
+        }
+        let attempts = 0;
+        const retry = () => {
+            attempts += 1;
+            if (attempts >= maxAttempts) {
+                resolve(response);
+            } else {
+                setTimeout(poll, 1000);
+            }
+        };
+        const poll = () => {
+            $.getJSON(response.job.result_url)
+                .done(job => {
+                    if (job.status === "done") {
+                        resolve(Object.assign({}, response, job.result));
+                    } else if (job.status === "failed") {
+                        console.error("Workout processing failed:", job.error);
+                        resolve(response);
+                    } else {
+                        retry();
+                    }
+                })
+                .fail(retry);
+        };
+        poll();
+    });
+}
+
 function navigateWeek(direction) {
     const days = direction === 'prev' ? -7 : 7
     currentDate.setDate(currentDate.getDate() + days);
@@ -284,6 +284,7 @@ const translations = {
     start_tracking_nutrition: "Start tracking your meals to see your daily nutrition history",
     no_weekly_data: "No weekly data available",
     keep_tracking_weekly: "Keep tracking your meals to see weekly nutrition trends",
+    load_older_weeks: "Load older weeks",
     date_period: "Date / Period",
     sessions: "Sessions",
     muscle_group: "Muscle Group",
@@ -314,6 +315,7 @@ const translations = {
     failed_load_exercises: "Failed to load exercises. Please try again.",
     loading_exercise_data: "Loading exercise data...",
     no_session_history: "No session history available",
+    load_older_sessions: "Load older sessions",
     never: "Never",
     personal_record: "Personal Record",
     failed_load_exercise_details: "Failed to load exercise details. Please try again."
@@ -609,6 +611,7 @@ const translations = {
     start_tracking_nutrition: "Aloita aterioiden seuraaminen nähdäksesi päivittäisen ravintohistoria",
     no_weekly_data: "Ei viikottaista dataa saatavilla",
     keep_tracking_weekly: "Jatka aterioidesi seuraamista nähdäksesi viikottaiset ravintotrendit",
+    load_older_weeks: "Lataa vanhemmat viikot",
     date_period: "Päivämäärä / Ajanjakso",
     sessions: "Harjoitukset",
     muscle_group: "Lihasryhmä",
@@ -640,6 +643,7 @@ const translations = {
     failed_load_exercises: "Liikkeiden lataus epäonnistui. Yritä uudelleen.",
     loading_exercise_data: "Ladataan liike tietoja...",
     no_session_history: "Ei sessiohistoriaa saatavilla",
+    load_older_sessions: "Lataa vanhempia sessioita",
     never: "Ei koskaan",
     personal_record: "Henkilökohtainen ennätys",
     failed_load_exercise_details: "Liikkeen tietojen lataus epäonnistui. Yritä uudelleen.",
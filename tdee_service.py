@@ -0,0 +1,176 @@
+# tdee_service.py - Daily TDEE resolution
+#
+# A user's TDEE for a day comes from one of three modes, in priority order:
+#   1. garmin_total - garmin_daily_data.calories_total (calories_total_enabled)
+#   2. dynamic      - daily_tdee_adjustments.adjusted_tdee (auto workout / steps)
+#   3. static       - users.tdee
+# The user settings and both per-day sources are read with one joined query
+# for a whole date range. Results are memoized for the current request per
+# (user, date); anything that writes the inputs (metrics, Garmin sync, saved
+# workouts) calls invalidate() so later reads in the same request see it.
+from datetime import date, datetime, timedelta
+
+from flask import g, has_request_context
+
+from db import get_db_connection
+
+_RANGE_SQL = """
+    SELECT d.day::date,
+           u.tdee, u.auto_add_workout_calories, u.auto_garmin_steps, u.calories_total_enabled,
+           gd.calories_total,
+           a.user_id IS NOT NULL, a.workout_calories, a.steps_calories, a.adjusted_tdee
+    FROM users u
+    CROSS JOIN generate_series(%s::date, %s::date, INTERVAL '1 day') AS d(day)
+    LEFT JOIN garmin_daily_data gd
+           ON gd.user_id = u.id AND gd.date = d.day::date
+    LEFT JOIN daily_tdee_adjustments a
+           ON a.user_id = u.id AND a.date = d.day::date
+    WHERE u.id = %s
+    ORDER BY d.day
+"""
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _day_tdee(base_tdee, auto_workout_enabled, auto_steps_enabled, calories_total_enabled,
+              calories_total, has_adjustment, workout_calories, steps_calories, adjusted_tdee):
+    """
+    Same dict get_user_current_tdee() has always returned. measured is True
+    when the value came from Garmin or an adjustment row rather than the base.
+    """
+    day = {
+        "base_tdee": base_tdee,
+        "workout_calories": 0,
+        "steps_calories": 0,
+        "daily_tdee": base_tdee,
+        "auto_workout_enabled": auto_workout_enabled,
+        "auto_steps_enabled": auto_steps_enabled,
+        "calories_total": None,
+        "calories_total_enabled": False,
+        "mode": "static",
+        "measured": False,
+    }
+
+    # PRIORITY 1: Garmin calories_total mode
+    if calories_total_enabled:
+        day["calories_total_enabled"] = True
+        if calories_total:
+            day.update(daily_tdee=float(calories_total), calories_total=float(calories_total),
+                       mode="garmin_total", measured=True)
+        return day
+
+    # PRIORITY 2: Dynamic adjustment mode (workout + steps)
+    if auto_workout_enabled or auto_steps_enabled:
+        if has_adjustment:
+            day.update(
+                workout_calories=float(workout_calories) if workout_calories else 0.0,
+                steps_calories=float(steps_calories) if steps_calories else 0.0,
+                daily_tdee=float(adjusted_tdee) if adjusted_tdee else base_tdee,
+                mode="dynamic",
+                measured=adjusted_tdee is not None,
+            )
+        return day
+
+    # PRIORITY 3: Static TDEE mode
+    day["auto_workout_enabled"] = False
+    day["auto_steps_enabled"] = False
+    return day
+
+
+def _no_user_day():
+    return _day_tdee(0, False, False, False, None, False, None, None, None)
+
+
+def _load_range(user_id, start, end):
+    """{date: tdee dict} for start..end inclusive, one query"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(_RANGE_SQL, (start, end, user_id))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+    if not rows:
+        days = (end - start).days + 1
+        return {start + timedelta(days=i): _no_user_day() for i in range(days)}
+
+    result = {}
+    for (day, base_tdee, auto_workout, auto_steps, calories_total_enabled, calories_total,
+         has_adjustment, workout_calories, steps_calories, adjusted_tdee) in rows:
+        result[day] = _day_tdee(
+            float(base_tdee) if base_tdee else 0.0,
+            bool(auto_workout), bool(auto_steps), bool(calories_total_enabled),
+            calories_total, has_adjustment, workout_calories, steps_calories, adjusted_tdee,
+        )
+    return result
+
+
+def _request_cache():
+    if not has_request_context():
+        return None
+    cache = g.get("_tdee_cache")
+    if cache is None:
+        cache = g._tdee_cache = {}
+    return cache
+
+
+def resolve_range(user_id, start, end):
+    """
+    TDEE for every day from start to end (inclusive), oldest first, as a list
+    of (date, tdee dict). Days already resolved in this request are reused,
+    the rest come from a single query.
+    """
+    start, end = _as_date(start), _as_date(end)
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    cache = _request_cache()
+
+    missing = days if cache is None else [day for day in days if (user_id, day) not in cache]
+    loaded = _load_range(user_id, missing[0], missing[-1]) if missing else {}
+    if cache is not None:
+        for day, value in loaded.items():
+            cache[(user_id, day)] = value
+
+    resolved = []
+    for day in days:
+        value = loaded.get(day) or cache[(user_id, day)]
+        resolved.append((day, dict(value)))
+    return resolved
+
+
+def resolve(user_id, target_date=None):
+    """TDEE dict for one day (defaults to today)"""
+    target_date = _as_date(target_date) if target_date else datetime.now().date()
+    return resolve_range(user_id, target_date, target_date)[0][1]
+
+
+def resolve_week(user_id, end_date=None):
+    """The 7 days ending at end_date (defaults to today)"""
+    end_date = _as_date(end_date) if end_date else datetime.now().date()
+    return resolve_range(user_id, end_date - timedelta(days=6), end_date)
+
+
+def average_tdee(days):
+    """
+    Average TDEE over the measured days of a resolve_range() result, falling
+    back to the base TDEE when none of them have Garmin / adjustment data.
+    """
+    measured = [value["daily_tdee"] for _, value in days if value["measured"]]
+    if measured:
+        return sum(measured) / len(measured)
+    return days[-1][1]["base_tdee"] if days else 0
+
+
+def invalidate(user_id):
+    """Forget the memoized days of a user, call after writing TDEE inputs"""
+    cache = _request_cache()
+    if cache:
+        for key in [key for key in cache if key[0] == user_id]:
+            del cache[key]
@@ -0,0 +1,151 @@
+# user_cache.py - Per-worker cache of the logged-in user identity
+#
+# Flask-Login calls load_user on every authenticated request, including the
+# AJAX calls made per keystroke. Each worker keeps the few columns User needs
+# in a bounded LRU for CACHE_TTL seconds instead of reading the users row
+# every time. A trigger on users appends the id of every user whose identity
+# columns changed (profile, metrics, role, deletion) to user_changes; workers
+# poll that log at most every CHECK_INTERVAL seconds and drop the changed
+# users, the same versioning food_catalog uses for foods.
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from db import get_db_connection
+
+# Columns load_user builds User from; changing any of them logs a change
+USER_COLUMNS = ('id', 'username', 'email', 'role', 'tdee', 'weight')
+_SELECT_USER = f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE id = %s"
+
+CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 300))
+CHECK_INTERVAL = float(os.getenv("USER_CACHE_CHECK_INTERVAL", 5))
+MAX_CACHED_USERS = 5000
+MAX_INCREMENTAL_CHANGES = 5000
+# Re-read a few already seen versions, a slower transaction can commit a
+# lower sequence value after a higher one was read
+VERSION_OVERLAP = 50
+
+
+def init_user_cache(cursor):
+    """Change log + trigger used to invalidate the worker user caches"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_changes (
+            version BIGSERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION log_user_change() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO user_changes (user_id) VALUES (OLD.id);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute('DROP TRIGGER IF EXISTS users_change_log ON users')
+    cursor.execute(f'''
+        CREATE TRIGGER users_change_log
+        AFTER UPDATE OF {', '.join(USER_COLUMNS)} OR DELETE ON users
+        FOR EACH ROW EXECUTE FUNCTION log_user_change()
+    ''')
+    # Cached entries never outlive CACHE_TTL, old entries are never needed
+    cursor.execute("DELETE FROM user_changes WHERE changed_at < NOW() - INTERVAL '1 day'")
+
+
+class UserCache:
+    """LRU of users rows (as USER_COLUMNS dicts) for one worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # user_id -> (row dict, loaded_at), least recent first
+        self.version = None          # last user_changes.version applied
+        self._seen_versions = set()  # versions inside the overlap window
+        self._checked_at = 0.0
+
+    def _apply_changes(self, cursor):
+        if self.version is None:
+            cursor.execute('SELECT COALESCE(MAX(version), 0) FROM user_changes')
+            self.version = cursor.fetchone()[0]
+            self._users.clear()
+            return
+
+        cursor.execute('''
+            SELECT version, user_id FROM user_changes
+            WHERE version > %s
+            ORDER BY version
+            LIMIT %s
+        ''', (self.version - VERSION_OVERLAP, MAX_INCREMENTAL_CHANGES))
+        changes = cursor.fetchall()
+        if len(changes) >= MAX_INCREMENTAL_CHANGES:
+            self._users.clear()
+            self.version = changes[-1][0]
+            self._seen_versions = set()
+            return
+        for version, user_id in changes:
+            if version not in self._seen_versions:
+                self._users.pop(user_id, None)
+        self._seen_versions = {version for version, _ in changes}
+        if changes:
+            self.version = max(self.version, changes[-1][0])
+
+    def _refresh(self, cursor):
+        now = time.monotonic()
+        if self.version is not None and now - self._checked_at < CHECK_INTERVAL:
+            return
+        with self._lock:
+            if self.version is not None and now - self._checked_at < CHECK_INTERVAL:
+                return
+            self._apply_changes(cursor)
+            self._checked_at = time.monotonic()
+
+    # ---- public API --------------------------------------------------------
+
+    def get(self, user_id):
+        """USER_COLUMNS dict of a user, None when the user does not exist"""
+        conn = None
+        cursor = None
+        try:
+            if self.version is None or time.monotonic() - self._checked_at >= CHECK_INTERVAL:
+                conn = get_db_connection()
+                cursor = conn.cursor()
+                self._refresh(cursor)
+
+            with self._lock:
+                entry = self._users.get(user_id)
+                if entry and time.monotonic() - entry[1] < CACHE_TTL:
+                    self._users.move_to_end(user_id)
+                    return entry[0]
+
+            if cursor is None:
+                conn = get_db_connection()
+                cursor = conn.cursor()
+            version = self.version
+            cursor.execute(_SELECT_USER, (user_id,))
+            row = cursor.fetchone()
+        finally:
+            if cursor is not None:
+                cursor.close()
+                conn.close()
+
+        if row is None:
+            return None
+        user = dict(zip(USER_COLUMNS, row))
+        with self._lock:
+            self._users.pop(user_id, None)
+            if self.version != version:
+                # Changes were applied meanwhile, the row may predate one
+                return user
+            self._users[user_id] = (user, time.monotonic())
+            while len(self._users) > MAX_CACHED_USERS:
+                self._users.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        """Drop a user right away in this worker (call after writing users)"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+user_cache = UserCache()
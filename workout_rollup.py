@@ -0,0 +1,193 @@
+# workout_rollup.py - Pre-aggregated workout totals per user and day
+#
+# workout_daily_rollup holds, for every day with saved sessions:
+#   - one row per muscle group with its saved sets, reps and volume
+#   - one whole-day row (muscle_group = '') with the day's strength totals,
+#     session count and names, strength duration / calories and cardio totals
+# workout_weekly_rollup and workout_monthly_rollup are views summing the
+# daily rows, so every history period reads the same pre-aggregated shape.
+#
+# Days are recomputed from the raw tables with refresh() whenever a saved
+# session, set or cardio entry changes; rebuild_workout_rollup.py rebuilds
+# them in bulk.
+
+DAY_ROW = ''
+
+_VIEW_PERIODS = {'weekly': 'week', 'monthly': 'month'}
+
+# Per-period sources with identical columns; workout_names is a JSON list of
+# the day rows' name lists
+SOURCES = {
+    'daily': '''(
+        SELECT user_id, date AS period_start, muscle_group, sets, reps, volume,
+               sessions, sessions_with_sets, json_build_array(workout_names) AS workout_names,
+               strength_seconds, strength_calories, cardio_sessions, cardio_minutes, cardio_calories
+        FROM workout_daily_rollup
+    )''',
+    'weekly': 'workout_weekly_rollup',
+    'monthly': 'workout_monthly_rollup',
+}
+
+
+def init_workout_rollup(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS workout_daily_rollup (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            date DATE NOT NULL,
+            muscle_group TEXT NOT NULL,  -- '' = the whole day
+            sets INTEGER NOT NULL DEFAULT 0,
+            reps INTEGER NOT NULL DEFAULT 0,
+            volume DOUBLE PRECISION NOT NULL DEFAULT 0,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            sessions_with_sets INTEGER NOT NULL DEFAULT 0,
+            workout_names TEXT[] NOT NULL DEFAULT '{}',
+            strength_seconds INTEGER NOT NULL DEFAULT 0,
+            strength_calories DOUBLE PRECISION NOT NULL DEFAULT 0,
+            cardio_sessions INTEGER NOT NULL DEFAULT 0,
+            cardio_minutes DOUBLE PRECISION NOT NULL DEFAULT 0,
+            cardio_calories DOUBLE PRECISION NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, date, muscle_group)
+        )
+    ''')
+    for period, unit in _VIEW_PERIODS.items():
+        cursor.execute(f'''
+            CREATE OR REPLACE VIEW workout_{period}_rollup AS
+            SELECT user_id,
+                   date_trunc('{unit}', date)::date AS period_start,
+                   muscle_group,
+                   SUM(sets)::int AS sets,
+                   SUM(reps)::int AS reps,
+                   SUM(volume) AS volume,
+                   SUM(sessions)::int AS sessions,
+                   SUM(sessions_with_sets)::int AS sessions_with_sets,
+                   json_agg(workout_names) AS workout_names,
+                   SUM(strength_seconds)::int AS strength_seconds,
+                   SUM(strength_calories) AS strength_calories,
+                   SUM(cardio_sessions)::int AS cardio_sessions,
+                   SUM(cardio_minutes) AS cardio_minutes,
+                   SUM(cardio_calories) AS cardio_calories
+            FROM workout_daily_rollup
+            GROUP BY user_id, date_trunc('{unit}', date), muscle_group
+        ''')
+
+    # One-off backfill when the table is introduced on an existing database
+    cursor.execute("SELECT to_regclass('workout_sets') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return
+    cursor.execute('SELECT 1 FROM workout_daily_rollup LIMIT 1')
+    if cursor.fetchone() is None:
+        cursor.execute(_REFRESH_SQL.format(where="TRUE", stale_where="FALSE"))
+        print(f"[INIT] Backfilled workout_daily_rollup ({cursor.rowcount} rows)")
+
+
+# Recompute the days of the saved sessions matching {where} (over s =
+# workout_sessions) and drop the rollup rows matching {stale_where} (over
+# r = workout_daily_rollup) that no longer have data
+_REFRESH_SQL = '''
+    WITH sessions AS (
+        SELECT s.id, s.user_id, s.date, s.name, s.workout_duration_seconds, s.weight_calories_burned
+        FROM workout_sessions s
+        WHERE s.is_saved AND {where}
+    ),
+    strength AS (
+        SELECT ss.user_id, ss.date, e.muscle_group, ss.id AS session_id, ws.reps, ws.volume
+        FROM sessions ss
+        JOIN workout_sets ws ON ws.session_id = ss.id
+        JOIN exercises e ON ws.exercise_id = e.id
+        WHERE ws.is_saved AND e.muscle_group IS NOT NULL AND e.muscle_group <> ''
+    ),
+    days AS (
+        SELECT user_id, date,
+               COUNT(*) AS sessions,
+               ARRAY_AGG(DISTINCT name) FILTER (WHERE name IS NOT NULL) AS workout_names,
+               COALESCE(SUM(workout_duration_seconds), 0) AS strength_seconds,
+               COALESCE(SUM(weight_calories_burned), 0) AS strength_calories
+        FROM sessions
+        GROUP BY user_id, date
+    ),
+    day_sets AS (
+        SELECT user_id, date,
+               COUNT(*) AS sets, SUM(reps) AS reps, SUM(volume) AS volume,
+               COUNT(DISTINCT session_id) AS sessions_with_sets
+        FROM strength
+        GROUP BY user_id, date
+    ),
+    cardio AS (
+        SELECT ss.user_id, ss.date,
+               COUNT(*) AS cardio_sessions,
+               SUM(cs.duration_minutes) AS cardio_minutes,
+               SUM(cs.calories_burned) AS cardio_calories
+        FROM sessions ss
+        JOIN cardio_sessions cs ON cs.session_id = ss.id
+        WHERE cs.is_saved
+        GROUP BY ss.user_id, ss.date
+    ),
+    fresh AS (
+        SELECT d.user_id, d.date, '' AS muscle_group,
+               COALESCE(st.sets, 0) AS sets, COALESCE(st.reps, 0) AS reps,
+               COALESCE(st.volume, 0) AS volume,
+               d.sessions, COALESCE(st.sessions_with_sets, 0) AS sessions_with_sets,
+               COALESCE(d.workout_names, '{{}}') AS workout_names,
+               d.strength_seconds, d.strength_calories,
+               COALESCE(c.cardio_sessions, 0) AS cardio_sessions,
+               COALESCE(c.cardio_minutes, 0) AS cardio_minutes,
+               COALESCE(c.cardio_calories, 0) AS cardio_calories
+        FROM days d
+        LEFT JOIN day_sets st USING (user_id, date)
+        LEFT JOIN cardio c USING (user_id, date)
+        UNION ALL
+        SELECT user_id, date, muscle_group,
+               COUNT(*), SUM(reps), SUM(volume),
+               COUNT(DISTINCT session_id), COUNT(DISTINCT session_id),
+               '{{}}', 0, 0, 0, 0, 0
+        FROM strength
+        GROUP BY user_id, date, muscle_group
+    ),
+    gone AS (
+        DELETE FROM workout_daily_rollup r
+        WHERE {stale_where}
+          AND NOT EXISTS (
+              SELECT 1 FROM fresh f
+              WHERE f.user_id = r.user_id AND f.date = r.date AND f.muscle_group = r.muscle_group
+          )
+    )
+    INSERT INTO workout_daily_rollup AS r
+        (user_id, date, muscle_group, sets, reps, volume, sessions, sessions_with_sets,
+         workout_names, strength_seconds, strength_calories,
+         cardio_sessions, cardio_minutes, cardio_calories)
+    SELECT * FROM fresh
+    ON CONFLICT (user_id, date, muscle_group) DO UPDATE SET
+        sets = EXCLUDED.sets,
+        reps = EXCLUDED.reps,
+        volume = EXCLUDED.volume,
+        sessions = EXCLUDED.sessions,
+        sessions_with_sets = EXCLUDED.sessions_with_sets,
+        workout_names = EXCLUDED.workout_names,
+        strength_seconds = EXCLUDED.strength_seconds,
+        strength_calories = EXCLUDED.strength_calories,
+        cardio_sessions = EXCLUDED.cardio_sessions,
+        cardio_minutes = EXCLUDED.cardio_minutes,
+        cardio_calories = EXCLUDED.cardio_calories,
+        updated_at = NOW()
+'''
+
+
+def refresh(cursor, user_id, dates):
+    """Recompute the user's rollup rows for the given dates"""
+    dates = [str(d) for d in dates if d]
+    if not dates:
+        return
+    cursor.execute(_REFRESH_SQL.format(
+        where="s.user_id = %s AND s.date = ANY(%s::date[])",
+        stale_where="r.user_id = %s AND r.date = ANY(%s::date[])"
+    ), (user_id, dates, user_id, dates))
+
+
+def rebuild(cursor, user_ids):
+    """Recompute every rollup row of the given users, returns the rows written"""
+    cursor.execute(_REFRESH_SQL.format(
+        where="s.user_id = ANY(%s)",
+        stale_where="r.user_id = ANY(%s)"
+    ), (list(user_ids), list(user_ids)))
+    return cursor.rowcount
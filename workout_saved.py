@@ -0,0 +1,421 @@
+# workout_saved.py - Post-processing of a saved workout
+#
+# /workout/save commits the session and queues a 'workout_saved' job; the
+# job worker then runs, in the job's transaction:
+#   - compare_sets:   per-set comparisons, PRs and improvements against the
+#                     previous session of the same focus (exercise_bests)
+#   - update_streak:  the daily workout streak
+#   - award_xp:       XP / level for the session
+# xp_already_earned is shared with /workout/save, which records the daily XP
+# limits at save time so a later save the same day cannot change them.
+#
+# Importing this module registers the handler and does not need the Flask
+# app, so job_worker.py can run jobs without starting the web process' setup.
+from datetime import datetime, timedelta
+import traceback
+
+import exercise_bests
+import jobs
+import levels
+
+# A previous day counts for the streak from this much training
+STREAK_MIN_SECONDS = 1200
+
+
+def xp_already_earned(cursor, user_id, date, session_id):
+    """
+    (strength, cardio): whether the user already has saved strength sets /
+    cardio on `date` in another session, i.e. that day's XP was earned.
+    """
+    cursor.execute("""
+        SELECT COUNT(*)
+        FROM workout_sets ws
+        JOIN workout_sessions wsess ON ws.session_id = wsess.id
+        WHERE wsess.user_id = %s
+        AND wsess.date = %s
+        AND ws.is_saved = true
+        AND wsess.id != %s
+    """, (user_id, date, session_id))
+    strength = cursor.fetchone()[0] > 0
+
+    cursor.execute("""
+        SELECT COUNT(*)
+        FROM cardio_sessions cs
+        JOIN workout_sessions wsess ON cs.session_id = wsess.id
+        WHERE wsess.user_id = %s
+        AND wsess.date = %s
+        AND cs.is_saved = true
+        AND wsess.id != %s
+    """, (user_id, date, session_id))
+    cardio = cursor.fetchone()[0] > 0
+
+    print(f"XP eligibility check - User {user_id} on {date}: "
+          f"strength saved: {strength}, cardio saved: {cardio}")
+    return strength, cardio
+
+
+def _new_set_comparisons(exercise_id, current_sets):
+    comparisons = []
+    for idx, s in enumerate(current_sets, start=1):
+        reps = int(s.get("reps") or 0)
+        weight = float(s.get("weight") or 0.0)
+        current_volume = reps * weight
+        comparisons.append({
+            "setId": f"{exercise_id}-{idx}",
+            "exerciseId": exercise_id,
+            "currentReps": reps,
+            "currentWeight": weight,
+            "currentVolume": current_volume,
+            "previousReps": 0,
+            "previousWeight": 0.0,
+            "previousVolume": 0.0,
+            "volumeChange": current_volume,
+            "noPrevious": True,
+            "isNew": True
+        })
+    return comparisons
+
+
+def _previous_session_totals(cursor, user_id, focus_type, name, session_id):
+    """(volume, sets) of the previous saved session, same name preferred"""
+    cursor.execute("""
+        SELECT ws.id
+        FROM workout_sessions ws
+        WHERE ws.user_id = %s
+        AND ws.focus_type = %s
+        AND ws.name = %s
+        AND ws.id != %s
+        AND ws.is_saved = true
+        ORDER BY ws.date DESC
+        LIMIT 1
+    """, (user_id, focus_type, name, session_id))
+    last_session_result = cursor.fetchone()
+
+    if not last_session_result:
+        cursor.execute("""
+            SELECT ws.id
+            FROM workout_sessions ws
+            WHERE ws.user_id = %s
+            AND ws.focus_type = %s
+            AND ws.id != %s
+            AND ws.is_saved = true
+            ORDER BY ws.date DESC
+            LIMIT 1
+        """, (user_id, focus_type, session_id))
+        last_session_result = cursor.fetchone()
+
+    if not last_session_result:
+        return 0.0, 0
+
+    cursor.execute("""
+        SELECT COALESCE(SUM(reps * weight), 0), COUNT(*)
+        FROM workout_sets
+        WHERE session_id = %s AND is_saved = true
+    """, (last_session_result[0],))
+    volume, sets = cursor.fetchone()
+    return float(volume or 0.0), int(sets or 0)
+
+
+def compare_sets(cursor, user_id, session_id, focus_type, name, exercises):
+    """
+    Compare a saved session with the previous one of the same focus and
+    record it in exercise_bests. Returns (comparisonData, achievements).
+    """
+    cursor.execute("""
+        SELECT id, exercise_id, reps, weight
+        FROM workout_sets
+        WHERE session_id = %s AND is_saved = true
+    """, (session_id,))
+    saved_sets_rows = cursor.fetchall()
+
+    set_comparisons = []
+    personal_records = []
+    improvements = []
+    new_exercises_count = 0
+    total_sets = 0
+    current_total_volume = 0
+    volume_improvements = 0
+    sets_improvements = 0
+
+    # Organize saved sets by exercise
+    saved_sets_by_exercise = {}
+    for set_id, exercise_id, reps, weight in saved_sets_rows:
+        saved_sets_by_exercise.setdefault(exercise_id, []).append({
+            "reps": int(reps),
+            "weight": float(weight)
+        })
+
+    # Names and the previous session's stats for every exercise in one read
+    exercise_bests_by_id = exercise_bests.load_for_session(
+        cursor, user_id, focus_type, session_id, saved_sets_by_exercise.keys()
+    )
+
+    for exercise_id, current_sets in saved_sets_by_exercise.items():
+        bests = exercise_bests_by_id.get(exercise_id, {})
+
+        # Exercise name from the posted exercises, else from the database
+        exercise_name = "Unknown Exercise"
+        for ex in exercises:
+            ex_id = ex.get("id") or ex.get("exercise_id") or ex.get("exerciseId")
+            if ex_id == exercise_id:
+                exercise_name = ex.get("name") or ex.get("exercise_name") or ex.get("exerciseName") or "Unknown Exercise"
+                break
+        if exercise_name == "Unknown Exercise" and bests.get("name"):
+            exercise_name = bests["name"]
+
+        # Most recent SAVED session for this exercise and focus type (excluding current session)
+        previous = bests.get("previous")
+
+        total_sets += len(current_sets)
+        if not current_sets:
+            continue
+        heaviest_set = max(current_sets, key=lambda s: s["weight"])
+        best_set = max(current_sets, key=lambda s: s["reps"] * s["weight"])
+        total_volume_ex = sum(s["reps"] * s["weight"] for s in current_sets)
+        current_total_volume += total_volume_ex
+
+        if not previous or not previous["last_set_count"]:
+            # First time doing this exercise in this focus type
+            new_exercises_count += 1
+            set_comparisons.extend(_new_set_comparisons(exercise_id, current_sets))
+            continue
+
+        # Last SAVED set and saved-set stats of the previous session for this exercise
+        last_reps, last_weight = int(previous["last_reps"] or 0), float(previous["last_weight"] or 0.0)
+        last_set_count, last_total_volume_ex = int(previous["last_set_count"]), float(previous["last_volume"] or 0.0)
+        last_volume = last_reps * last_weight
+
+        # PRs
+        if (best_set["reps"] * best_set["weight"]) > last_volume and last_volume > 0:
+            personal_records.append({
+                "exercise": exercise_name,
+                "type": "bestSet",
+                "weight": best_set["weight"],
+                "reps": best_set["reps"],
+                "previousBest": {"weight": last_weight, "reps": last_reps}
+            })
+        if heaviest_set["weight"] > last_weight and last_weight > 0:
+            personal_records.append({
+                "exercise": exercise_name,
+                "type": "heaviestWeight",
+                "weight": heaviest_set["weight"],
+                "reps": None,
+                "previousBest": {"weight": last_weight, "reps": last_reps}
+            })
+
+        # Per-set comparisons
+        for idx, s in enumerate(current_sets, start=1):
+            reps = int(s.get("reps") or 0)
+            weight = float(s.get("weight") or 0.0)
+            current_volume = reps * weight
+            set_comparisons.append({
+                "setId": f"{exercise_id}-{idx}",
+                "exerciseId": exercise_id,
+                "currentReps": reps,
+                "currentWeight": weight,
+                "currentVolume": current_volume,
+                "previousReps": last_reps,
+                "previousWeight": last_weight,
+                "previousVolume": last_volume,
+                "volumeChange": current_volume - last_volume,
+                "noPrevious": False,
+                "isNew": False
+            })
+
+        # Improvements
+        if total_volume_ex > last_total_volume_ex:
+            volume_improvements += 1
+            improvements.append({
+                "exercise": exercise_name,
+                "type": "volume",
+                "volumeChange": total_volume_ex - last_total_volume_ex
+            })
+        if len(current_sets) > last_set_count:
+            sets_improvements += 1
+            improvements.append({
+                "exercise": exercise_name,
+                "type": "sets",
+                "setsChange": len(current_sets) - last_set_count
+            })
+
+    last_total_volume, last_total_sets = _previous_session_totals(
+        cursor, user_id, focus_type, name, session_id
+    )
+    volume_change_percent = ((current_total_volume - last_total_volume) / last_total_volume * 100.0) if last_total_volume else 0.0
+
+    # This session is now the latest for its exercises
+    exercise_bests.record_session(cursor, session_id)
+
+    comparison = {
+        "setComparisons": set_comparisons,
+        "totalSets": int(total_sets),
+        "setsChange": int(total_sets - last_total_sets),
+        "totalVolume": float(current_total_volume),
+        "volumeChange": float(round(volume_change_percent, 2))
+    }
+    achievements = {
+        "personalRecords": personal_records,
+        "improvements": improvements,
+        "newExercises": int(new_exercises_count),
+        "volumeImprovements": int(volume_improvements),
+        "setsImprovements": int(sets_improvements)
+    }
+    return comparison, achievements
+
+
+def update_streak(cursor, user_id, date):
+    """
+    Advance (or restart) the workout streak for a save on `date`, at most once
+    per day. Returns {'current', 'previous', 'awarded'}; a failure leaves the
+    streak as it was without aborting the caller's transaction.
+    """
+    streak_awarded = False
+    current_streak = 0
+    previous_streak = 0
+
+    cursor.execute("SAVEPOINT workout_streak")
+    try:
+        cursor.execute("""
+            SELECT workout_streak, last_streak_date
+            FROM users
+            WHERE id = %s
+        """, (user_id,))
+        streak_data = cursor.fetchone()
+
+        if streak_data:
+            previous_streak = int(streak_data[0] or 0)
+            last_streak_date = streak_data[1]
+            current_streak = previous_streak
+
+            # Only award streak if we haven't already awarded one for today
+            if last_streak_date != date:
+                cursor.execute("""
+                    SELECT COALESCE(SUM(total_duration_seconds), 0) as total_duration
+                    FROM workout_sessions
+                    WHERE user_id = %s
+                    AND date = %s
+                    AND is_saved = true
+                """, (user_id, date - timedelta(days=1)))
+                yesterday_total_seconds = int(cursor.fetchone()[0] or 0)
+
+                # Continue if yesterday had 20+ minutes or this is the first workout,
+                # otherwise start over from 1
+                if yesterday_total_seconds >= STREAK_MIN_SECONDS or previous_streak == 0:
+                    current_streak = previous_streak + 1
+                    print(f"Streak awarded! User {user_id}: {previous_streak} -> {current_streak}")
+                else:
+                    current_streak = 1
+                    print(f"Streak reset! User {user_id}: {previous_streak} -> 1 (missed yesterday)")
+                streak_awarded = True
+
+                cursor.execute("""
+                    UPDATE users
+                    SET workout_streak = %s,
+                        last_streak_date = %s
+                    WHERE id = %s
+                """, (current_streak, date, user_id))
+            else:
+                print(f"Streak already awarded today for user {user_id}")
+
+    except Exception as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT workout_streak")
+        current_streak, streak_awarded = previous_streak, False
+        print(f"Error calculating workout streak: {e}")
+        traceback.print_exc()
+
+    return {
+        "current": int(current_streak),
+        "previous": int(previous_streak),
+        "awarded": bool(streak_awarded)
+    }
+
+
+def award_xp(cursor, user_id, current_streak, strength_earned_today, cardio_earned_today,
+             cardio_duration, cardio_calories, workout_duration_seconds,
+             total_volume, new_exercises, personal_bests):
+    """
+    Add the session's XP to the user, strength / cardio XP only for the day's
+    first save of that kind. Returns the 'xp' part of the job result.
+    """
+    strength = not strength_earned_today
+    cardio = not cardio_earned_today
+    xp_sources = {
+        'cardio_duration': float(cardio_duration) * levels.XP_PER_CARDIO_SECOND
+        if cardio and cardio_duration > 0 else 0.0,
+        'cardio_calories': float(cardio_calories) * levels.XP_PER_CARDIO_CALORIE
+        if cardio and cardio_calories > 0 else 0.0,
+        'weights_volume': float(total_volume) * levels.XP_PER_VOLUME
+        if strength and total_volume > 0 else 0.0,
+        'workout_duration': float(workout_duration_seconds) * levels.XP_PER_WORKOUT_SECOND
+        if strength and workout_duration_seconds > 0 else 0.0,
+        'new_exercises': int(new_exercises) * levels.XP_PER_NEW_EXERCISE if strength else 0.0,
+        'personal_bests': float(personal_bests) * levels.XP_PER_PERSONAL_BEST if strength else 0.0,
+    }
+    if strength_earned_today:
+        print("Strength XP NOT awarded - already saved strength today")
+    if cardio_earned_today:
+        print("Cardio XP NOT awarded - already saved cardio today")
+
+    base_xp_gain = sum(xp_sources.values())
+    streak_multiplier = levels.calculate_streak_xp_multiplier(current_streak)
+    xp_gain = int(round(base_xp_gain * streak_multiplier))
+    print(f"Base XP gain: {base_xp_gain}, Streak: {current_streak}, "
+          f"Multiplier: {streak_multiplier}x, Final XP: {xp_gain}")
+
+    cursor.execute("SELECT COALESCE(xp_points,0), COALESCE(level,1) FROM users WHERE id = %s", (user_id,))
+    row = cursor.fetchone()
+    current_xp = int(row[0] or 0)
+    current_level = levels.clamp_level(int(row[1] or 1))
+
+    level_cursor, pool, new_levels = levels.add_xp(current_level, current_xp, xp_gain)
+    cursor.execute(
+        "UPDATE users SET xp_points = %s, level = %s WHERE id = %s",
+        (int(pool), int(level_cursor), user_id)
+    )
+
+    return {
+        "gained": int(xp_gain),
+        "sources": {source: int(round(xp)) for source, xp in xp_sources.items()},
+        "levels_gained": int(new_levels),
+        "level_before": int(current_level),
+        "level_after": int(level_cursor),
+        "current_xp": int(pool),
+        "xp_to_next_level": int(levels.xp_to_next_level(level_cursor)),
+        "streak_multiplier": float(streak_multiplier),
+        "daily_limits": {
+            "strength_already_earned_today": bool(strength_earned_today),
+            "cardio_already_earned_today": bool(cardio_earned_today)
+        }
+    }
+
+
+@jobs.handler('workout_saved')
+def process_saved_workout(cursor, user_id, payload):
+    """
+    Post-processing of /workout/save, run by a job worker: set comparisons and
+    PRs, exercise bests, workout streak and XP / level. Runs in the job's
+    transaction, the returned dict is what /workout/save/result serves.
+    """
+    session_id = payload["session_id"]
+    date = datetime.strptime(payload["date"], "%Y-%m-%d").date()
+
+    # One job per user at a time, streak and XP are read-modify-write
+    cursor.execute("SELECT id FROM users WHERE id = %s FOR UPDATE", (user_id,))
+
+    comparison, achievements = compare_sets(
+        cursor, user_id, session_id, payload["focus_type"], payload["name"], payload["exercises"]
+    )
+    streak = update_streak(cursor, user_id, date)
+    xp = award_xp(
+        cursor, user_id, streak["current"],
+        payload["existing_strength_saved_today"], payload["existing_cardio_saved_today"],
+        payload["cardio_duration"], payload["cardio_calories"], payload["workout_duration_seconds"],
+        comparison["totalVolume"], achievements["newExercises"], len(achievements["personalRecords"])
+    )
+
+    return {
+        "streak": streak,
+        "comparisonData": comparison,
+        "achievements": achievements,
+        "xp": xp
+    }
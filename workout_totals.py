@@ -0,0 +1,192 @@
+# workout_totals.py - Daily / weekly / monthly totals for /workout/history
+#
+# Reads one page of periods (newest first) from the workout rollup (see
+# workout_rollup.py): the whole-period row and the per-muscle rows of each
+# period. The cost follows the page size rather than the length of the
+# user's history. Pages are walked with `before`: the start of the oldest
+# period shown.
+#
+# Also holds the muscle group detail query of a single period.
+from datetime import datetime, timedelta
+
+import workout_rollup
+
+PAGE_SIZES = {'daily': 31, 'weekly': 12, 'monthly': 6}
+MAX_PAGE_SIZE = 366
+
+_HISTORY_SQL = '''
+    WITH periods AS (
+        SELECT period_start
+        FROM {source} r
+        WHERE r.user_id = %(user_id)s AND r.muscle_group = ''
+          AND (%(before)s::date IS NULL OR r.period_start < %(before)s::date)
+          {period_filter}
+        ORDER BY period_start DESC
+        LIMIT %(limit)s + 1
+    ),
+    page AS (
+        SELECT period_start FROM periods ORDER BY period_start DESC LIMIT %(limit)s
+    )
+    SELECT r.*, (SELECT COUNT(*) FROM periods) > %(limit)s AS has_more
+    FROM {source} r
+    JOIN page p USING (period_start)
+    WHERE r.user_id = %(user_id)s
+    ORDER BY r.period_start DESC, r.muscle_group
+'''
+
+
+def format_duration(total_seconds):
+    """Convert seconds to human readable format like '1h 23m' or '45m' or '2h'"""
+    if not total_seconds or total_seconds <= 0:
+        return "0m"
+    
+    hours = int(total_seconds // 3600)
+    minutes = int((total_seconds % 3600) // 60)
+    
+    if hours > 0 and minutes > 0:
+        return f"{hours}h {minutes}m"
+    elif hours > 0:
+        return f"{hours}h"
+    elif minutes > 0:
+        return f"{minutes}m"
+    else:
+        return "< 1m"
+
+
+def _names_display(names, fallback):
+    if not names:
+        return fallback
+    display = ', '.join(names[:2])
+    if len(names) > 2:
+        display += f' +{len(names) - 2} lisää'
+    return display
+
+
+def load_history(cursor, user_id, period, before=None, limit=None):
+    """
+    (history, next_before) for one page of `period` ('daily', 'weekly' or
+    'monthly') in the format /workout/history has always returned.
+    next_before is the `before` of the following page, None on the last one.
+    """
+    limit = PAGE_SIZES[period] if limit is None else limit
+    # Weekly and monthly pages only list periods that have saved strength sets
+    period_filter = '' if period == 'daily' else 'AND r.sets > 0'
+    cursor.execute(_HISTORY_SQL.format(source=workout_rollup.SOURCES[period], period_filter=period_filter), {
+        'user_id': user_id, 'before': before, 'limit': limit
+    })
+    rows = cursor.fetchall()
+
+    history, has_more = [], False
+    for row in rows:
+        has_more = row['has_more']
+        if row['muscle_group'] != workout_rollup.DAY_ROW:
+            history[-1]['muscles'][row['muscle_group']] = {
+                'total_sets': row['sets'],
+                'total_reps': row['reps'],
+                'total_volume': float(row['volume'])
+            }
+            continue
+
+        total_duration_seconds = int(float(row['cardio_minutes']) * 60 + float(row['strength_seconds']))
+        names = sorted({name for day_names in row['workout_names'] or [] for name in day_names or []})
+        entry = {
+            'duration_seconds': total_duration_seconds,
+            'duration_formatted': format_duration(total_duration_seconds),
+            'calories_burned': float(row['cardio_calories']) + float(row['strength_calories']),
+            'total_sets': row['sets'],
+            'total_reps': row['reps'],
+            'total_volume': float(row['volume']),
+            'muscles': {}
+        }
+        if period == 'daily':
+            entry['date'] = row['period_start']
+            entry['workout_name'] = _names_display(names, 'Unnamed Workout')
+            entry['sessions_count'] = row['sessions']
+        else:
+            entry['workout_names'] = names
+            entry['workout_names_display'] = _names_display(names, 'Various Workouts')
+            entry['sessions_count'] = row['sessions_with_sets']
+            entry['week_start' if period == 'weekly' else 'month_start'] = row['period_start']
+        history.append(entry)
+
+    next_before = None
+    if has_more and rows:
+        next_before = rows[-1]['period_start'].strftime('%Y-%m-%d')
+    return history, next_before
+
+
+# Saved sets of one canonical muscle group in [start, end), served by
+# idx_workout_sessions_user_date, idx_workout_sets_session_exercise and
+# idx_exercises_muscle_group_id (see check_query_plans.py)
+MUSCLE_SETS_SQL = '''
+    SELECT e.id AS exercise_id, e.name AS exercise_name,
+           ws.reps, ws.weight, ws.volume, ws.id, s.date
+    FROM workout_sessions s
+    JOIN workout_sets ws ON s.id = ws.session_id
+    JOIN exercises e ON ws.exercise_id = e.id
+    WHERE s.user_id = %(user_id)s
+      AND s.date >= %(start)s::date AND s.date < %(end)s::date
+      AND e.muscle_group_id = %(muscle_group_id)s
+      AND ws.is_saved = TRUE
+    ORDER BY e.name, s.date DESC, ws.id
+'''
+
+# Heaviest weight and best set volume before each (exercise, date)
+_PREVIOUS_BESTS_SQL = '''
+    SELECT p.exercise_id, p.date,
+           MAX(prev.weight) AS max_weight,
+           MAX(prev.reps * prev.weight) AS max_volume
+    FROM unnest(%s::int[], %s::date[]) AS p(exercise_id, date)
+    LEFT JOIN LATERAL (
+        SELECT ws.reps, ws.weight
+        FROM workout_sessions s
+        JOIN workout_sets ws ON ws.session_id = s.id
+        WHERE s.user_id = %s
+          AND s.date < p.date
+          AND ws.exercise_id = p.exercise_id
+          AND ws.is_saved = TRUE
+    ) prev ON TRUE
+    GROUP BY p.exercise_id, p.date
+'''
+
+
+def period_bounds(period, date_filter=None, week_start=None, month_start=None):
+    """[start, end) dates of a history period from its request args, or None"""
+    try:
+        if period == 'daily' and date_filter:
+            start = datetime.strptime(date_filter, '%Y-%m-%d').date()
+            return start, start + timedelta(days=1)
+        if period == 'weekly' and week_start:
+            start = datetime.strptime(week_start, '%Y-%m-%d').date()
+            return start, start + timedelta(days=7)
+        if period == 'monthly' and month_start:
+            start = datetime.strptime(month_start, '%Y-%m-%d').date().replace(day=1)
+            end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+            return start, end
+    except ValueError:
+        return None
+    return None
+
+
+def load_muscle_sets(cursor, user_id, muscle_group_id, start, end):
+    """
+    Saved sets of a muscle group in [start, end) with 'prev_max_weight' and
+    'prev_max_volume': the user's bests for the exercise before the set's day
+    """
+    cursor.execute(MUSCLE_SETS_SQL, {
+        'user_id': user_id, 'start': start, 'end': end, 'muscle_group_id': muscle_group_id
+    })
+    rows = [dict(row) for row in cursor.fetchall()]
+    if not rows:
+        return rows
+
+    pairs = sorted({(row['exercise_id'], row['date']) for row in rows})
+    cursor.execute(_PREVIOUS_BESTS_SQL, (
+        [exercise_id for exercise_id, _ in pairs], [day for _, day in pairs], user_id
+    ))
+    previous = {(row[0], row[1]): (row[2], row[3]) for row in cursor.fetchall()}
+    for row in rows:
+        max_weight, max_volume = previous.get((row['exercise_id'], row['date']), (None, None))
+        row['prev_max_weight'] = float(max_weight or 0)
+        row['prev_max_volume'] = float(max_volume or 0)
+    return rows
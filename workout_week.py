@@ -0,0 +1,160 @@
+# workout_week.py - Week overview for /workout/get_current_week
+#
+# The whole week is assembled from two queries no matter how many sessions,
+# sets or exercises it has:
+#   1. the week's sessions with their sets and cardio aggregated as JSON
+#   2. one LATERAL lookup of the previous session (same focus_type) for every
+#      (session, exercise) pair in the week
+from datetime import datetime
+
+_WEEK_SESSIONS_SQL = """
+    SELECT ws.id, ws.date, ws.focus_type, ws.name,
+           COALESCE((
+               SELECT json_agg(json_build_object(
+                          'exercise_id', wset.exercise_id,
+                          'reps', wset.reps,
+                          'weight', wset.weight,
+                          'name', ex.name,
+                          'muscle_group', ex.muscle_group
+                      ) ORDER BY wset.id)
+               FROM workout_sets wset
+               JOIN exercises ex ON ex.id = wset.exercise_id
+               WHERE wset.session_id = ws.id
+           ), '[]'::json) AS sets,
+           COALESCE((
+               SELECT json_agg(json_build_object(
+                          'id', cs.id,
+                          'duration_minutes', cs.duration_minutes,
+                          'distance_km', cs.distance_km,
+                          'avg_pace_min_per_km', cs.avg_pace_min_per_km,
+                          'avg_heart_rate', cs.avg_heart_rate,
+                          'watts', cs.watts,
+                          'calories_burned', cs.calories_burned,
+                          'notes', cs.notes,
+                          'exercise_name', ce.name,
+                          'exercise_type', ce.type,
+                          'met_value', ce.met_value,
+                          'created_at', cs.created_at
+                      ))
+               FROM cardio_sessions cs
+               JOIN cardio_exercises ce ON cs.cardio_exercise_id = ce.id
+               WHERE cs.session_id = ws.id
+           ), '[]'::json) AS cardio
+    FROM workout_sessions ws
+    WHERE ws.user_id = %s AND ws.date BETWEEN %s AND %s
+    ORDER BY ws.date, ws.id
+"""
+
+_PREVIOUS_SESSIONS_SQL = """
+    SELECT pair.session_id, pair.exercise_id, prev.date, prev.reps, prev.weight
+    FROM unnest(%s::int[], %s::int[], %s::text[]) AS pair(session_id, exercise_id, focus_type)
+    CROSS JOIN LATERAL (
+        SELECT ws.date, wset.reps, wset.weight
+        FROM workout_sessions ws
+        JOIN workout_sets wset ON wset.session_id = ws.id
+        WHERE ws.user_id = %s
+          AND ws.focus_type = pair.focus_type
+          AND wset.exercise_id = pair.exercise_id
+          AND ws.id != pair.session_id
+        ORDER BY ws.date DESC, ws.id DESC, wset.id
+        LIMIT 1
+    ) prev
+"""
+
+
+def _cardio_entry(row):
+    return {
+        'id': row['id'],
+        'exercise_name': row['exercise_name'],
+        'exercise_type': row['exercise_type'],
+        'met_value': float(row['met_value']),
+        'duration_minutes': float(row['duration_minutes']),
+        'distance_km': float(row['distance_km']) if row['distance_km'] else None,
+        'avg_pace_min_per_km': float(row['avg_pace_min_per_km']) if row['avg_pace_min_per_km'] else None,
+        'avg_heart_rate': row['avg_heart_rate'],
+        'watts': row['watts'],
+        'calories_burned': float(row['calories_burned']),
+        'notes': row['notes']
+    }
+
+
+def _comparison(ex_data, last):
+    current_sets = ex_data["sets"]
+    if last:
+        last_date, last_reps, last_weight = last
+        return {
+            "name": ex_data["name"],
+            "lastDate": last_date.isoformat() if isinstance(last_date, datetime) else last_date,
+            "currentSets": current_sets,
+            "lastReps": last_reps,
+            "lastWeight": last_weight,
+            "lastVolume": last_reps * last_weight
+        }
+    return {
+        "name": ex_data["name"],
+        "lastDate": None,
+        "currentSets": current_sets,
+        "lastReps": 0,
+        "lastWeight": 0,
+        "lastVolume": 0
+    }
+
+
+def load_week(cursor, user_id, week_dates):
+    """
+    {date_str: [session dict, ...]} for the given consecutive 'YYYY-MM-DD'
+    dates, in the format get_current_week has always returned. Every session
+    lists all of its day's cardio, newest first.
+    """
+    cursor.execute(_WEEK_SESSIONS_SQL, (user_id, week_dates[0], week_dates[-1]))
+    sessions = cursor.fetchall()
+
+    day_cardio = {}
+    for session_id, day, focus_type, name, sets, cardio in sessions:
+        day_cardio.setdefault(day.strftime("%Y-%m-%d"), []).extend(cardio)
+    for date_str, rows in day_cardio.items():
+        rows.sort(key=lambda row: (row['created_at'] or '', row['id']), reverse=True)
+        day_cardio[date_str] = [_cardio_entry(row) for row in rows]
+
+    # Group each session's sets by exercise, then fetch all comparisons at once
+    session_exercises = []
+    pairs = ([], [], [])
+    for session_id, day, focus_type, name, sets, cardio in sessions:
+        exercises_data = {}
+        for s in sets:
+            ex_id = s['exercise_id']
+            if ex_id not in exercises_data:
+                exercises_data[ex_id] = {
+                    "id": ex_id,
+                    "name": s['name'],
+                    "muscle_group": s['muscle_group'],
+                    "sets": []
+                }
+            exercises_data[ex_id]["sets"].append({"reps": s['reps'], "weight": s['weight']})
+        session_exercises.append(exercises_data)
+        for ex_id in exercises_data:
+            pairs[0].append(session_id)
+            pairs[1].append(ex_id)
+            pairs[2].append(focus_type)
+
+    previous = {}
+    if pairs[0]:
+        cursor.execute(_PREVIOUS_SESSIONS_SQL, pairs + (user_id,))
+        for session_id, ex_id, last_date, last_reps, last_weight in cursor.fetchall():
+            previous[(session_id, ex_id)] = (last_date, last_reps, last_weight)
+
+    week_data = {date_str: [] for date_str in week_dates}
+    for (session_id, day, focus_type, name, sets, cardio), exercises_data in zip(sessions, session_exercises):
+        date_str = day.strftime("%Y-%m-%d")
+        week_data[date_str].append({
+            "sessionId": session_id,
+            "focus_type": focus_type,
+            "name": name,
+            "exercises": list(exercises_data.values()),
+            "cardio_sessions": day_cardio.get(date_str, []),
+            "comparisonData": [
+                _comparison(ex_data, previous.get((session_id, ex_id)))
+                for ex_id, ex_data in exercises_data.items()
+            ]
+        })
+    return week_data